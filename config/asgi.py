@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+El stream de tarjetas pendientes (SSE) solo se sirve con ASGI, p. ej.
+``uvicorn config.asgi:application``; con WSGI la página consulta periódicamente.
 """
 
 import os
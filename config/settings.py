@@ -82,10 +82,42 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Ajustes de SQLite para concurrencia, aplicados al abrir cada conexión (init_command).
+# WAL permite leer mientras otro escribe; busy_timeout espera al bloqueo en vez de
+# fallar con "database is locked"; IMMEDIATE toma el bloqueo de escritura al empezar
+# la transacción, así la espera ocurre ahí y no al pasar de lectura a escritura.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': os.getenv('SQLITE_BUSY_TIMEOUT', '5000'),  # milisegundos
+    'cache_size': os.getenv('SQLITE_CACHE_SIZE', '-20000'),  # negativo: KiB (20 MB)
+    'mmap_size': os.getenv('SQLITE_MMAP_SIZE', '134217728'),  # bytes (128 MB)
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {pragma}={valor}' for pragma, valor in SQLITE_PRAGMAS.items()),
+            'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+    }
+}
+
+
+# Caché de estadísticas por usuario (pronóstico y pendientes). Se invalida al
+# escribir, así que tiene que ser compartida por todos los procesos web: por
+# defecto, en disco (FileBasedCache); Redis o Memcached con CACHE_BACKEND.
+# LocMemCache es por proceso y solo sirve con un único proceso (check flashcards.W001).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000')),
+        },
     }
 }
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Card, ReviewLog, Subscription, UserSettings
+from .models import Card, ResumenDiario, ReviewLog, Subscription, TrabajoNotificacion, UserSettings, UserCardStats
+from .search import buscar_tarjetas
 
 
 @admin.register(UserSettings)
@@ -8,6 +9,12 @@ class UserSettingsAdmin(admin.ModelAdmin):
     list_filter = ['ultima_fecha_reset']
 
 
+@admin.register(UserCardStats)
+class UserCardStatsAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'total_tarjetas', 'fase_1', 'fase_2', 'fase_3', 'nuevas', 'aprendizaje', 'consolidacion', 'maduras']
+    readonly_fields = ['total_tarjetas', 'fase_1', 'fase_2', 'fase_3', 'nuevas', 'aprendizaje', 'consolidacion', 'maduras']
+
+
 @admin.register(Card)
 class CardAdmin(admin.ModelAdmin):
     list_display = ['frente_corto', 'usuario', 'estado', 'fase', 'siguiente_repeticion', 'contador_aciertos', 'contador_fallos']
@@ -18,6 +25,15 @@ class CardAdmin(admin.ModelAdmin):
     def frente_corto(self, obj):
         return obj.frente[:50] + '...' if len(obj.frente) > 50 else obj.frente
     frente_corto.short_description = 'Pregunta'
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Busca con el índice FTS5; si no se ordena por una columna, por relevancia"""
+        if not search_term:
+            return queryset, False
+        queryset = buscar_tarjetas(queryset, search_term)
+        if 'o' not in request.GET:
+            queryset = queryset.order_by('rango', '-id')
+        return queryset, False
 
 
 @admin.register(ReviewLog)
@@ -27,6 +43,13 @@ class ReviewLogAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha']
 
 
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = ['card', 'dia', 'repasos', 'calificacion_media', 'tiempo_medio', 'promociones', 'retrocesos']
+    list_filter = ['dia']
+    raw_id_fields = ['card']
+
+
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ['usuario', 'fecha_creacion', 'endpoint_corto']
@@ -36,3 +59,10 @@ class SubscriptionAdmin(admin.ModelAdmin):
     def endpoint_corto(self, obj):
         return obj.endpoint[:50] + '...'
     endpoint_corto.short_description = 'Endpoint'
+
+
+@admin.register(TrabajoNotificacion)
+class TrabajoNotificacionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'estado', 'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'latido', 'intentos']
+    list_filter = ['estado', 'tipo']
+    readonly_fields = ['fecha_creacion', 'fecha_inicio', 'fecha_fin', 'latido', 'intentos', 'resultado']
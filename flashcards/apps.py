@@ -7,3 +7,4 @@ class FlashcardsConfig(AppConfig):
     
     def ready(self):
         import flashcards.signals
+        import flashcards.checks
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def cache_compartida(app_configs, **kwargs):
+    """
+    Los pendientes y el pronóstico cacheados se invalidan al escribir, en la
+    caché del proceso que escribe: con LocMemCache los demás procesos web
+    seguirían sirviendo datos viejos hasta que caduquen (hasta una hora).
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('LocMemCache') and not settings.DEBUG:
+        return [Warning(
+            'La caché por defecto es LocMemCache: con varios procesos web, las invalidaciones '
+            'no llegan a los demás y los contadores de pendientes quedan desactualizados.',
+            hint='Usa un backend compartido (FileBasedCache, DatabaseCache, Redis) o un único proceso.',
+            id='flashcards.W001',
+        )]
+    return []
@@ -0,0 +1,59 @@
+"""
+Aviso en proceso de cambios en las tarjetas de un usuario para los streams SSE.
+
+Cada stream abierto registra una EscuchaCambios de su usuario; cuando una
+escritura invalida la caché del usuario (al hacer commit), avisar_cambio
+despierta a sus streams desde el hilo que sea. Solo llega a los streams del
+mismo proceso; los de otros procesos vuelven a leer el estado al enviar el
+siguiente keepalive (KEEPALIVE_STREAM) y, como la invalidación borra la
+entrada de la caché compartida, ven el cambio como mucho con ese retraso.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+
+_escuchas = defaultdict(set)
+_cerrojo = threading.Lock()
+
+
+def avisar_cambio(usuario_id):
+    """Despierta a los streams abiertos del usuario (se puede llamar desde cualquier hilo)"""
+    with _cerrojo:
+        escuchas = list(_escuchas.get(usuario_id, ()))
+    for escucha in escuchas:
+        escucha.loop.call_soon_threadsafe(escucha.evento.set)
+
+
+class EscuchaCambios:
+    """
+    Registro de un stream mientras está abierto. Se registra antes de la primera
+    lectura para no perder avisos que lleguen mientras el stream está enviando.
+    """
+
+    def __init__(self, usuario_id):
+        self.usuario_id = usuario_id
+        self.loop = asyncio.get_running_loop()
+        self.evento = asyncio.Event()
+
+    def __enter__(self):
+        with _cerrojo:
+            _escuchas[self.usuario_id].add(self)
+        return self
+
+    def __exit__(self, *exc):
+        with _cerrojo:
+            escuchas = _escuchas[self.usuario_id]
+            escuchas.discard(self)
+            if not escuchas:
+                del _escuchas[self.usuario_id]
+
+    async def esperar(self, timeout):
+        """Espera un aviso como mucho 'timeout' segundos; True si llegó un aviso"""
+        try:
+            await asyncio.wait_for(self.evento.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.evento.clear()
@@ -0,0 +1,129 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from flashcards.models import ResumenDiario, ReviewLog
+
+
+COLUMNAS = [
+    'id', 'card_id', 'fecha', 'calificacion_base', 'tiempo_respuesta',
+    'calificacion_ajustada', 'fase_antes', 'fase_despues',
+]
+CAMPOS_SUMA = [
+    'repasos', 'suma_calificacion_base', 'suma_calificacion_ajustada',
+    'suma_tiempo_respuesta', 'promociones', 'retrocesos',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Archiva los ReviewLog antiguos: los resume por tarjeta y día en ResumenDiario, '
+        'los guarda en un JSONL comprimido y los borra de la tabla'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help='Archivar los registros con más de estos días')
+        parser.add_argument('--lote', type=int, default=5000, help='Registros por lote (una transacción por lote)')
+        parser.add_argument('--directorio', default=Path(settings.BASE_DIR) / 'archivo', help='Directorio de los archivos')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar lo que se archivaría')
+
+    def handle(self, *args, **options):
+        # Se corta al principio del día local para no partir días entre dos ejecuciones
+        corte = timezone.localtime(timezone.now() - timedelta(days=options['dias'])).replace(
+            hour=0, minute=0, second=0, microsecond=0,
+        )
+        antiguos = ReviewLog.objects.filter(fecha__lt=corte)
+
+        if options['dry_run']:
+            self.stdout.write(f'🔎 Se archivarían {antiguos.count()} registro(s) anteriores a {corte:%Y-%m-%d}')
+            return
+
+        if not antiguos.exists():
+            self.stdout.write(self.style.SUCCESS(f'✅ No hay registros anteriores a {corte:%Y-%m-%d}'))
+            return
+
+        directorio = Path(options['directorio'])
+        directorio.mkdir(parents=True, exist_ok=True)
+        ruta = directorio / f'repasos_{corte:%Y%m%d}_{timezone.now():%Y%m%d_%H%M%S}.jsonl.gz'
+
+        self.stdout.write(f'📦 Archivando registros anteriores a {corte:%Y-%m-%d} en {ruta.name}...')
+        inicio = time.perf_counter()
+        archivados = 0
+        resumenes = 0
+        ultimo_id = 0
+
+        with gzip.open(ruta, 'wt', encoding='utf-8') as archivo:
+            while True:
+                filas = list(
+                    antiguos.filter(id__gt=ultimo_id).order_by('id').values_list(*COLUMNAS)[:options['lote']]
+                )
+                if not filas:
+                    break
+
+                # Primero el archivo: si algo falla después, los registros siguen en la tabla
+                for fila in filas:
+                    registro = dict(zip(COLUMNAS, fila))
+                    registro['fecha'] = registro['fecha'].isoformat()
+                    archivo.write(json.dumps(registro) + '\n')
+                archivo.flush()
+
+                with transaction.atomic():
+                    resumenes += self.acumular(filas)
+                    # Los id son crecientes: el rango con fecha < corte es exactamente el lote leído
+                    antiguos.filter(id__gte=filas[0][0], id__lte=filas[-1][0]).delete()
+
+                archivados += len(filas)
+                ultimo_id = filas[-1][0]
+                self.stdout.write(f'   {archivados} registro(s)...')
+
+        duracion = time.perf_counter() - inicio
+        size_mb = ruta.stat().st_size / (1024 * 1024)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {archivados} registro(s) archivado(s) en {resumenes} resumen(es) diario(s) '
+            f'({size_mb:.2f} MB) en {duracion:.2f} s ({archivados / max(duracion, 1e-9):.0f}/s)'
+        ))
+
+    def acumular(self, filas):
+        """
+        Suma un lote de registros a ResumenDiario (día local de cada respuesta).
+        Los resúmenes ya existentes se acumulan, no se reemplazan.
+        Devuelve cuántos resúmenes se crearon o actualizaron.
+        """
+        sumas = {}
+        for _, card_id, fecha, base, tiempo, ajustada, fase_antes, fase_despues in filas:
+            clave = (card_id, timezone.localtime(fecha).date())
+            suma = sumas.setdefault(clave, dict.fromkeys(CAMPOS_SUMA, 0))
+            suma['repasos'] += 1
+            suma['suma_calificacion_base'] += base
+            suma['suma_calificacion_ajustada'] += ajustada
+            suma['suma_tiempo_respuesta'] += tiempo
+            suma['promociones'] += fase_despues > fase_antes
+            suma['retrocesos'] += fase_despues < fase_antes
+
+        existentes = ResumenDiario.objects.filter(
+            card_id__in={card_id for card_id, _ in sumas},
+            dia__in={dia for _, dia in sumas},
+        )
+        modificados = []
+        for resumen in existentes:
+            suma = sumas.pop((resumen.card_id, resumen.dia), None)
+            if suma is None:
+                continue
+            for campo, valor in suma.items():
+                setattr(resumen, campo, getattr(resumen, campo) + valor)
+            modificados.append(resumen)
+
+        nuevos = [
+            ResumenDiario(card_id=card_id, dia=dia, **suma)
+            for (card_id, dia), suma in sumas.items()
+        ]
+        ResumenDiario.objects.bulk_create(nuevos, batch_size=1000)
+        ResumenDiario.objects.bulk_update(modificados, CAMPOS_SUMA, batch_size=1000)
+        return len(nuevos) + len(modificados)
@@ -1,49 +1,166 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import connection
+import argparse
+import gzip
 import shutil
+import sqlite3
+import time
 from pathlib import Path
 from datetime import datetime
 
 
+# Tamaño de los bloques al comprimir
+BLOQUE = 1024 * 1024
+EXTENSIONES = {
+    'ninguno': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def entero_positivo(valor):
+    """Tipo de argparse: entero mayor que 0"""
+    try:
+        numero = int(valor)
+    except ValueError:
+        numero = 0
+    if numero <= 0:
+        raise argparse.ArgumentTypeError(f'debe ser un entero positivo: {valor!r}')
+    return numero
+
+
 class Command(BaseCommand):
-    help = 'Crea un backup de la base de datos SQLite'
-    
+    help = (
+        'Crea un backup de la base de datos SQLite con la API de backup en línea: '
+        'copia por bloques de páginas, cediendo entre bloques para no bloquear a los escritores'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=entero_positivo, default=1024, help='Páginas copiadas en cada paso')
+        parser.add_argument('--pausa', type=float, default=0.005, help='Segundos de pausa entre pasos')
+        parser.add_argument('--comprimir', choices=list(EXTENSIONES), default='ninguno', help='Compresión del backup')
+        parser.add_argument('--conservar', type=entero_positivo, default=7, help='Backups que se conservan al rotar')
+        parser.add_argument('--directorio', default=Path(settings.BASE_DIR) / 'backups', help='Directorio de los backups')
+
     def handle(self, *args, **options):
-        # Ruta de la base de datos
-        db_path = settings.DATABASES['default']['NAME']
-        
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.ERROR('❌ backup_db solo funciona con SQLite'))
+            return
+        for opcion in ('paginas', 'conservar'):
+            # call_command(...) con argumentos con nombre no pasa por el tipo de argparse
+            if options[opcion] <= 0:
+                self.stdout.write(self.style.ERROR(f'❌ --{opcion} debe ser un entero positivo'))
+                return
+        if connection.in_atomic_block:
+            # Con una transacción abierta la copia no avanzaría nunca
+            self.stdout.write(self.style.ERROR('❌ backup_db no puede ejecutarse dentro de una transacción'))
+            return
+
         # Crear directorio de backups
-        backup_dir = Path(settings.BASE_DIR) / 'backups'
-        backup_dir.mkdir(exist_ok=True)
-        
+        backup_dir = Path(options['directorio'])
+        backup_dir.mkdir(parents=True, exist_ok=True)
+
         # Nombre del backup con fecha
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_name = f'db_backup_{timestamp}.sqlite3'
+        copia_path = backup_dir / f'db_backup_{timestamp}.sqlite3.tmp'
+        backup_name = f'db_backup_{timestamp}.sqlite3{EXTENSIONES[options["comprimir"]]}'
         backup_path = backup_dir / backup_name
-        
+
         try:
-            # Copiar base de datos
-            shutil.copy2(db_path, backup_path)
-            
+            paginas, duracion = self.copiar(copia_path, options['paginas'], options['pausa'])
+            size_mb = copia_path.stat().st_size / (1024 * 1024)
+            self.stdout.write(
+                f'📄 {paginas} página(s) copiada(s) ({size_mb:.2f} MB) en {duracion:.2f} s '
+                f'({size_mb / max(duracion, 1e-9):.1f} MB/s)'
+            )
+
+            resultado = self.verificar(copia_path)
+            if resultado != 'ok':
+                self.stdout.write(self.style.ERROR(f'❌ El backup no pasa integrity_check: {resultado}'))
+                return
+
+            if options['comprimir'] == 'ninguno':
+                copia_path.rename(backup_path)
+            else:
+                inicio = time.perf_counter()
+                self.comprimir(copia_path, backup_path, options['comprimir'])
+                duracion = time.perf_counter() - inicio
+                self.stdout.write(
+                    f'🗜️ Comprimido con {options["comprimir"]} en {duracion:.2f} s '
+                    f'({size_mb / max(duracion, 1e-9):.1f} MB/s)'
+                )
+
             # Obtener tamaño
             size_mb = backup_path.stat().st_size / (1024 * 1024)
-            
+
             self.stdout.write(
                 self.style.SUCCESS(
                     f'✅ Backup creado exitosamente: {backup_name} ({size_mb:.2f} MB)'
                 )
             )
-            
-            # Limpiar backups antiguos (mantener solo los últimos 7)
-            backups = sorted(backup_dir.glob('db_backup_*.sqlite3'))
-            if len(backups) > 7:
-                for old_backup in backups[:-7]:
+
+            # Limpiar backups antiguos (mantener solo los últimos 'conservar'), con o sin compresión
+            backups = sorted(
+                ruta for ruta in backup_dir.glob('db_backup_*.sqlite3*') if ruta.suffix != '.tmp'
+            )
+            if len(backups) > options['conservar']:
+                for old_backup in backups[:-options['conservar']]:
                     old_backup.unlink()
                     self.stdout.write(
                         self.style.WARNING(f'🗑️ Backup antiguo eliminado: {old_backup.name}')
                     )
-            
+
         except Exception as e:
+            backup_path.unlink(missing_ok=True)
             self.stdout.write(
                 self.style.ERROR(f'❌ Error creando backup: {e}')
             )
+        finally:
+            copia_path.unlink(missing_ok=True)
+
+    def copiar(self, destino, paginas, pausa):
+        """
+        Copia la base de datos con sqlite3.Connection.backup, 'paginas' páginas por
+        paso. Entre pasos se libera el bloqueo de lectura y se duerme 'pausa'
+        segundos, así los escritores pueden avanzar. Devuelve (páginas, segundos).
+        """
+        connection.ensure_connection()
+        total = 0
+
+        def progreso(status, restantes, paginas_totales):
+            nonlocal total
+            total = paginas_totales
+            if restantes and pausa:
+                time.sleep(pausa)
+
+        inicio = time.perf_counter()
+        copia = sqlite3.connect(destino)
+        try:
+            connection.connection.backup(copia, pages=paginas, progress=progreso, sleep=pausa)
+        finally:
+            copia.close()
+        return total, time.perf_counter() - inicio
+
+    def verificar(self, ruta):
+        """Resultado de PRAGMA integrity_check sobre el backup ('ok' si está sano)"""
+        copia = sqlite3.connect(ruta)
+        try:
+            filas = copia.execute('PRAGMA integrity_check').fetchall()
+        finally:
+            copia.close()
+        return '; '.join(fila[0] for fila in filas)
+
+    def comprimir(self, origen, destino, formato):
+        """Comprime el backup por bloques, sin cargarlo entero en memoria"""
+        if formato == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError('la compresión zstd necesita el paquete zstandard (pip install zstandard)')
+            with open(origen, 'rb') as entrada, open(destino, 'wb') as salida:
+                with zstandard.ZstdCompressor().stream_writer(salida) as comprimido:
+                    shutil.copyfileobj(entrada, comprimido, BLOQUE)
+        else:
+            with open(origen, 'rb') as entrada, gzip.open(destino, 'wb') as comprimido:
+                shutil.copyfileobj(entrada, comprimido, BLOQUE)
@@ -0,0 +1,157 @@
+import json
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from flashcards.models import Card
+from flashcards.utils import get_next_card
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide repasos por segundo con varios hilos escribiendo a la vez (un usuario por hilo). '
+        'Para comparar configuraciones, ejecutarlo con otras variables SQLITE_*, '
+        'p. ej. SQLITE_JOURNAL_MODE=DELETE SQLITE_TRANSACTION_MODE=DEFERRED'
+    )
+
+    PREFIJO = 'bench_concurrencia_'
+    PRAGMAS = ['journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos que envían respuestas a la vez')
+        parser.add_argument('--repasos', type=int, default=200, help='Respuestas por hilo')
+        parser.add_argument('--tarjetas', type=int, default=1000, help='Tarjetas vencidas por usuario de prueba')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--conservar', action='store_true', help='No borrar los usuarios de prueba al terminar')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.mostrar_configuracion()
+
+        usuarios = self.sembrar_usuarios(options['hilos'], options['tarjetas'])
+        clientes = []
+        for usuario in usuarios:
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(usuario)
+            clientes.append((client, get_next_card(usuario)))
+
+        resultados = [None] * len(clientes)
+        salida = threading.Barrier(len(clientes) + 1)
+        hilos = [
+            threading.Thread(
+                target=self.repasar,
+                args=(client, tarjeta, options['repasos'], random.Random(options['seed'] + i), salida, resultados, i),
+            )
+            for i, (client, tarjeta) in enumerate(clientes)
+        ]
+
+        try:
+            for hilo in hilos:
+                hilo.start()
+            self.stdout.write(f'🏁 {len(hilos)} hilo(s) x {options["repasos"]} repaso(s)...')
+            salida.wait()
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.join()
+            duracion = time.perf_counter() - inicio
+        finally:
+            if not options['conservar']:
+                User.objects.filter(username__startswith=self.PREFIJO).delete()
+
+        self.reportar(resultados, duracion)
+
+    def mostrar_configuracion(self):
+        with connection.cursor() as cursor:
+            valores = []
+            for pragma in self.PRAGMAS:
+                cursor.execute(f'PRAGMA {pragma}')
+                valores.append(f'{pragma}={cursor.fetchone()[0]}')
+        modo = connection.settings_dict['OPTIONS'].get('transaction_mode') or 'DEFERRED'
+        self.stdout.write(f'⚙️ {", ".join(valores)}, transaction_mode={modo}')
+
+    def sembrar_usuarios(self, num_usuarios, num_tarjetas):
+        User.objects.filter(username__startswith=self.PREFIJO).delete()
+        self.stdout.write(f'🌱 Sembrando {num_usuarios} usuario(s) con {num_tarjetas} tarjetas vencidas...')
+        ahora = timezone.now()
+        usuarios = []
+        for i in range(num_usuarios):
+            usuario = User.objects.create_user(f'{self.PREFIJO}{i}', password='bench')
+            Card.objects.bulk_create([
+                Card(
+                    usuario=usuario,
+                    frente=f'Pregunta {j}',
+                    reverso=f'Respuesta {j}',
+                    estado='aprendizaje',
+                    siguiente_repeticion=ahora - timedelta(minutes=random.uniform(1, 600)),
+                )
+                for j in range(num_tarjetas)
+            ], batch_size=5000)
+            usuarios.append(usuario)
+        return usuarios
+
+    def repasar(self, client, tarjeta, repasos, aleatorio, salida, resultados, indice):
+        """Encadena respuestas de un usuario; cuenta las que fallan por bloqueo de la base de datos"""
+        url = reverse('procesar_respuesta')
+        card_id = tarjeta.id if tarjeta else None
+        tiempos = []
+        bloqueos = 0
+        errores = 0
+        salida.wait()
+        try:
+            for _ in range(repasos):
+                if card_id is None:
+                    break
+                payload = json.dumps({
+                    'card_id': card_id,
+                    'calificacion_base': aleatorio.randint(0, 5),
+                    'tiempo_respuesta': aleatorio.uniform(1, 8),
+                })
+                inicio = time.perf_counter()
+                try:
+                    response = client.post(url, payload, content_type='application/json')
+                except OperationalError as e:
+                    # Bloqueos fuera de la vista (sesión, autenticación)
+                    if 'locked' not in str(e):
+                        raise
+                    bloqueos += 1
+                    continue
+                datos = response.json()
+                if response.status_code == 200:
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                elif 'locked' in datos.get('error', ''):
+                    bloqueos += 1
+                else:
+                    errores += 1
+                card_id = datos.get('siguiente_tarjeta', card_id)
+        finally:
+            # Cada hilo abre su propia conexión; cerrarla al terminar
+            connections.close_all()
+        resultados[indice] = (tiempos, bloqueos, errores)
+
+    def reportar(self, resultados, duracion):
+        tiempos = [t for tiempos_hilo, _, _ in resultados for t in tiempos_hilo]
+        bloqueos = sum(b for _, b, _ in resultados)
+        errores = sum(e for _, _, e in resultados)
+
+        self.stdout.write('\n' + '=' * 60)
+        if tiempos:
+            ordenados = sorted(tiempos)
+            p95 = ordenados[int(len(ordenados) * 0.95) - 1]
+            self.stdout.write(
+                f'{len(tiempos)} repasos en {duracion:.2f} s | '
+                f'media {statistics.mean(tiempos):.2f} ms | '
+                f'p50 {statistics.median(tiempos):.2f} ms | p95 {p95:.2f} ms'
+            )
+            self.stdout.write(self.style.SUCCESS(f'⚡ {len(tiempos) / duracion:.0f} repasos/s'))
+        estilo = self.style.ERROR if bloqueos else self.style.SUCCESS
+        self.stdout.write(estilo(f'🔒 {bloqueos} respuesta(s) con "database is locked", {errores} con otros errores'))
+        self.stdout.write('=' * 60 + '\n')
@@ -0,0 +1,118 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from flashcards.models import Card
+from flashcards.utils import get_next_card
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de procesar_respuesta sobre un usuario con muchas tarjetas, '
+        'con y sin el índice de la cola de repaso'
+    )
+
+    USERNAME = 'bench_repaso'
+    INDICE = 'card_cola_repaso_idx'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tarjetas', type=int, default=100000, help='Tarjetas a sembrar para el usuario de prueba')
+        parser.add_argument('--repeticiones', type=int, default=200, help='Respuestas a medir en cada escenario')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--conservar', action='store_true', help='No borrar el usuario de prueba al terminar')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+
+        usuario = self.sembrar_usuario(options['tarjetas'])
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(usuario)
+
+        try:
+            # Sin índice: se elimina dentro de una transacción que luego se revierte,
+            # así ambos escenarios parten exactamente del mismo estado
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(self.INDICE)}')
+                antes = self.medir(client, usuario, options['repeticiones'])
+                transaction.set_rollback(True)
+
+            despues = self.medir(client, usuario, options['repeticiones'])
+        finally:
+            if not options['conservar']:
+                usuario.delete()
+
+        self.stdout.write('\n' + '=' * 60)
+        self.reportar('Sin índice', antes)
+        self.reportar('Con índice', despues)
+        if despues and antes:
+            mejora = statistics.mean(antes) / statistics.mean(despues)
+            self.stdout.write(self.style.SUCCESS(f'⚡ Mejora media: x{mejora:.1f}'))
+        self.stdout.write('=' * 60 + '\n')
+
+    def sembrar_usuario(self, num_tarjetas):
+        User.objects.filter(username=self.USERNAME).delete()
+        usuario = User.objects.create_user(self.USERNAME, password='bench')
+
+        self.stdout.write(f'🌱 Sembrando {num_tarjetas} tarjetas para {self.USERNAME}...')
+        ahora = timezone.now()
+        estados = [('aprendizaje', 1), ('consolidacion', 2), ('maduro', 3)]
+        lote = []
+        for i in range(num_tarjetas):
+            estado, fase = random.choice(estados)
+            lote.append(Card(
+                usuario=usuario,
+                frente=f'Pregunta {i}',
+                reverso=f'Respuesta {i}',
+                estado=estado,
+                fase=fase,
+                siguiente_repeticion=ahora + timedelta(days=random.uniform(-30, 60)),
+            ))
+            if len(lote) == 5000:
+                Card.objects.bulk_create(lote)
+                lote = []
+        Card.objects.bulk_create(lote)
+        return usuario
+
+    def medir(self, client, usuario, repeticiones):
+        """Encadena respuestas como lo haría una sesión de repaso y mide cada POST"""
+        url = reverse('procesar_respuesta')
+        siguiente = get_next_card(usuario)
+        card_id = siguiente.id if siguiente else None
+        tiempos = []
+
+        for _ in range(repeticiones):
+            if card_id is None:
+                break
+            payload = json.dumps({
+                'card_id': card_id,
+                'calificacion_base': random.randint(0, 5),
+                'tiempo_respuesta': random.uniform(1, 8),
+            })
+            inicio = time.perf_counter()
+            response = client.post(url, payload, content_type='application/json')
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            card_id = response.json().get('siguiente_tarjeta')
+
+        return tiempos
+
+    def reportar(self, nombre, tiempos):
+        if not tiempos:
+            self.stdout.write(self.style.WARNING(f'{nombre}: sin tarjetas pendientes que medir'))
+            return
+        ordenados = sorted(tiempos)
+        p95 = ordenados[int(len(ordenados) * 0.95) - 1]
+        self.stdout.write(
+            f'{nombre}: {len(tiempos)} respuestas | '
+            f'media {statistics.mean(tiempos):.2f} ms | '
+            f'p50 {statistics.median(tiempos):.2f} ms | p95 {p95:.2f} ms'
+        )
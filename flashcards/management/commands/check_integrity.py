@@ -1,84 +1,120 @@
+import time
+from contextlib import contextmanager
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from flashcards.models import Card, UserSettings
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from flashcards.models import Card, ReviewLog, UserSettings
+from flashcards.stats import invalidar_cache_usuarios, recalcular_contadores
 from django.utils import timezone
 
 
+# Fase que corresponde a cada estado y estado que corresponde a cada fase
+# (en Fase 1 también es válido 'nuevo')
+FASE_DE_ESTADO = Case(
+    When(estado='consolidacion', then=Value(2)),
+    When(estado='maduro', then=Value(3)),
+    default=Value(1),
+    output_field=IntegerField(),
+)
+ESTADO_DE_FASE = Case(
+    When(fase=2, then=Value('consolidacion')),
+    When(fase=3, then=Value('maduro')),
+    default=Value('aprendizaje'),
+)
+ESTADO_FASE_INCONSISTENTE = (
+    (Q(fase=1) & ~Q(estado__in=['nuevo', 'aprendizaje']))
+    | (Q(fase=2) & ~Q(estado='consolidacion'))
+    | (Q(fase=3) & ~Q(estado='maduro'))
+)
+
+# Comprobaciones sobre tarjetas: (clave, condición, es_error, descripción, reparación).
+# Se cuentan todas con una sola consulta agregada y cada reparación es un único UPDATE,
+# en este orden (la fase se corrige antes de comparar estado y fase).
+COMPROBACIONES_TARJETAS = [
+    ('intervalos', Q(intervalo_actual__lt=0), True, 'con intervalos negativos', lambda: {'intervalo_actual': 5.0}),
+    ('ef', Q(EF__lt=1.3), False, 'con EF < 1.3', lambda: {'EF': 1.3}),
+    ('sin_fecha', Q(siguiente_repeticion__isnull=True), True, 'sin siguiente_repeticion', lambda: {'siguiente_repeticion': timezone.now()}),
+    ('fase_invalida', ~Q(fase__in=[1, 2, 3]), True, 'con fase inválida', lambda: {'fase': FASE_DE_ESTADO}),
+    ('estado_fase', ESTADO_FASE_INCONSISTENTE, True, 'con estado inválido o inconsistente con su fase', lambda: {'estado': ESTADO_DE_FASE}),
+]
+
+
 class Command(BaseCommand):
     help = 'Verifica la integridad de los datos'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo informar de los problemas, sin corregirlos')
+
     def handle(self, *args, **options):
-        self.stdout.write('🔍 Verificando integridad de datos...\n')
-        
+        self.dry_run = options['dry_run']
+        self.stdout.write('🔍 Verificando integridad de datos...' + (' (dry-run)' if self.dry_run else '') + '\n')
+
         errores = 0
         warnings = 0
-        
+
         # Verificar usuarios sin settings
-        usuarios_sin_settings = User.objects.filter(settings__isnull=True)
-        if usuarios_sin_settings.exists():
-            errores += 1
-            self.stdout.write(
-                self.style.ERROR(
-                    f'❌ {usuarios_sin_settings.count()} usuario(s) sin UserSettings'
-                )
-            )
-            for user in usuarios_sin_settings:
-                UserSettings.objects.create(usuario=user)
-                self.stdout.write(f'   ✅ UserSettings creado para {user.username}')
-        
-        # Verificar tarjetas con intervalos negativos
-        tarjetas_invalidas = Card.objects.filter(intervalo_actual__lt=0)
-        if tarjetas_invalidas.exists():
-            errores += 1
-            self.stdout.write(
-                self.style.ERROR(
-                    f'❌ {tarjetas_invalidas.count()} tarjeta(s) con intervalos negativos'
-                )
-            )
-            for card in tarjetas_invalidas:
-                card.intervalo_actual = 5.0
-                card.save()
-                self.stdout.write(f'   ✅ Tarjeta {card.id} corregida')
-        
-        # Verificar tarjetas con EF inválido
-        tarjetas_ef_invalido = Card.objects.filter(EF__lt=1.3)
-        if tarjetas_ef_invalido.exists():
-            warnings += 1
-            self.stdout.write(
-                self.style.WARNING(
-                    f'⚠️  {tarjetas_ef_invalido.count()} tarjeta(s) con EF < 1.3'
-                )
-            )
-            for card in tarjetas_ef_invalido:
-                card.EF = 1.3
-                card.save()
-                self.stdout.write(f'   ✅ Tarjeta {card.id} corregida (EF = 1.3)')
-        
-        # Verificar tarjetas sin siguiente_repeticion
-        tarjetas_sin_fecha = Card.objects.filter(siguiente_repeticion__isnull=True)
-        if tarjetas_sin_fecha.exists():
-            errores += 1
-            self.stdout.write(
-                self.style.ERROR(
-                    f'❌ {tarjetas_sin_fecha.count()} tarjeta(s) sin siguiente_repeticion'
-                )
-            )
-            for card in tarjetas_sin_fecha:
-                card.siguiente_repeticion = timezone.now()
-                card.save()
-                self.stdout.write(f'   ✅ Tarjeta {card.id} corregida')
-        
-        # Verificar estados inconsistentes
-        estados_validos = ['nuevo', 'aprendizaje', 'consolidacion', 'maduro']
-        tarjetas_estado_invalido = Card.objects.exclude(estado__in=estados_validos)
-        if tarjetas_estado_invalido.exists():
-            errores += 1
-            self.stdout.write(
-                self.style.ERROR(
-                    f'❌ {tarjetas_estado_invalido.count()} tarjeta(s) con estado inválido'
+        with self.cronometro('Usuarios sin UserSettings'):
+            sin_settings = list(User.objects.filter(settings__isnull=True).values_list('id', flat=True))
+            if sin_settings:
+                errores += 1
+                self.stdout.write(self.style.ERROR(f'❌ {len(sin_settings)} usuario(s) sin UserSettings'))
+                if not self.dry_run:
+                    UserSettings.objects.bulk_create(
+                        [UserSettings(usuario_id=usuario_id) for usuario_id in sin_settings], batch_size=1000,
+                    )
+                self.reparado(len(sin_settings), 'UserSettings creado(s)')
+
+        # Verificar tarjetas: todas las comprobaciones en un solo recorrido de la tabla
+        with self.cronometro('Conteo de tarjetas'):
+            conteos = Card.objects.aggregate(**{
+                clave: Count('id', filter=condicion)
+                for clave, condicion, _, _, _ in COMPROBACIONES_TARJETAS
+            })
+
+        for clave, condicion, es_error, descripcion, reparacion in COMPROBACIONES_TARJETAS:
+            if not conteos[clave]:
+                continue
+            if es_error:
+                errores += 1
+                self.stdout.write(self.style.ERROR(f'❌ {conteos[clave]} tarjeta(s) {descripcion}'))
+            else:
+                warnings += 1
+                self.stdout.write(self.style.WARNING(f'⚠️  {conteos[clave]} tarjeta(s) {descripcion}'))
+            with self.cronometro('Reparación'):
+                corregidas = conteos[clave]
+                if not self.dry_run:
+                    # Las reparaciones cambian fechas y fases: el pronóstico y los pendientes cacheados caducan
+                    afectados = list(
+                        Card.objects.filter(condicion).order_by().values_list('usuario_id', flat=True).distinct()
+                    )
+                    corregidas = Card.objects.filter(condicion).update(**reparacion())
+                    invalidar_cache_usuarios(afectados)
+                self.reparado(corregidas, 'tarjeta(s) corregida(s)')
+
+        # Verificar historial de tarjetas que ya no existen
+        with self.cronometro('Registros huérfanos'):
+            huerfanos = ReviewLog.objects.exclude(card_id__in=Card.objects.values('id'))
+            total = huerfanos.count()
+            if total:
+                errores += 1
+                self.stdout.write(self.style.ERROR(f'❌ {total} registro(s) de revisión de tarjetas inexistentes'))
+                if not self.dry_run:
+                    total, _ = huerfanos.delete()
+                self.reparado(total, 'registro(s) eliminado(s)')
+
+        # Verificar contadores denormalizados (UserCardStats)
+        with self.cronometro('Contadores de tarjetas'):
+            contadores_corregidos = recalcular_contadores(guardar=not self.dry_run)
+            if contadores_corregidos:
+                warnings += 1
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'⚠️  {contadores_corregidos} usuario(s) con contadores de tarjetas desactualizados'
+                    )
                 )
-            )
-        
+                self.reparado(contadores_corregidos, 'contador(es) recalculado(s)')
+
         # Resumen
         self.stdout.write('\n' + '='*60)
         if errores == 0 and warnings == 0:
@@ -91,4 +127,19 @@ class Command(BaseCommand):
                     f'⚠️  Se encontraron {errores} error(es) y {warnings} advertencia(s)'
                 )
             )
+            if self.dry_run:
+                self.stdout.write('   (dry-run: no se modificó nada)')
         self.stdout.write('='*60 + '\n')
+
+    def reparado(self, total, descripcion):
+        if self.dry_run:
+            self.stdout.write(f'   🔎 Se corregirían: {total} {descripcion}')
+        else:
+            self.stdout.write(f'   ✅ {total} {descripcion}')
+
+    @contextmanager
+    def cronometro(self, nombre):
+        """Escribe cuánto tardó el bloque"""
+        inicio = time.perf_counter()
+        yield
+        self.stdout.write(f'   ⏱️ {nombre}: {time.perf_counter() - inicio:.3f} s')
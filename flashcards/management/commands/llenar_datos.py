@@ -1,149 +1,244 @@
 import random
+import time
 from datetime import timedelta
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.db import connection, transaction
 from django.utils import timezone
 from faker import Faker
 
-# Ajusta esta importación al nombre real de tu app
-# Por ejemplo: from rufingo.models import UserSettings, Card, ReviewLog, Subscription
-from flashcards.models import UserSettings, Card, ReviewLog, Subscription
+from flashcards.models import UserSettings, Card, ResumenDiario, ReviewLog, Subscription
+from flashcards.scheduler import INTERVALOS_FASE_1, INTERVALOS_FASE_2, ajustar_calificacion_por_tiempo
+from flashcards.stats import invalidar_cache_usuarios, recalcular_contadores
 
 
 class Command(BaseCommand):
-    help = 'Llena la base de datos con datos de prueba (usuarios, settings, tarjetas y logs).'
-    
-    # Número de elementos a crear
-    NUM_USERS = 5
-    CARDS_PER_USER = 30
-    REVIEWS_PER_CARD = 3 # Máximo de logs por tarjeta
+    help = (
+        'Llena la base de datos con datos de prueba (usuarios, settings, tarjetas, logs y '
+        'suscripciones) usando bulk_create por lotes; sirve para sembrar millones de filas.'
+    )
+
+    PREFIJO = 'test_user_'
+    # Textos distintos que genera Faker; las tarjetas los reutilizan al azar
+    TEXTOS_FAKER = 1000
+    # Estado coherente con cada fase (las tarjetas nuevas también están en Fase 1)
+    ESTADOS_FASE = [('nuevo', 1), ('aprendizaje', 1), ('consolidacion', 2), ('maduro', 3)]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=5, help='Usuarios de prueba a crear')
+        parser.add_argument('--tarjetas', type=int, default=30, help='Tarjetas por usuario')
+        parser.add_argument('--repasos', type=int, default=3, help='Máximo de ReviewLog por tarjeta')
+        parser.add_argument('--seed', type=int, default=None, help='Semilla para obtener siempre los mismos datos')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por cada bulk_create')
 
     def handle(self, *args, **options):
-        # Inicializar Faker y configurar timezone
+        random.seed(options['seed'])
         fake = Faker('es_ES')
-        self.stdout.write(self.style.NOTICE(f"Iniciando la creación de {self.NUM_USERS} usuarios de prueba..."))
-
-        # ----------------------------------------
-        # 1. Crear Usuarios y UserSettings
-        # ----------------------------------------
-        
-        # Eliminar datos existentes para empezar limpio (opcional, pero útil para pruebas)
-        User.objects.filter(username__startswith='test_user_').delete()
-
-        users = []
-        for i in range(1, self.NUM_USERS + 1):
-            username = f'test_user_{i}'
-            email = f'user{i}@example.com'
-            user, created = User.objects.get_or_create(
-                username=username, 
-                defaults={'email': email, 'is_staff': False, 'is_superuser': False}
-            )
-            user.set_password('12345') # Contraseña simple para pruebas
-            user.save()
-            users.append(user)
-
-            # Crear UserSettings
-            UserSettings.objects.get_or_create(
-                usuario=user,
-                defaults={
-                    'max_tarjetas_nuevas_diarias': random.randint(5, 20),
-                    'tarjetas_nuevas_hoy': random.randint(0, 5),
-                    'ultima_fecha_reset': timezone.now().date() - timedelta(days=random.randint(0, 3)),
-                }
-            )
-
-        self.stdout.write(self.style.SUCCESS(f'✅ {len(users)} Usuarios y UserSettings creados/actualizados.'))
-        
-        # ----------------------------------------
-        # 2. Crear Tarjetas (Card)
-        # ----------------------------------------
-        
-        all_cards = []
-        estado_choices = [c[0] for c in Card.ESTADO_CHOICES]
-        
-        for user in users:
-            for _ in range(self.CARDS_PER_USER):
-                # Generar una fecha de próxima repetición en el pasado o futuro cercano
-                siguiente_rep = timezone.now() + timedelta(days=random.uniform(-5, 7))
-                
-                # Asignar estado aleatorio
-                estado = random.choice(estado_choices)
-                
-                # Simular EF y Intervalo
-                ef = random.uniform(1.3, 2.5)
-                intervalo = random.uniform(0.1, 90.0) # Días
-                
-                card = Card.objects.create(
+        fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        inicio = time.perf_counter()
+
+        self.stdout.write(self.style.NOTICE(
+            f"Iniciando la creación de {options['usuarios']} usuarios de prueba "
+            f"({options['tarjetas']} tarjetas por usuario)..."
+        ))
+
+        borrados = self.limpiar()
+        users = self.crear_usuarios(options['usuarios'])
+        num_cards, num_logs = self.crear_tarjetas(fake, users, options['tarjetas'], options['repasos'])
+        num_subs = self.crear_suscripciones(fake, users)
+
+        # bulk_create no dispara señales: los contadores se calculan al final
+        # y los datos cacheados de los usuarios se descartan
+        recalcular_contadores()
+        invalidar_cache_usuarios(borrados + [user.id for user in users])
+
+        duracion = time.perf_counter() - inicio
+        filas = len(users) + num_cards + num_logs + num_subs
+        self.stdout.write(self.style.SUCCESS(
+            f'\n🎉 ¡Proceso de llenado de datos finalizado con éxito! '
+            f'{filas} filas en {duracion:.1f} s ({filas / duracion:.0f} filas/s)'
+        ))
+
+    def limpiar(self):
+        """
+        Elimina los datos de una ejecución anterior, de las tablas hijas a los
+        usuarios. Devuelve los ids de los usuarios eliminados.
+        """
+        usuarios = User.objects.filter(username__startswith=self.PREFIJO)
+        ids = list(usuarios.values_list('id', flat=True))
+        # Borrar primero los logs y las tarjetas evita que el borrado en cascada
+        # cargue en memoria millones de filas
+        ReviewLog.objects.filter(card__usuario__in=usuarios).delete()
+        ResumenDiario.objects.filter(card__usuario__in=usuarios).delete()
+        Card.objects.filter(usuario__in=usuarios).only('id').delete()
+        usuarios.delete()
+        return ids
+
+    def crear_usuarios(self, num_usuarios):
+        # Un solo hash para todos: calcular la contraseña es lo más lento de crear un usuario
+        password = make_password('12345')  # Contraseña simple para pruebas
+        users = User.objects.bulk_create(
+            [
+                User(username=f'{self.PREFIJO}{i}', email=f'user{i}@example.com', password=password)
+                for i in range(1, num_usuarios + 1)
+            ],
+            batch_size=self.batch_size,
+        )
+
+        hoy = timezone.now().date()
+        UserSettings.objects.bulk_create(
+            [
+                UserSettings(
                     usuario=user,
-                    frente=fake.sentence(nb_words=6).replace('.', '?'),
-                    reverso=fake.paragraph(nb_sentences=2),
-                    estado=estado,
-                    fase=random.choice([1, 2, 3]),
-                    intervalo_actual=intervalo,
-                    EF=ef,
-                    ultima_repeticion=timezone.now() - timedelta(days=random.uniform(0, 30)),
-                    siguiente_repeticion=siguiente_rep,
-                    contador_aciertos=random.randint(0, 15),
-                    contador_fallos=random.randint(0, 5),
-                )
-                all_cards.append(card)
-
-        self.stdout.write(self.style.SUCCESS(f'✅ {len(all_cards)} Tarjetas creadas.'))
-
-        # ----------------------------------------
-        # 3. Crear Historial de Revisiones (ReviewLog)
-        # ----------------------------------------
-
-        all_logs = []
-        for card in all_cards:
-            num_logs = random.randint(0, self.REVIEWS_PER_CARD)
-            fase_actual = card.fase
-            
-            for i in range(num_logs):
-                calif_base = random.randint(1, 5)
-                tiempo_resp = random.uniform(1.0, 15.0)
-                calif_ajustada = calif_base * (1.0 - (tiempo_resp / 20.0)) # Simulación de ajuste
-                
-                fase_despues = fase_actual # Mantener la fase para el log
-                if i == num_logs - 1: # Usar la fase real de la tarjeta en el último log
-                    fase_despues = card.fase
-                
-                log = ReviewLog.objects.create(
-                    card=card,
-                    fecha=card.fecha_creacion + timedelta(days=random.uniform(1, 30)), # Fecha anterior a ahora
-                    calificacion_base=calif_base,
-                    tiempo_respuesta=tiempo_resp,
-                    calificacion_ajustada=calif_ajustada,
-                    fase_antes=fase_actual,
-                    fase_despues=fase_despues,
+                    max_tarjetas_nuevas_diarias=random.randint(5, 20),
+                    tarjetas_nuevas_hoy=random.randint(0, 5),
+                    ultima_fecha_reset=hoy - timedelta(days=random.randint(0, 3)),
                 )
-                all_logs.append(log)
-                fase_actual = fase_despues # Simular cambio de fase
+                for user in users
+            ],
+            batch_size=self.batch_size,
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(users)} Usuarios y UserSettings creados.'))
+        return users
 
-        self.stdout.write(self.style.SUCCESS(f'✅ {len(all_logs)} Registros de Revisión creados.'))
+    def crear_tarjetas(self, fake, users, tarjetas_por_usuario, max_repasos):
+        """Crea las tarjetas por lotes y, con cada lote ya insertado, sus ReviewLog"""
+        # Textos generados una sola vez: llamar a Faker por fila domina el tiempo total
+        frentes = [fake.sentence(nb_words=6).replace('.', '?') for _ in range(self.TEXTOS_FAKER)]
+        reversos = [fake.paragraph(nb_sentences=2) for _ in range(self.TEXTOS_FAKER)]
 
-        # ----------------------------------------
-        # 4. Crear Suscripciones (Subscription)
-        # ----------------------------------------
+        ahora = timezone.now()
+        total = len(users) * tarjetas_por_usuario
+        num_cards = num_logs = 0
 
-        all_subscriptions = []
+        lote = []
         for user in users:
-             # Solo una probabilidad de que el usuario tenga suscripción
-            if random.random() < 0.6: 
-                endpoint = fake.url()
-                
-                # Las claves son strings Base64 simulados
-                p256dh = fake.md5(raw_output=False)[:22] + '='
-                auth = fake.md5(raw_output=False)[:12] + '='
+            for _ in range(tarjetas_por_usuario):
+                lote.append(self.nueva_tarjeta(user, frentes, reversos, ahora))
+                if len(lote) == self.batch_size:
+                    num_logs += self.guardar_lote(lote, max_repasos)
+                    num_cards += len(lote)
+                    lote = []
+                    self.stdout.write(f'  ... {num_cards}/{total} tarjetas, {num_logs} logs')
+        if lote:
+            num_logs += self.guardar_lote(lote, max_repasos)
+            num_cards += len(lote)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {num_cards} Tarjetas creadas.'))
+        self.stdout.write(self.style.SUCCESS(f'✅ {num_logs} Registros de Revisión creados.'))
+        return num_cards, num_logs
+
+    def nueva_tarjeta(self, user, frentes, reversos, ahora):
+        estado, fase = random.choice(self.ESTADOS_FASE)
+        if fase == 1:
+            intervalo = random.choice(INTERVALOS_FASE_1)
+        elif fase == 2:
+            intervalo = random.choice(INTERVALOS_FASE_2)
+        else:
+            intervalo = random.uniform(30, 180) * 86400
+
+        # Fechas precalculadas a partir de un único 'ahora'
+        ultima = ahora - timedelta(days=random.uniform(0, 30))
+        return Card(
+            usuario=user,
+            frente=random.choice(frentes),
+            reverso=random.choice(reversos),
+            estado=estado,
+            fase=fase,
+            intervalo_actual=intervalo,
+            EF=random.uniform(1.3, 2.5),
+            ultima_repeticion=None if estado == 'nuevo' else ultima,
+            siguiente_repeticion=ahora + timedelta(days=random.uniform(-5, 7)),
+            contador_aciertos=random.randint(0, 15),
+            contador_fallos=random.randint(0, 5),
+            tiempos_recientes=[round(random.uniform(1.0, 8.0), 2) for _ in range(3)],
+        )
+
+    def guardar_lote(self, cards, max_repasos):
+        """Inserta un lote de tarjetas y sus logs en una transacción; devuelve cuántos logs creó"""
+        with transaction.atomic():
+            # En SQLite y PostgreSQL bulk_create devuelve las tarjetas con su id
+            Card.objects.bulk_create(cards, batch_size=self.batch_size)
+
+            filas = []
+            num_logs = 0
+            for card in cards:
+                if card.ultima_repeticion is None:
+                    continue
+                filas.extend(self.logs_tarjeta(card, random.randint(0, max_repasos)))
+                if len(filas) >= self.batch_size:
+                    num_logs += self.insertar_logs(filas)
+                    filas = []
+            num_logs += self.insertar_logs(filas)
+        return num_logs
+
+    def logs_tarjeta(self, card, num_logs):
+        """
+        Filas de un historial de 'num_logs' revisiones que termina en la última
+        repetición de la tarjeta, en el orden de COLUMNAS_LOG
+        """
+        # Fechas hacia atrás desde la última repetición, en orden cronológico
+        fechas = sorted(
+            card.ultima_repeticion - timedelta(days=random.uniform(0, 60)) for _ in range(num_logs - 1)
+        ) + [card.ultima_repeticion]
+        # Fases desde la 1 hasta la actual de la tarjeta
+        fases = [1 + (card.fase - 1) * i // num_logs for i in range(num_logs)] + [card.fase]
+
+        filas = []
+        for i in range(num_logs):
+            calif_base = random.randint(1, 5)
+            tiempo_resp = random.uniform(1.0, 15.0)
+            filas.append((
+                card.id,
+                connection.ops.adapt_datetimefield_value(fechas[i]),
+                calif_base,
+                tiempo_resp,
+                ajustar_calificacion_por_tiempo(calif_base, tiempo_resp),
+                fases[i],
+                fases[i + 1],
+            ))
+        return filas
+
+    COLUMNAS_LOG = [
+        'card', 'fecha', 'calificacion_base', 'tiempo_respuesta',
+        'calificacion_ajustada', 'fase_antes', 'fase_despues',
+    ]
+
+    def insertar_logs(self, filas):
+        """
+        Inserta ReviewLog con un executemany: son la tabla más grande y construir
+        una instancia del modelo por fila multiplica el tiempo de carga
+        """
+        if not filas:
+            return 0
+        meta = ReviewLog._meta
+        columnas = ', '.join(
+            connection.ops.quote_name(meta.get_field(campo).column) for campo in self.COLUMNAS_LOG
+        )
+        marcadores = ', '.join(['%s'] * len(self.COLUMNAS_LOG))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {connection.ops.quote_name(meta.db_table)} ({columnas}) VALUES ({marcadores})',
+                filas,
+            )
+        return len(filas)
 
-                subscription = Subscription.objects.create(
+    def crear_suscripciones(self, fake, users):
+        subscriptions = []
+        for user in users:
+            # Solo una probabilidad de que el usuario tenga suscripción
+            if random.random() < 0.6:
+                # Las claves son strings Base64 simulados
+                subscriptions.append(Subscription(
                     usuario=user,
-                    endpoint=f'https://fcm.googleapis.com/fcm/send/{endpoint}',
-                    p256dh=p256dh,
-                    auth=auth,
-                )
-                all_subscriptions.append(subscription)
-
-        self.stdout.write(self.style.SUCCESS(f'✅ {len(all_subscriptions)} Suscripciones a Notificaciones creadas.'))
-        
-        self.stdout.write(self.style.SUCCESS('\n🎉 ¡Proceso de llenado de datos finalizado con éxito!'))
+                    endpoint=f'https://fcm.googleapis.com/fcm/send/{user.username}-{fake.uuid4()}',
+                    p256dh=fake.md5(raw_output=False)[:22] + '=',
+                    auth=fake.md5(raw_output=False)[:12] + '=',
+                ))
+        Subscription.objects.bulk_create(subscriptions, batch_size=self.batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(subscriptions)} Suscripciones a Notificaciones creadas.'))
+        return len(subscriptions)
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from flashcards.trabajos import ejecutar_trabajo, liberar_trabajos_abandonados, reclamar_trabajo
+
+
+class Command(BaseCommand):
+    help = 'Worker que ejecuta los trabajos de notificación encolados por el endpoint de cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Vaciar la cola y terminar (para ejecutarlo desde cron)')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre consultas a la cola vacía')
+
+    def handle(self, *args, **options):
+        self.stdout.write('👷 Worker de notificaciones iniciado')
+        procesados = 0
+
+        try:
+            while True:
+                liberados = liberar_trabajos_abandonados()
+                if liberados:
+                    self.stdout.write(self.style.WARNING(f'♻️ {liberados} trabajo(s) abandonado(s) devuelto(s) a la cola'))
+
+                trabajo = reclamar_trabajo()
+                if trabajo is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f'▶️ Ejecutando trabajo {trabajo.id} ({trabajo.tipo})...')
+                inicio = time.perf_counter()
+                trabajo = ejecutar_trabajo(trabajo)
+                procesados += 1
+
+                estilo = self.style.SUCCESS if trabajo.estado == 'completado' else self.style.ERROR
+                self.stdout.write(estilo(
+                    f'{"✅" if trabajo.estado == "completado" else "❌"} Trabajo {trabajo.id}: '
+                    f'{trabajo.estado} en {time.perf_counter() - inicio:.2f} s'
+                ))
+        except KeyboardInterrupt:
+            self.stdout.write('\n⏹️ Worker detenido')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {procesados} trabajo(s) procesado(s).'))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.search import fts_disponible, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda FTS5 de las tarjetas'
+
+    def handle(self, *args, **options):
+        if not fts_disponible():
+            raise CommandError('La base de datos no tiene índice FTS5 (solo SQLite); la búsqueda usa icontains')
+
+        self.stdout.write('🔎 Reconstruyendo índice de búsqueda...')
+        inicio = time.perf_counter()
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {total} tarjeta(s) indexada(s) en {time.perf_counter() - inicio:.2f} s'
+        ))
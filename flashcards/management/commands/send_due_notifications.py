@@ -1,93 +1,53 @@
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from django.utils import timezone
-from flashcards.models import Card, Subscription
-from pywebpush import webpush, WebPushException
-import json
-import os
+from flashcards.notificaciones import enviar_y_limpiar
+from flashcards.stats import suscripciones_con_pendientes
+from flashcards.push import CONCURRENCIA, REINTENTOS, TIMEOUT, mensaje_pendientes
 
 
 class Command(BaseCommand):
     help = 'Envía notificaciones push a usuarios con tarjetas pendientes'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA, help='Envíos simultáneos como máximo')
+        parser.add_argument('--timeout', type=float, default=TIMEOUT, help='Segundos de espera por endpoint')
+        parser.add_argument('--reintentos', type=int, default=REINTENTOS, help='Reintentos ante respuestas 429 o 5xx')
+
     def handle(self, *args, **options):
         self.stdout.write('🔔 Verificando tarjetas pendientes...')
-        
-        ahora = timezone.now()
-        notificaciones_enviadas = 0
-        
-        # Obtener usuarios con suscripciones activas
-        usuarios_con_suscripcion = User.objects.filter(
-            subscriptions__isnull=False
-        ).distinct()
-        
-        for usuario in usuarios_con_suscripcion:
-            # Contar tarjetas pendientes (vencidas)
-            tarjetas_pendientes = Card.objects.filter(
-                usuario=usuario,
-                siguiente_repeticion__lte=ahora
-            ).exclude(estado='nuevo').count()
-            
-            if tarjetas_pendientes > 0:
-                # Enviar notificación a todas las suscripciones del usuario
-                suscripciones = Subscription.objects.filter(usuario=usuario)
-                
-                for suscripcion in suscripciones:
-                    try:
-                        # Preparar mensaje
-                        mensaje = {
-                            "title": "🎓 Rufingo",
-                            "body": f"¡Tienes {tarjetas_pendientes} tarjeta{'s' if tarjetas_pendientes > 1 else ''} pendiente{'s' if tarjetas_pendientes > 1 else ''} para repasar!",
-                            "icon": "/static/android-chrome-192x192.png",
-                            "badge": "/static/android-chrome-192x192.png",
-                            "url": "/repaso/"
-                        }
-                        
-                        # Configurar VAPID
-                        vapid_private_key = os.getenv('VAPID_PRIVATE_KEY')
-                        vapid_claims = {
-                            "sub": f"mailto:{os.getenv('VAPID_CLAIM_EMAIL', 'admin@rufingo.com')}"
-                        }
-                        
-                        # Enviar notificación
-                        webpush(
-                            subscription_info={
-                                "endpoint": suscripcion.endpoint,
-                                "keys": {
-                                    "p256dh": suscripcion.p256dh,
-                                    "auth": suscripcion.auth
-                                }
-                            },
-                            data=json.dumps(mensaje),
-                            vapid_private_key=vapid_private_key,
-                            vapid_claims=vapid_claims
-                        )
-                        
-                        notificaciones_enviadas += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'✅ Notificación enviada a {usuario.username} ({tarjetas_pendientes} tarjetas)'
-                            )
-                        )
-                        
-                    except WebPushException as e:
-                        self.stdout.write(
-                            self.style.ERROR(
-                                f'❌ Error enviando notificación a {usuario.username}: {e}'
-                            )
-                        )
-                        
-                        # Si la suscripción es inválida (410 Gone), eliminarla
-                        if e.response and e.response.status_code == 410:
-                            suscripcion.delete()
-                            self.stdout.write(
-                                self.style.WARNING(
-                                    f'🗑️ Suscripción inválida eliminada para {usuario.username}'
-                                )
-                            )
-        
+
+        # Una sola consulta: suscripciones con el número de pendientes de su usuario,
+        # leídas por bloques a medida que se envían
+        envios = (
+            (suscripcion, mensaje_pendientes(suscripcion.pendientes))
+            for suscripcion in suscripciones_con_pendientes()
+        )
+
+        self.stdout.write('📤 Enviando notificaciones...')
+        resumen = enviar_y_limpiar(
+            envios,
+            concurrencia=options['concurrencia'],
+            timeout=options['timeout'],
+            reintentos=options['reintentos'],
+        )
+
+        for resultado in resumen.resultados:
+            if not resultado.ok:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f'❌ Error enviando notificación a {resultado.suscripcion.usuario.username}: '
+                        f'{resultado.estado or ""} {resultado.error}'
+                    )
+                )
+
+        if resumen.caducadas:
+            self.stdout.write(
+                self.style.WARNING(f'🗑️ {len(resumen.caducadas)} suscripción(es) inválida(s) eliminada(s)')
+            )
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'\n✅ Proceso completado. {notificaciones_enviadas} notificación(es) enviada(s).'
+                f'\n✅ Proceso completado. {resumen.enviadas} notificación(es) enviada(s), '
+                f'{resumen.fallidas} fallida(s), {resumen.reintentos} reintento(s) en {resumen.duracion:.2f} s '
+                f'({resumen.por_segundo:.0f}/s).'
             )
         )
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.management.commands.backup_db import entero_positivo
+from flashcards.simulacion import simular
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula el planificador de tres fases sobre tarjetas sintéticas durante meses '
+        'de tiempo virtual y reporta la carga diaria de repasos, fases y retención'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tarjetas', type=entero_positivo, default=10000, help='Tarjetas del mazo simulado')
+        parser.add_argument('--dias', type=entero_positivo, default=180, help='Días de tiempo virtual')
+        parser.add_argument('--nuevas-por-dia', type=entero_positivo, default=10, help='Tarjetas nuevas que se introducen cada día')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        for opcion in ('tarjetas', 'dias', 'nuevas_por_dia'):
+            # call_command(...) con argumentos con nombre no pasa por el tipo de argparse
+            if options[opcion] <= 0:
+                raise CommandError(f"--{opcion.replace('_', '-')} debe ser un entero positivo")
+        dias = options['dias']
+        self.stdout.write(
+            f"🧪 Simulando {options['tarjetas']} tarjetas durante {dias} días "
+            f"({options['nuevas_por_dia']} nuevas/día)..."
+        )
+        inicio = time.perf_counter()
+        _, resultado = simular(
+            options['tarjetas'], dias, options['nuevas_por_dia'], semilla=options['seed']
+        )
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write('\n' + '=' * 60)
+        self.reportar_carga('Repasos/día', resultado.repasos)
+        self.reportar_carga('Tarjetas/día', resultado.tarjetas)
+        ultimos = resultado.repasos[-30:]
+        self.stdout.write(f'Últimos {len(ultimos)} días: media {ultimos.mean():.1f} repasos/día')
+
+        self.stdout.write('\n📅 Carga por semana (media de repasos/día):')
+        for semana in range(0, dias, 7):
+            carga = resultado.repasos[semana:semana + 7]
+            self.stdout.write(f'  Semana {semana // 7 + 1:>3}: {carga.mean():8.1f}')
+
+        sin_empezar, fase_1, fase_2, fase_3 = resultado.fases[-1]
+        self.stdout.write(
+            f'\n📊 Fases al final: sin empezar {sin_empezar} | Fase 1 {fase_1} | '
+            f'Fase 2 {fase_2} | Fase 3 {fase_3}'
+        )
+        total = resultado.repasos.sum()
+        self.stdout.write(
+            f'🧠 Retención (repasos de Fase 2 y 3): {resultado.retencion:.1%} | '
+            f'global: {resultado.recordadas.sum() / total if total else 0:.1%}'
+        )
+        self.stdout.write('=' * 60)
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} repasos simulados en {duracion:.2f} s\n'))
+
+    def reportar_carga(self, nombre, valores):
+        self.stdout.write(
+            f'{nombre}: media {valores.mean():.1f} | '
+            f'p95 {np.percentile(valores, 95):.0f} | máx {valores.max()}'
+        )
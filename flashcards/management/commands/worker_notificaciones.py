@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from flashcards.notificaciones import ProgramadorNotificaciones
+from flashcards.push import CONCURRENCIA, REINTENTOS, TIMEOUT
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker de notificaciones programadas: duerme hasta que algún usuario alcanza '
+        'su umbral de tarjetas vencidas y solo entonces le envía el aviso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresco', type=float, default=60, help='Segundos entre búsquedas de usuarios por recalcular')
+        parser.add_argument('--una-vez', action='store_true', help='Enviar lo que ya toca y terminar')
+        parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA, help='Envíos simultáneos como máximo')
+        parser.add_argument('--timeout', type=float, default=TIMEOUT, help='Segundos de espera por endpoint')
+        parser.add_argument('--reintentos', type=int, default=REINTENTOS, help='Reintentos ante respuestas 429 o 5xx')
+
+    def handle(self, *args, **options):
+        programador = ProgramadorNotificaciones(
+            concurrencia=options['concurrencia'],
+            timeout=options['timeout'],
+            reintentos=options['reintentos'],
+        )
+        programador.cargar()
+        self.stdout.write(f'⏰ Worker de notificaciones iniciado ({len(programador.programadas)} usuario(s) programado(s))')
+
+        proximo_refresco = 0.0
+        try:
+            while True:
+                if time.monotonic() >= proximo_refresco:
+                    recalculados = programador.recalcular_marcados()
+                    if recalculados:
+                        self.stdout.write(f'🔄 {recalculados} usuario(s) reprogramado(s)')
+                    proximo_refresco = time.monotonic() + options['refresco']
+
+                resumen = programador.procesar_vencidas()
+                if resumen is not None:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✅ {resumen.enviadas} notificación(es) enviada(s), {resumen.fallidas} fallida(s) '
+                        f'en {resumen.duracion:.2f} s'
+                    ))
+
+                if options['una_vez']:
+                    break
+
+                # Dormir hasta la próxima notificación, sin pasar del próximo refresco
+                espera = proximo_refresco - time.monotonic()
+                siguiente = programador.siguiente()
+                if siguiente is not None:
+                    espera = min(espera, (siguiente - timezone.now()).total_seconds())
+                if espera > 0:
+                    time.sleep(espera)
+        except KeyboardInterrupt:
+            self.stdout.write('\n⏹️ Worker detenido')
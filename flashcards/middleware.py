@@ -1,10 +1,25 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
 class NoCacheMiddleware:
+    # Compatible con ASGI: las vistas async (el stream de pendientes) no pasan a un hilo
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.sin_cache(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.sin_cache(await self.get_response(request))
+
+    def sin_cache(self, response):
         # Solo aplicar a páginas HTML (no a static files)
         if response.get('Content-Type', '').startswith('text/html'):
             response['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0002_alter_usersettings_ultima_fecha_reset'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('estado', 'nuevo'), _negated=True), fields=['usuario', 'siguiente_repeticion'], name='card_cola_repaso_idx'),
+        ),
+    ]
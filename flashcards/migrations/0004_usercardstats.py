@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def poblar_contadores(apps, schema_editor):
+    """Calcula los contadores iniciales de todos los usuarios existentes"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Card = apps.get_model('flashcards', 'Card')
+    UserCardStats = apps.get_model('flashcards', 'UserCardStats')
+
+    conteos = {
+        fila.pop('usuario'): fila
+        for fila in Card.objects.values('usuario').order_by().annotate(
+            total_tarjetas=Count('id'),
+            fase_1=Count('id', filter=Q(fase=1)),
+            fase_2=Count('id', filter=Q(fase=2)),
+            fase_3=Count('id', filter=Q(fase=3)),
+            nuevas=Count('id', filter=Q(estado='nuevo')),
+            aprendizaje=Count('id', filter=Q(estado='aprendizaje')),
+            consolidacion=Count('id', filter=Q(estado='consolidacion')),
+            maduras=Count('id', filter=Q(estado='maduro')),
+        )
+    }
+    UserCardStats.objects.bulk_create(
+        [
+            UserCardStats(usuario_id=usuario_id, **conteos.get(usuario_id, {}))
+            for usuario_id in User.objects.values_list('id', flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0003_card_cola_repaso_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_tarjetas', models.IntegerField(default=0)),
+                ('fase_1', models.IntegerField(default=0)),
+                ('fase_2', models.IntegerField(default=0)),
+                ('fase_3', models.IntegerField(default=0)),
+                ('nuevas', models.IntegerField(default=0)),
+                ('aprendizaje', models.IntegerField(default=0)),
+                ('consolidacion', models.IntegerField(default=0)),
+                ('maduras', models.IntegerField(default=0)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='card_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Contadores de Tarjetas',
+                'verbose_name_plural': 'Contadores de Tarjetas',
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+def poblar_tiempos_recientes(apps, schema_editor):
+    """Copia a cada tarjeta los tiempos de respuesta de sus últimas 3 revisiones"""
+    Card = apps.get_model('flashcards', 'Card')
+    ReviewLog = apps.get_model('flashcards', 'ReviewLog')
+
+    pendientes = []
+    card_actual, tiempos = None, []
+    filas = ReviewLog.objects.order_by('card_id', '-fecha').values_list('card_id', 'tiempo_respuesta')
+
+    def agregar(card_id, tiempos):
+        # Los logs vienen del más reciente al más antiguo
+        pendientes.append(Card(id=card_id, tiempos_recientes=tiempos[::-1]))
+        if len(pendientes) >= 1000:
+            Card.objects.bulk_update(pendientes, ['tiempos_recientes'])
+            pendientes.clear()
+
+    for card_id, tiempo in filas.iterator(chunk_size=5000):
+        if card_id != card_actual:
+            if card_actual is not None:
+                agregar(card_actual, tiempos)
+            card_actual, tiempos = card_id, []
+        if len(tiempos) < 3:
+            tiempos.append(tiempo)
+    if card_actual is not None:
+        agregar(card_actual, tiempos)
+    Card.objects.bulk_update(pendientes, ['tiempos_recientes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0004_usercardstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='tiempos_recientes',
+            field=models.JSONField(blank=True, default=list, help_text='Tiempos de respuesta de las últimas revisiones (máx. 3, el más reciente al final)'),
+        ),
+        migrations.RunPython(poblar_tiempos_recientes, migrations.RunPython.noop),
+    ]
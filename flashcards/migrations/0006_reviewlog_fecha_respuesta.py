@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0005_card_tiempos_recientes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reviewlog',
+            name='fecha',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Momento de la respuesta'),
+        ),
+    ]
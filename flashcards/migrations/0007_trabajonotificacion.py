@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0006_reviewlog_fecha_respuesta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoNotificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(default='notificaciones_pendientes', max_length=50)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('intentos', models.IntegerField(default=0)),
+                ('resultado', models.TextField(blank=True, help_text='Salida del comando o error')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Notificación',
+                'verbose_name_plural': 'Trabajos de Notificación',
+                'ordering': ['-fecha_creacion'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado__in', ['pendiente', 'en_curso'])), fields=('tipo',), name='trabajo_notificacion_activo_unico')],
+            },
+        ),
+    ]
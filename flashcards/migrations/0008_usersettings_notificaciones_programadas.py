@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0007_trabajonotificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersettings',
+            name='proxima_notificacion',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Cuándo se alcanza el umbral; vacío si hay que recalcularlo', null=True),
+        ),
+        migrations.AddField(
+            model_name='usersettings',
+            name='ultima_notificacion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usersettings',
+            name='umbral_notificacion',
+            field=models.IntegerField(default=1, help_text='Tarjetas que deben vencer desde el último aviso para enviar otro'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0008_usersettings_notificaciones_programadas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['usuario', '-fecha_creacion', '-id'], name='card_lista_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+
+# Índice FTS5 de contenido externo sobre flashcards_card: solo guarda el índice,
+# el texto se lee de la propia tabla. Los triggers lo mantienen sincronizado;
+# el de UPDATE solo salta si cambia el texto, no en cada repaso.
+SQL_CREAR = [
+    """
+    CREATE VIRTUAL TABLE flashcards_card_fts USING fts5(
+        frente, reverso,
+        content='flashcards_card', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER flashcards_card_fts_insert AFTER INSERT ON flashcards_card BEGIN
+        INSERT INTO flashcards_card_fts(rowid, frente, reverso) VALUES (new.id, new.frente, new.reverso);
+    END
+    """,
+    """
+    CREATE TRIGGER flashcards_card_fts_delete AFTER DELETE ON flashcards_card BEGIN
+        INSERT INTO flashcards_card_fts(flashcards_card_fts, rowid, frente, reverso)
+        VALUES ('delete', old.id, old.frente, old.reverso);
+    END
+    """,
+    """
+    CREATE TRIGGER flashcards_card_fts_update AFTER UPDATE OF frente, reverso ON flashcards_card BEGIN
+        INSERT INTO flashcards_card_fts(flashcards_card_fts, rowid, frente, reverso)
+        VALUES ('delete', old.id, old.frente, old.reverso);
+        INSERT INTO flashcards_card_fts(rowid, frente, reverso) VALUES (new.id, new.frente, new.reverso);
+    END
+    """,
+    "INSERT INTO flashcards_card_fts(flashcards_card_fts) VALUES ('rebuild')",
+]
+
+SQL_BORRAR = [
+    'DROP TRIGGER IF EXISTS flashcards_card_fts_insert',
+    'DROP TRIGGER IF EXISTS flashcards_card_fts_delete',
+    'DROP TRIGGER IF EXISTS flashcards_card_fts_update',
+    'DROP TABLE IF EXISTS flashcards_card_fts',
+]
+
+
+def crear_indice(apps, schema_editor):
+    # FTS5 solo existe en SQLite; en otras bases la búsqueda usa icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_CREAR:
+        schema_editor.execute(sql)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_BORRAR:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0009_card_lista_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0010_card_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('repasos', models.IntegerField(default=0)),
+                ('suma_calificacion_base', models.IntegerField(default=0)),
+                ('suma_calificacion_ajustada', models.FloatField(default=0.0)),
+                ('suma_tiempo_respuesta', models.FloatField(default=0.0, help_text='Segundos')),
+                ('promociones', models.IntegerField(default=0)),
+                ('retrocesos', models.IntegerField(default=0)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='flashcards.card')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Revisiones',
+                'verbose_name_plural': 'Resúmenes Diarios de Revisiones',
+                'ordering': ['-dia'],
+                'constraints': [models.UniqueConstraint(fields=('card', 'dia'), name='resumen_diario_card_dia_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0011_resumendiario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewlog',
+            name='respuesta_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0012_reviewlog_respuesta_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajonotificacion',
+            name='latido',
+            field=models.DateTimeField(blank=True, help_text='Última señal de vida del worker que lo ejecuta', null=True),
+        ),
+    ]
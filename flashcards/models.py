@@ -13,6 +13,16 @@ class UserSettings(models.Model):
     tarjetas_nuevas_hoy = models.IntegerField(default=0)
     ultima_fecha_reset = models.DateField(default=get_fecha_hoy)  
     
+    # Notificaciones programadas (worker_notificaciones)
+    umbral_notificacion = models.IntegerField(
+        default=1, help_text="Tarjetas que deben vencer desde el último aviso para enviar otro"
+    )
+    proxima_notificacion = models.DateTimeField(
+        null=True, blank=True, db_index=True,
+        help_text="Cuándo se alcanza el umbral; vacío si hay que recalcularlo"
+    )
+    ultima_notificacion = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         verbose_name = "Configuración de Usuario"
         verbose_name_plural = "Configuraciones de Usuarios"
@@ -28,6 +38,29 @@ class UserSettings(models.Model):
             self.ultima_fecha_reset = hoy
             self.save()
 
+class UserCardStats(models.Model):
+    """Contadores de tarjetas de cada usuario, mantenidos en cada escritura"""
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='card_stats')
+    total_tarjetas = models.IntegerField(default=0)
+    
+    # Por fase
+    fase_1 = models.IntegerField(default=0)
+    fase_2 = models.IntegerField(default=0)
+    fase_3 = models.IntegerField(default=0)
+    
+    # Por estado
+    nuevas = models.IntegerField(default=0)
+    aprendizaje = models.IntegerField(default=0)
+    consolidacion = models.IntegerField(default=0)
+    maduras = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Contadores de Tarjetas"
+        verbose_name_plural = "Contadores de Tarjetas"
+    
+    def __str__(self):
+        return f"Contadores de {self.usuario.username}"
+
 class Card(models.Model):
     """Tarjeta de estudio con sistema de repetición espaciada"""
     
@@ -68,11 +101,28 @@ class Card(models.Model):
     # Última respuesta
     tiempo_respuesta = models.FloatField(default=0.0, help_text="Tiempo en segundos")
     calificacion_ajustada = models.FloatField(default=0.0)
+    tiempos_recientes = models.JSONField(
+        default=list, blank=True,
+        help_text="Tiempos de respuesta de las últimas revisiones (máx. 3, el más reciente al final)"
+    )
     
     class Meta:
         verbose_name = "Tarjeta"
         verbose_name_plural = "Tarjetas"
         ordering = ['siguiente_repeticion']
+        indexes = [
+            # Cola de repaso: tarjetas no nuevas de un usuario ordenadas por vencimiento
+            models.Index(
+                fields=['usuario', 'siguiente_repeticion'],
+                condition=~models.Q(estado='nuevo'),
+                name='card_cola_repaso_idx',
+            ),
+            # Lista de tarjetas: paginación por keyset sobre (fecha_creacion, id)
+            models.Index(
+                fields=['usuario', '-fecha_creacion', '-id'],
+                name='card_lista_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.frente[:50]}..."
@@ -89,7 +139,7 @@ class Card(models.Model):
 class ReviewLog(models.Model):
     """Historial de revisiones de cada tarjeta"""
     card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='reviews')
-    fecha = models.DateTimeField(auto_now_add=True)
+    fecha = models.DateTimeField(default=timezone.now, help_text="Momento de la respuesta")
     
     # Calificaciones
     calificacion_base = models.IntegerField(help_text="Calificación 0-5 del usuario")
@@ -100,6 +150,10 @@ class ReviewLog(models.Model):
     fase_antes = models.IntegerField()
     fase_despues = models.IntegerField()
     
+    # Clave de idempotencia generada por el cliente para cada respuesta:
+    # un reenvío de la misma respuesta no se registra dos veces
+    respuesta_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    
     class Meta:
         verbose_name = "Registro de Revisión"
         verbose_name_plural = "Registros de Revisiones"
@@ -109,6 +163,47 @@ class ReviewLog(models.Model):
         return f"Review {self.card.frente[:30]} - {self.fecha.strftime('%Y-%m-%d %H:%M')}"
 
 
+class ResumenDiario(models.Model):
+    """
+    Resumen por tarjeta y día de los ReviewLog archivados por 'archivar_repasos'.
+    Guarda sumas y no medias para poder acumular varias ejecuciones sobre el mismo día.
+    """
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    dia = models.DateField()
+    
+    repasos = models.IntegerField(default=0)
+    suma_calificacion_base = models.IntegerField(default=0)
+    suma_calificacion_ajustada = models.FloatField(default=0.0)
+    suma_tiempo_respuesta = models.FloatField(default=0.0, help_text="Segundos")
+    
+    # Transiciones de fase
+    promociones = models.IntegerField(default=0)
+    retrocesos = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Resumen Diario de Revisiones"
+        verbose_name_plural = "Resúmenes Diarios de Revisiones"
+        ordering = ['-dia']
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'dia'], name='resumen_diario_card_dia_unico'),
+        ]
+    
+    def __str__(self):
+        return f"Resumen {self.card_id} - {self.dia}"
+    
+    @property
+    def calificacion_media(self):
+        return self.suma_calificacion_base / self.repasos if self.repasos else 0.0
+    
+    @property
+    def calificacion_ajustada_media(self):
+        return self.suma_calificacion_ajustada / self.repasos if self.repasos else 0.0
+    
+    @property
+    def tiempo_medio(self):
+        return self.suma_tiempo_respuesta / self.repasos if self.repasos else 0.0
+
+
 class Subscription(models.Model):
     """Suscripción a notificaciones push de cada usuario"""
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subscriptions')
@@ -123,3 +218,44 @@ class Subscription(models.Model):
     
     def __str__(self):
         return f"Suscripción de {self.usuario.username}"
+
+
+class TrabajoNotificacion(models.Model):
+    """
+    Envío de notificaciones encolado desde el endpoint de cron y ejecutado por
+    el worker 'procesar_trabajos' fuera de la petición web
+    """
+    
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    # Estados de un trabajo que todavía no ha terminado
+    ACTIVOS = ['pendiente', 'en_curso']
+    
+    tipo = models.CharField(max_length=50, default='notificaciones_pendientes')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(null=True, blank=True, help_text="Última señal de vida del worker que lo ejecuta")
+    intentos = models.IntegerField(default=0)
+    resultado = models.TextField(blank=True, help_text="Salida del comando o error")
+    
+    class Meta:
+        verbose_name = "Trabajo de Notificación"
+        verbose_name_plural = "Trabajos de Notificación"
+        ordering = ['-fecha_creacion']
+        constraints = [
+            # Como mucho un trabajo activo de cada tipo: dos llamadas de cron seguidas no envían dos veces
+            models.UniqueConstraint(
+                fields=['tipo'],
+                condition=models.Q(estado__in=['pendiente', 'en_curso']),
+                name='trabajo_notificacion_activo_unico',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.estado})"
@@ -0,0 +1,169 @@
+"""
+Notificaciones programadas por usuario.
+
+Cada UserSettings guarda en 'proxima_notificacion' el momento en que vencerán
+'umbral_notificacion' tarjetas desde el último aviso. El worker mantiene esos
+momentos en un heap y duerme hasta el más próximo, en lugar de revisar a todos
+los usuarios en cada ejecución del cron.
+
+Cuando una escritura puede adelantar ese momento (una tarjeta que vence antes),
+marcar_recalculo vacía 'proxima_notificacion' y el worker la vuelve a calcular.
+"""
+import heapq
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Card, Subscription, UserSettings
+from .push import enviar_notificaciones, mensaje_pendientes
+from .stats import suscripciones_con_pendientes
+
+
+# Tiempo mínimo entre dos avisos al mismo usuario
+INTERVALO_MINIMO = timedelta(hours=1)
+# Si no hay suficientes tarjetas programadas, volver a mirar pasado este tiempo
+HORIZONTE = timedelta(days=1)
+
+
+def calcular_proxima_notificacion(settings, ahora=None):
+    """
+    Momento en que el usuario alcanza su umbral: el vencimiento de la
+    umbral-ésima tarjeta (no nueva) que vence después del último aviso.
+    Usa el índice de la cola de repaso; lee como mucho una fila.
+    """
+    if ahora is None:
+        ahora = timezone.now()
+    tarjetas = Card.objects.filter(usuario_id=settings.usuario_id).exclude(estado='nuevo')
+    if settings.ultima_notificacion:
+        tarjetas = tarjetas.filter(siguiente_repeticion__gt=settings.ultima_notificacion)
+
+    umbral = max(settings.umbral_notificacion, 1)
+    fechas = list(
+        tarjetas.order_by('siguiente_repeticion')
+        .values_list('siguiente_repeticion', flat=True)[umbral - 1:umbral]
+    )
+    proxima = fechas[0] if fechas else ahora + HORIZONTE
+    if settings.ultima_notificacion:
+        proxima = max(proxima, settings.ultima_notificacion + INTERVALO_MINIMO)
+    return proxima
+
+
+def marcar_recalculo(usuario_id, siguiente_repeticion):
+    """
+    Invalida la próxima notificación del usuario si una tarjeta pasa a vencer
+    antes de lo programado. Un único UPDATE que casi siempre no afecta a ninguna fila.
+    """
+    UserSettings.objects.filter(
+        usuario_id=usuario_id, proxima_notificacion__gt=siguiente_repeticion,
+    ).update(proxima_notificacion=None)
+
+
+def enviar_y_limpiar(envios, **opciones):
+    """Envía las notificaciones y borra de una vez las suscripciones caducadas (404/410)"""
+    resumen = enviar_notificaciones(envios, **opciones)
+    caducadas = [suscripcion.id for suscripcion in resumen.caducadas]
+    if caducadas:
+        Subscription.objects.filter(id__in=caducadas).delete()
+    return resumen
+
+
+class ProgramadorNotificaciones:
+    """
+    Heap de (proxima_notificacion, usuario_id). Las entradas viejas no se sacan
+    del heap: se descartan al salir si ya no coinciden con 'programadas'.
+    """
+
+    def __init__(self, **opciones_envio):
+        self.heap = []
+        self.programadas = {}
+        self.opciones_envio = opciones_envio
+
+    def programar(self, usuario_id, proxima):
+        self.programadas[usuario_id] = proxima
+        heapq.heappush(self.heap, (proxima, usuario_id))
+
+    def cargar(self):
+        """Carga las notificaciones ya calculadas de los usuarios suscritos"""
+        filas = UserSettings.objects.filter(
+            usuario__subscriptions__isnull=False, proxima_notificacion__isnull=False,
+        ).values_list('usuario_id', 'proxima_notificacion').distinct()
+        for usuario_id, proxima in filas:
+            self.programar(usuario_id, proxima)
+
+    def recalcular_marcados(self, ahora=None):
+        """Calcula la próxima notificación de los usuarios suscritos que la tienen vacía"""
+        if ahora is None:
+            ahora = timezone.now()
+        marcados = UserSettings.objects.filter(
+            usuario__subscriptions__isnull=False, proxima_notificacion__isnull=True,
+        ).distinct()
+        actualizados = []
+        for settings in marcados:
+            settings.proxima_notificacion = calcular_proxima_notificacion(settings, ahora)
+            actualizados.append(settings)
+        UserSettings.objects.bulk_update(actualizados, ['proxima_notificacion'])
+        for settings in actualizados:
+            self.programar(settings.usuario_id, settings.proxima_notificacion)
+        return len(actualizados)
+
+    def siguiente(self):
+        """Momento de la próxima notificación vigente (None si el heap está vacío)"""
+        while self.heap:
+            proxima, usuario_id = self.heap[0]
+            if self.programadas.get(usuario_id) == proxima:
+                return proxima
+            heapq.heappop(self.heap)
+        return None
+
+    def sacar_vencidas(self, ahora):
+        """Saca del heap los usuarios cuya notificación ya ha llegado"""
+        usuarios = []
+        while (proxima := self.siguiente()) is not None and proxima <= ahora:
+            _, usuario_id = heapq.heappop(self.heap)
+            del self.programadas[usuario_id]
+            usuarios.append(usuario_id)
+        return usuarios
+
+    def procesar_vencidas(self, ahora=None):
+        """
+        Notifica a los usuarios cuyo momento ha llegado. Antes se recalcula cada
+        uno, por si sus tarjetas cambiaron desde que se programó; si su umbral ya
+        no se alcanza todavía, solo se reprograma. Devuelve el ResumenEnvio o None.
+        """
+        if ahora is None:
+            ahora = timezone.now()
+        usuarios = self.sacar_vencidas(ahora)
+        if not usuarios:
+            return None
+
+        a_notificar = []
+        reprogramados = []
+        # Los usuarios que ya no tienen suscripciones salen del heap hasta que se vuelvan a suscribir
+        suscritos = UserSettings.objects.filter(
+            usuario_id__in=usuarios, usuario__subscriptions__isnull=False,
+        ).distinct()
+        for settings in suscritos:
+            proxima = calcular_proxima_notificacion(settings, ahora)
+            if proxima <= ahora:
+                a_notificar.append(settings)
+            else:
+                settings.proxima_notificacion = proxima
+                reprogramados.append(settings)
+
+        resumen = None
+        if a_notificar:
+            envios = [
+                (suscripcion, mensaje_pendientes(suscripcion.pendientes))
+                for suscripcion in suscripciones_con_pendientes(ahora, [s.usuario_id for s in a_notificar])
+            ]
+            resumen = enviar_y_limpiar(envios, **self.opciones_envio)
+
+            for settings in a_notificar:
+                settings.ultima_notificacion = ahora
+                settings.proxima_notificacion = calcular_proxima_notificacion(settings, ahora)
+
+        actualizados = a_notificar + reprogramados
+        UserSettings.objects.bulk_update(actualizados, ['ultima_notificacion', 'proxima_notificacion'])
+        for settings in actualizados:
+            self.programar(settings.usuario_id, settings.proxima_notificacion)
+        return resumen
@@ -0,0 +1,206 @@
+"""
+Envío concurrente de notificaciones push (Web Push con VAPID).
+
+Las credenciales VAPID se cargan una sola vez por ejecución y las cabeceras
+firmadas se reutilizan para cada servicio push (FCM, Mozilla, Apple...). Los
+envíos comparten una sesión aiohttp, con un límite de peticiones simultáneas y
+un timeout por endpoint.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import aiohttp
+from py_vapid import Vapid
+from pywebpush import WebPusher
+
+
+CONCURRENCIA = 50
+TIMEOUT = 10           # segundos por endpoint
+TTL = 0                # sin conexión, el servicio push descarta el mensaje (como hasta ahora)
+VALIDEZ_FIRMA = 12 * 60 * 60
+
+# Reintentos ante saturación (429) o errores del servicio push (5xx)
+REINTENTOS = 3
+BACKOFF_BASE = 1.0     # segundos; se duplica en cada reintento
+BACKOFF_MAXIMO = 60.0
+# Respuestas que indican que la suscripción ya no existe y hay que borrarla
+ESTADOS_CADUCADA = (404, 410)
+# Envíos que se leen de una vez del iterador de suscripciones
+TANDA_ENVIOS = 2000
+
+
+def mensaje_pendientes(tarjetas_pendientes):
+    """Contenido de la notificación de tarjetas pendientes"""
+    plural = 's' if tarjetas_pendientes > 1 else ''
+    return {
+        "title": "🎓 Rufingo",
+        "body": f"¡Tienes {tarjetas_pendientes} tarjeta{plural} pendiente{plural} para repasar!",
+        "icon": "/static/android-chrome-192x192.png",
+        "badge": "/static/android-chrome-192x192.png",
+        "url": "/repaso/"
+    }
+
+
+class CredencialesVapid:
+    """Clave VAPID cargada una vez, con las cabeceras firmadas cacheadas por servicio push"""
+
+    def __init__(self, private_key=None, email=None):
+        private_key = private_key or os.getenv('VAPID_PRIVATE_KEY')
+        if not private_key:
+            raise ValueError('Falta VAPID_PRIVATE_KEY')
+        self.vapid = Vapid.from_string(private_key=private_key)
+        self.email = email or os.getenv('VAPID_CLAIM_EMAIL', 'admin@rufingo.com')
+        self._cabeceras = {}
+
+    def cabeceras(self, endpoint):
+        """Cabeceras Authorization de VAPID para el origen del endpoint"""
+        url = urlparse(endpoint)
+        aud = f'{url.scheme}://{url.netloc}'
+        ahora = int(time.time())
+
+        cacheadas = self._cabeceras.get(aud)
+        # Se vuelve a firmar cuando falta menos de una hora para que caduque
+        if cacheadas is None or cacheadas[0] - ahora < 3600:
+            expira = ahora + VALIDEZ_FIRMA
+            claims = {'sub': f'mailto:{self.email}', 'aud': aud, 'exp': expira}
+            cacheadas = (expira, self.vapid.sign(claims))
+            self._cabeceras[aud] = cacheadas
+        return dict(cacheadas[1])
+
+
+class ResultadoEnvio:
+    """Resultado de enviar una notificación a una suscripción"""
+
+    __slots__ = ('suscripcion', 'estado', 'error', 'duracion', 'intentos')
+
+    def __init__(self, suscripcion, estado=None, error=None, duracion=0.0, intentos=1):
+        self.suscripcion = suscripcion
+        self.estado = estado        # código HTTP del servicio push (None si no hubo respuesta)
+        self.error = error
+        self.duracion = duracion
+        self.intentos = intentos
+
+    @property
+    def ok(self):
+        return self.estado is not None and self.estado <= 202
+
+    @property
+    def caducada(self):
+        return self.estado in ESTADOS_CADUCADA
+
+
+class ResumenEnvio:
+    """Resultados de un envío masivo y su rendimiento"""
+
+    def __init__(self, resultados, duracion):
+        self.resultados = resultados
+        self.duracion = duracion
+
+    @property
+    def enviadas(self):
+        return sum(1 for resultado in self.resultados if resultado.ok)
+
+    @property
+    def fallidas(self):
+        return len(self.resultados) - self.enviadas
+
+    @property
+    def caducadas(self):
+        """Suscripciones que el servicio push ya no reconoce (404/410)"""
+        return [resultado.suscripcion for resultado in self.resultados if resultado.caducada]
+
+    @property
+    def reintentos(self):
+        return sum(resultado.intentos - 1 for resultado in self.resultados)
+
+    @property
+    def por_segundo(self):
+        return len(self.resultados) / self.duracion if self.duracion else 0.0
+
+
+def espera_reintento(intento, retry_after=None, base=BACKOFF_BASE):
+    """
+    Segundos a esperar antes del reintento número 'intento' (desde 1): lo que pida
+    la cabecera Retry-After (segundos o fecha HTTP) o, si no hay, backoff
+    exponencial con jitter. Nunca más de BACKOFF_MAXIMO.
+    """
+    if retry_after:
+        try:
+            espera = float(retry_after)
+        except ValueError:
+            try:
+                espera = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                espera = None
+        if espera is not None:
+            return min(max(espera, 0.0), BACKOFF_MAXIMO)
+    return min(base * 2 ** (intento - 1) * random.uniform(0.5, 1.5), BACKOFF_MAXIMO)
+
+
+async def _enviar(session, semaforo, vapid, suscripcion, datos, timeout, reintentos, backoff):
+    subscription_info = {
+        "endpoint": suscripcion.endpoint,
+        "keys": {"p256dh": suscripcion.p256dh, "auth": suscripcion.auth},
+    }
+    inicio = time.perf_counter()
+    intento = 1
+    while True:
+        # La espera entre reintentos se hace fuera del semáforo para no bloquear otros envíos
+        async with semaforo:
+            try:
+                response = await WebPusher(subscription_info, aiohttp_session=session).send_async(
+                    datos,
+                    vapid.cabeceras(suscripcion.endpoint),
+                    ttl=TTL,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                )
+            except asyncio.TimeoutError:
+                return ResultadoEnvio(suscripcion, error='timeout', duracion=time.perf_counter() - inicio, intentos=intento)
+            except Exception as e:
+                return ResultadoEnvio(
+                    suscripcion, error=str(e) or type(e).__name__,
+                    duracion=time.perf_counter() - inicio, intentos=intento,
+                )
+
+        reintentable = response.status == 429 or response.status >= 500
+        if not reintentable or intento > reintentos:
+            error = None if response.status <= 202 else response.reason
+            return ResultadoEnvio(suscripcion, response.status, error, time.perf_counter() - inicio, intento)
+
+        await asyncio.sleep(espera_reintento(intento, response.headers.get('Retry-After'), backoff))
+        intento += 1
+
+
+async def _enviar_todas(envios, vapid, concurrencia, timeout, reintentos, backoff):
+    semaforo = asyncio.Semaphore(concurrencia)
+    conector = aiohttp.TCPConnector(limit=concurrencia)
+    async with aiohttp.ClientSession(connector=conector) as session:
+        return await asyncio.gather(*(
+            _enviar(session, semaforo, vapid, suscripcion, json.dumps(mensaje), timeout, reintentos, backoff)
+            for suscripcion, mensaje in envios
+        ))
+
+
+def enviar_notificaciones(envios, vapid=None, concurrencia=CONCURRENCIA, timeout=TIMEOUT,
+                          reintentos=REINTENTOS, backoff=None):
+    """
+    Envía en paralelo los (suscripcion, mensaje) de 'envios', que puede ser un
+    iterador: se consume por tandas de TANDA_ENVIOS, fuera del bucle de eventos
+    (puede leer de la base de datos) y sin cargarlo entero en memoria.
+    Nunca lanza por un endpoint concreto: cada fallo queda en su ResultadoEnvio.
+    Las respuestas 429 y 5xx se reintentan hasta 'reintentos' veces.
+    """
+    backoff = BACKOFF_BASE if backoff is None else backoff
+    inicio = time.perf_counter()
+    resultados = []
+    envios = iter(envios)
+    while tanda := list(itertools.islice(envios, TANDA_ENVIOS)):
+        vapid = vapid or CredencialesVapid()
+        resultados.extend(asyncio.run(_enviar_todas(tanda, vapid, concurrencia, timeout, reintentos, backoff)))
+    return ResumenEnvio(resultados, time.perf_counter() - inicio)
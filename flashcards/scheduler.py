@@ -0,0 +1,327 @@
+"""
+Núcleo del planificador de tres fases (SM-2), sin dependencias de Django.
+
+Las funciones trabajan sobre cualquier objeto con los atributos de programación
+de una tarjeta (EstadoTarjeta o el propio modelo Card) y nunca tocan la base de
+datos, de modo que el algoritmo se puede probar y simular sin ORM.
+'utils.update_card' es el adaptador que lo persiste.
+"""
+from datetime import datetime, timedelta
+
+
+# Intervalos para cada fase (en segundos)
+INTERVALOS_FASE_1 = [5, 25, 120, 600]  # 5s, 25s, 2min, 10min
+INTERVALOS_FASE_2 = [86400, 259200, 604800, 1209600]  # 1d, 3d, 7d, 14d
+
+INTERVALO_FASE_3_INICIAL = 2592000  # 30 días
+
+# Revisiones consideradas para el tiempo promedio en la promoción de Fase 1
+VENTANA_TIEMPOS = 3
+
+
+def ajustar_calificacion_por_tiempo(calificacion_base, tiempo_respuesta):
+    """
+    Ajusta la calificación base según el tiempo de respuesta
+    
+    Calificación base (0-5):
+    5 = Perfecto, respuesta inmediata
+    4 = Correcta con ligera vacilación
+    3 = Correcta con esfuerzo
+    2 = Incorrecta, pero algo recordada
+    1 = Incorrecta, sin recuerdo
+    0 = Olvido total
+    
+    Ajuste por tiempo:
+    0-3s: +0
+    3-6s: -0.5
+    6-10s: -1
+    >10s: -2
+    """
+
+    """
+    De momento no voy a realizar el ajuste de calificacion por tiempo, queda para implementaciones futuras
+    """
+
+    """
+    if tiempo_respuesta <= 3:
+        ajuste = 0
+    elif tiempo_respuesta <= 6:
+        ajuste = -0.5
+    elif tiempo_respuesta <= 10:
+        ajuste = -1
+    else:
+        ajuste = -2
+    """
+
+    ajuste = 0
+    
+    calificacion_ajustada = max(0, min(5, calificacion_base + ajuste))
+    return calificacion_ajustada
+
+
+def calcular_nuevo_EF(EF_actual, calificacion_ajustada):
+    """
+    Calcula el nuevo factor de facilidad según SM-2
+    EF' = EF + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    donde q es la calificación (0-5)
+    """
+    nuevo_EF = EF_actual + (0.1 - (5 - calificacion_ajustada) * (0.08 + (5 - calificacion_ajustada) * 0.02))
+    # EF mínimo es 1.3
+    return max(1.3, nuevo_EF)
+
+
+def calcular_siguiente_intervalo_fase_1(card, es_correcto):
+    """
+    Calcula el siguiente intervalo para Fase 1 (Aprendizaje Intensivo)
+    """
+    if not es_correcto:
+        # Si falla, vuelve al primer intervalo
+        return INTERVALOS_FASE_1[0]
+    
+    # Buscar índice actual
+    try:
+        indice_actual = INTERVALOS_FASE_1.index(int(card.intervalo_actual))
+    except ValueError:
+        indice_actual = 0
+    
+    # Avanzar al siguiente intervalo
+    indice_siguiente = min(indice_actual + 1, len(INTERVALOS_FASE_1) - 1)
+    return INTERVALOS_FASE_1[indice_siguiente]
+
+
+def calcular_siguiente_intervalo_fase_2(card, calificacion_ajustada):
+    """
+    Calcula el siguiente intervalo para Fase 2 (Consolidación)
+    Usa intervalos predefinidos pero considera la calificación
+    """
+    if calificacion_ajustada < 3:
+        # Si falla, retrocede a Fase 1
+        return None  # Indicador para retroceder
+    
+    # Buscar índice actual en intervalos de Fase 2
+    try:
+        indice_actual = INTERVALOS_FASE_2.index(int(card.intervalo_actual))
+    except ValueError:
+        # Si no está en la lista, empezar desde el principio
+        return INTERVALOS_FASE_2[0]
+    
+    # Avanzar al siguiente intervalo
+    if indice_actual < len(INTERVALOS_FASE_2) - 1:
+        return INTERVALOS_FASE_2[indice_actual + 1]
+    else:
+        # Si completó todos los intervalos, usar SM-2 para calcular
+        return card.intervalo_actual * card.EF
+
+
+def calcular_siguiente_intervalo_fase_3(card):
+    """
+    Calcula el siguiente intervalo para Fase 3 (Mantenimiento)
+    Usa el algoritmo SM-2 completo
+    """
+    return card.intervalo_actual * card.EF
+
+
+def verificar_promocion_fase_1_a_2(card):
+    """
+    Verifica si la tarjeta puede promocionar de Fase 1 a Fase 2
+    Condiciones:
+    - 3 aciertos consecutivos
+    - Tiempo promedio < 4 segundos
+    - Completó al menos el intervalo de 10 minutos
+    """
+    if card.contador_aciertos >= 3 and card.intervalo_actual >= 600:
+        # Tiempo promedio de las últimas 3 revisiones, guardadas en la propia tarjeta
+        tiempos = card.tiempos_recientes
+        if len(tiempos) >= VENTANA_TIEMPOS:
+            tiempo_promedio = sum(tiempos) / VENTANA_TIEMPOS
+            if tiempo_promedio < 4:
+                return True
+    return False
+
+
+def verificar_promocion_fase_2_a_3(card):
+    """
+    Verifica si la tarjeta puede promocionar de Fase 2 a Fase 3
+    Condiciones:
+    - Completó 3-5 intervalos sin fallos
+    - Está en el último intervalo de Fase 2 o más
+    """
+    if card.contador_aciertos >= 3 and card.intervalo_actual >= INTERVALOS_FASE_2[-1]:
+        return True
+    return False
+
+
+def aplicar_transicion_fase(card, calificacion_ajustada):
+    """
+    Aplica las transiciones entre fases según el rendimiento
+    """
+    fase_anterior = card.fase
+    
+    if card.fase == 1:
+        # Verificar promoción a Fase 2
+        if verificar_promocion_fase_1_a_2(card):
+            card.fase = 2
+            card.estado = 'consolidacion'
+            card.intervalo_actual = INTERVALOS_FASE_2[0]  # Empezar con 1 día
+            card.contador_aciertos = 0  # Resetear contador
+    
+    elif card.fase == 2:
+        # Verificar retroceso a Fase 1
+        if calificacion_ajustada < 3 or (calificacion_ajustada < 4 and card.tiempo_respuesta > 10):
+            card.fase = 1
+            card.estado = 'aprendizaje'
+            card.intervalo_actual = INTERVALOS_FASE_1[0]
+            card.contador_aciertos = 0
+        # Verificar promoción a Fase 3
+        elif verificar_promocion_fase_2_a_3(card):
+            card.fase = 3
+            card.estado = 'maduro'
+            card.intervalo_actual = INTERVALO_FASE_3_INICIAL
+            card.contador_aciertos = 0
+    
+    elif card.fase == 3:
+        # Verificar retroceso a Fase 2
+        if calificacion_ajustada < 3:
+            card.fase = 2
+            card.estado = 'consolidacion'
+            card.intervalo_actual = INTERVALOS_FASE_2[0]
+            card.contador_aciertos = 0
+    
+    return fase_anterior
+
+
+class EstadoTarjeta:
+    """Estado de programación de una tarjeta, sin ORM"""
+    
+    __slots__ = (
+        'estado', 'fase', 'intervalo_actual', 'EF',
+        'contador_aciertos', 'contador_fallos',
+        'tiempo_respuesta', 'calificacion_ajustada', 'tiempos_recientes',
+        'ultima_repeticion', 'siguiente_repeticion',
+    )
+    
+    def __init__(self, estado='nuevo', fase=1, intervalo_actual=5.0, EF=2.5,
+                 contador_aciertos=0, contador_fallos=0, tiempo_respuesta=0.0,
+                 calificacion_ajustada=0.0, tiempos_recientes=(),
+                 ultima_repeticion=None, siguiente_repeticion=None):
+        self.estado = estado
+        self.fase = fase
+        self.intervalo_actual = intervalo_actual
+        self.EF = EF
+        self.contador_aciertos = contador_aciertos
+        self.contador_fallos = contador_fallos
+        self.tiempo_respuesta = tiempo_respuesta
+        self.calificacion_ajustada = calificacion_ajustada
+        self.tiempos_recientes = list(tiempos_recientes)
+        self.ultima_repeticion = ultima_repeticion
+        self.siguiente_repeticion = siguiente_repeticion
+    
+    def __repr__(self):
+        return (
+            f"EstadoTarjeta(fase={self.fase}, estado={self.estado!r}, "
+            f"intervalo={self.intervalo_actual}, EF={self.EF:.2f})"
+        )
+    
+    @classmethod
+    def desde_tarjeta(cls, card):
+        """Copia el estado de programación de una tarjeta (o de otro estado)"""
+        return cls(**{campo: getattr(card, campo) for campo in cls.__slots__})
+    
+    def aplicar_a(self, card):
+        """Vuelca este estado sobre una tarjeta"""
+        for campo in self.__slots__:
+            setattr(card, campo, getattr(self, campo))
+
+
+class RegistroRepaso:
+    """Datos de una revisión, equivalentes a un ReviewLog"""
+    
+    __slots__ = ('fecha', 'calificacion_base', 'tiempo_respuesta', 'calificacion_ajustada', 'fase_antes', 'fase_despues')
+    
+    def __init__(self, fecha, calificacion_base, tiempo_respuesta, calificacion_ajustada, fase_antes, fase_despues):
+        self.fecha = fecha
+        self.calificacion_base = calificacion_base
+        self.tiempo_respuesta = tiempo_respuesta
+        self.calificacion_ajustada = calificacion_ajustada
+        self.fase_antes = fase_antes
+        self.fase_despues = fase_despues
+
+
+def sumar_segundos(momento, segundos):
+    """Suma segundos a un datetime o a un reloj numérico (segundos) de una simulación"""
+    if isinstance(momento, datetime):
+        return momento + timedelta(seconds=segundos)
+    return momento + segundos
+
+
+def programar(estado, calificacion_base, tiempo_respuesta, ahora):
+    """
+    Aplica una respuesta al estado de una tarjeta.
+    No modifica 'estado': devuelve (nuevo_estado, registro).
+    'ahora' puede ser un datetime o un número de segundos.
+    """
+    estado = EstadoTarjeta.desde_tarjeta(estado)
+    
+    # 1. Ajustar calificación por tiempo
+    calificacion_ajustada = ajustar_calificacion_por_tiempo(calificacion_base, tiempo_respuesta)
+    
+    # 2. Actualizar EF solo si la calificación es >= 3
+    if calificacion_ajustada >= 3:
+        estado.EF = calcular_nuevo_EF(estado.EF, calificacion_ajustada)
+    
+    # 3. Actualizar contadores
+    if calificacion_ajustada >= 4:
+        estado.contador_aciertos += 1
+        estado.contador_fallos = 0  # Resetear fallos
+    else:
+        estado.contador_fallos += 1
+        estado.contador_aciertos = 0  # Resetear aciertos
+    
+    # 4. Guardar datos de la última respuesta
+    estado.tiempo_respuesta = tiempo_respuesta
+    estado.calificacion_ajustada = calificacion_ajustada
+    estado.tiempos_recientes = (estado.tiempos_recientes + [tiempo_respuesta])[-VENTANA_TIEMPOS:]
+    estado.ultima_repeticion = ahora
+    
+    # 5. Aplicar transiciones de fase
+    fase_anterior = aplicar_transicion_fase(estado, calificacion_ajustada)
+    
+    # Si cambió de fase, no recalcular el intervalo en esta misma llamada
+    if estado.fase == fase_anterior:
+        # 6. Calcular siguiente intervalo según la fase
+        nuevo_intervalo = None
+        
+        if estado.fase == 1:
+            es_correcto = calificacion_ajustada >= 4
+            nuevo_intervalo = calcular_siguiente_intervalo_fase_1(estado, es_correcto)
+        
+        elif estado.fase == 2:
+            nuevo_intervalo = calcular_siguiente_intervalo_fase_2(estado, calificacion_ajustada)
+            if nuevo_intervalo is None:
+                # Retroceder a Fase 1
+                estado.fase = 1
+                estado.estado = 'aprendizaje'
+                nuevo_intervalo = INTERVALOS_FASE_1[0]
+                estado.contador_aciertos = 0
+        
+        elif estado.fase == 3:
+            nuevo_intervalo = calcular_siguiente_intervalo_fase_3(estado)
+        
+        # 7. Actualizar intervalo
+        estado.intervalo_actual = nuevo_intervalo
+        
+        # 8. Cambiar estado si es necesario
+        if estado.estado == 'nuevo':
+            estado.estado = 'aprendizaje'
+    
+    estado.siguiente_repeticion = sumar_segundos(ahora, estado.intervalo_actual)
+    
+    registro = RegistroRepaso(
+        fecha=ahora,
+        calificacion_base=calificacion_base,
+        tiempo_respuesta=tiempo_respuesta,
+        calificacion_ajustada=calificacion_ajustada,
+        fase_antes=fase_anterior,
+        fase_despues=estado.fase,
+    )
+    return estado, registro
@@ -0,0 +1,71 @@
+"""
+Búsqueda de tarjetas por texto.
+
+En SQLite se usa un índice FTS5 ('flashcards_card_fts') sobre el frente y el
+reverso, mantenido por triggers creados en la migración 0010: así se sincroniza
+también con bulk_create, update() y los INSERT en crudo de llenar_datos. Los
+resultados se ordenan por relevancia (bm25, con más peso para el frente).
+
+Si la base de datos no es SQLite o no tiene el índice, se recurre a icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+TABLA_FTS = 'flashcards_card_fts'
+# Pesos de bm25 para (frente, reverso)
+PESO_FRENTE = 2.0
+PESO_REVERSO = 1.0
+
+
+def fts_disponible():
+    """True si la base de datos tiene el índice FTS5 de tarjetas"""
+    return connection.vendor == 'sqlite' and TABLA_FTS in connection.introspection.table_names()
+
+
+def expresion_fts(texto):
+    """
+    Convierte el texto del usuario en una consulta FTS5 segura: cada palabra
+    entre comillas y como prefijo ("capi"* encuentra "capital"). Las palabras se
+    combinan con AND. Devuelve None si el texto no tiene palabras.
+    """
+    palabras = re.findall(r'\w+', texto)
+    if not palabras:
+        return None
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def buscar_tarjetas(tarjetas, texto):
+    """
+    Filtra el queryset de tarjetas por el texto y lo anota con 'rango'
+    (menor es más relevante). No cambia el orden: para ordenar por relevancia,
+    order_by('rango', '-id').
+    """
+    expresion = expresion_fts(texto) if fts_disponible() else None
+    if expresion is None:
+        return tarjetas.filter(
+            Q(frente__icontains=texto) | Q(reverso__icontains=texto)
+        ).annotate(rango=Value(0.0, output_field=FloatField()))
+
+    # Un solo recorrido: el MATCH se une a las tarjetas por rowid y bm25 se lee de
+    # esa misma fila (una subconsulta por tarjeta repetiría el MATCH en cada una)
+    tabla = tarjetas.model._meta.db_table
+    return tarjetas.extra(
+        tables=[TABLA_FTS],
+        where=[f'{TABLA_FTS} MATCH %s', f'{TABLA_FTS}.rowid = {tabla}.id'],
+        params=[expresion],
+    ).annotate(rango=RawSQL(
+        f'bm25({TABLA_FTS}, %s, %s)', (PESO_FRENTE, PESO_REVERSO), output_field=FloatField(),
+    ))
+
+
+def reconstruir_indice():
+    """Reconstruye el índice FTS5 desde la tabla de tarjetas y lo compacta"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {TABLA_FTS}')
+        return cursor.fetchone()[0]
@@ -1,11 +1,12 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserSettings
+from .models import UserSettings, UserCardStats
 
 
 @receiver(post_save, sender=User)
 def crear_user_settings(sender, instance, created, **kwargs):
-    """Crea automáticamente UserSettings cuando se crea un usuario"""
+    """Crea automáticamente UserSettings y UserCardStats cuando se crea un usuario"""
     if created:
         UserSettings.objects.create(usuario=instance)
+        UserCardStats.objects.create(usuario=instance)
@@ -0,0 +1,268 @@
+"""
+Simulador vectorizado del planificador de tres fases.
+
+Aplica las mismas reglas que scheduler.programar, pero sobre arrays de NumPy
+con miles de tarjetas a la vez, para estimar la carga diaria de repasos de un
+usuario durante meses de tiempo virtual. El reloj es numérico (segundos desde
+el inicio de la simulación) y no se usa la base de datos.
+"""
+import numpy as np
+
+from .scheduler import (
+    INTERVALOS_FASE_1,
+    INTERVALOS_FASE_2,
+    INTERVALO_FASE_3_INICIAL,
+    VENTANA_TIEMPOS,
+)
+
+
+DIA = 86400
+
+# Códigos de estado en los arrays
+ESTADOS = ['nuevo', 'aprendizaje', 'consolidacion', 'maduro']
+NUEVO, APRENDIZAJE, CONSOLIDACION, MADURO = range(len(ESTADOS))
+
+_FASE_1 = np.array(INTERVALOS_FASE_1, dtype=np.int64)
+_FASE_2 = np.array(INTERVALOS_FASE_2, dtype=np.int64)
+
+# Modelo de memoria: probabilidad de recordar = exp(-transcurrido / estabilidad)
+ESTABILIDAD_INICIAL = 5 * DIA   # estabilidad media de una tarjeta recién aprendida
+CRECIMIENTO_ESTABILIDAD = 3.0   # cuánto crece al recordar, según lo olvidada que estaba
+FACTOR_OLVIDO = 0.5             # cuánto se reduce al fallar (sin bajar de la inicial de la tarjeta)
+# Calificaciones 5, 4 y 3 cuando se recuerda (al olvidar: 0, 1 o 2 al azar)
+PROB_CALIFICACIONES_ACIERTO = [0.6, 0.3, 0.1]
+# Tiempos de respuesta log-normales: mediana en segundos y dispersión
+MEDIANA_TIEMPO_ACIERTO = 2.5
+MEDIANA_TIEMPO_FALLO = 8.0
+DISPERSION_TIEMPO = 0.5
+
+HORA_SESION = 9 * 3600          # el usuario empieza a repasar a las 9:00
+MAX_RONDAS_POR_DIA = 1000
+
+
+class Mazo:
+    """Estado de programación de N tarjetas, un array por campo de Card"""
+
+    def __init__(self, n):
+        self.estado = np.full(n, NUEVO, dtype=np.int8)
+        self.fase = np.ones(n, dtype=np.int8)
+        self.intervalo_actual = np.full(n, 5.0)
+        self.EF = np.full(n, 2.5)
+        self.contador_aciertos = np.zeros(n, dtype=np.int64)
+        self.contador_fallos = np.zeros(n, dtype=np.int64)
+        self.tiempo_respuesta = np.zeros(n)
+        self.calificacion_ajustada = np.zeros(n)
+        # Últimos tiempos de respuesta (el más reciente al final) y cuántos hay
+        self.tiempos_recientes = np.zeros((n, VENTANA_TIEMPOS))
+        self.num_tiempos = np.zeros(n, dtype=np.int64)
+        self.ultima_repeticion = np.zeros(n)
+        self.siguiente_repeticion = np.zeros(n)
+
+    def __len__(self):
+        return len(self.estado)
+
+
+def ajustar_calificaciones(calificacion_base, tiempo_respuesta):
+    """
+    Versión vectorizada de scheduler.ajustar_calificacion_por_tiempo,
+    que de momento no aplica ajuste por tiempo
+    """
+    return np.clip(calificacion_base, 0, 5).astype(float)
+
+
+def _indice_en(intervalos, tabla):
+    """Posición de int(intervalo) en 'tabla' y si estaba (como list.index)"""
+    # Recortar antes de convertir: los intervalos de Fase 3 pueden crecer sin límite
+    enteros = np.minimum(intervalos, tabla[-1] + 1).astype(np.int64)
+    coincide = enteros[:, None] == tabla[None, :]
+    return coincide.argmax(axis=1), coincide.any(axis=1)
+
+
+def repasar(mazo, indices, calificacion_base, tiempo_respuesta, ahora):
+    """
+    Aplica una respuesta a cada tarjeta de 'indices', igual que scheduler.programar.
+    'calificacion_base', 'tiempo_respuesta' y 'ahora' son arrays alineados con 'indices'.
+    Devuelve la fase de cada tarjeta antes del repaso.
+    """
+    estado = mazo.estado[indices]
+    fase = mazo.fase[indices]
+    intervalo = mazo.intervalo_actual[indices]
+    EF = mazo.EF[indices]
+    aciertos = mazo.contador_aciertos[indices]
+    fallos = mazo.contador_fallos[indices]
+    tiempos = mazo.tiempos_recientes[indices]
+    num_tiempos = mazo.num_tiempos[indices]
+
+    # 1. Ajustar calificación por tiempo
+    q = ajustar_calificaciones(calificacion_base, tiempo_respuesta)
+
+    # 2. Actualizar EF solo si la calificación es >= 3
+    EF = np.where(q >= 3, np.maximum(1.3, EF + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))), EF)
+
+    # 3. Actualizar contadores
+    correcto = q >= 4
+    aciertos = np.where(correcto, aciertos + 1, 0)
+    fallos = np.where(correcto, 0, fallos + 1)
+
+    # 4. Ventana de tiempos recientes
+    tiempos = np.concatenate([tiempos[:, 1:], tiempo_respuesta[:, None]], axis=1)
+    num_tiempos = np.minimum(num_tiempos + 1, VENTANA_TIEMPOS)
+
+    # 5. Transiciones de fase (las condiciones se evalúan sobre la fase de partida)
+    fase_anterior = fase.copy()
+    promocion_1 = (
+        (fase_anterior == 1) & (aciertos >= 3) & (intervalo >= 600)
+        & (num_tiempos >= VENTANA_TIEMPOS) & (tiempos.mean(axis=1) < 4)
+    )
+    retroceso_2 = (fase_anterior == 2) & ((q < 3) | ((q < 4) & (tiempo_respuesta > 10)))
+    promocion_2 = (fase_anterior == 2) & ~retroceso_2 & (aciertos >= 3) & (intervalo >= INTERVALOS_FASE_2[-1])
+    retroceso_3 = (fase_anterior == 3) & (q < 3)
+
+    for mascara, nueva_fase, nuevo_estado, nuevo_intervalo in (
+        (promocion_1, 2, CONSOLIDACION, INTERVALOS_FASE_2[0]),
+        (retroceso_2, 1, APRENDIZAJE, INTERVALOS_FASE_1[0]),
+        (promocion_2, 3, MADURO, INTERVALO_FASE_3_INICIAL),
+        (retroceso_3, 2, CONSOLIDACION, INTERVALOS_FASE_2[0]),
+    ):
+        fase = np.where(mascara, nueva_fase, fase)
+        estado = np.where(mascara, nuevo_estado, estado)
+        intervalo = np.where(mascara, nuevo_intervalo, intervalo)
+        aciertos = np.where(mascara, 0, aciertos)
+
+    # 6. Siguiente intervalo según la fase, solo si no cambió de fase
+    sin_cambio = fase == fase_anterior
+    nuevo_intervalo = intervalo.copy()
+
+    en_fase_1 = sin_cambio & (fase == 1)
+    indice, _ = _indice_en(intervalo, _FASE_1)
+    siguiente_1 = _FASE_1[np.minimum(indice + 1, len(_FASE_1) - 1)]
+    nuevo_intervalo = np.where(en_fase_1, np.where(correcto, siguiente_1, INTERVALOS_FASE_1[0]), nuevo_intervalo)
+
+    en_fase_2 = sin_cambio & (fase == 2)
+    indice, encontrado = _indice_en(intervalo, _FASE_2)
+    siguiente_2 = np.where(
+        ~encontrado, INTERVALOS_FASE_2[0],
+        np.where(indice < len(_FASE_2) - 1, _FASE_2[np.minimum(indice + 1, len(_FASE_2) - 1)], intervalo * EF),
+    )
+    nuevo_intervalo = np.where(en_fase_2, siguiente_2, nuevo_intervalo)
+    # Fallo en Fase 2 sin transición previa: retroceder a Fase 1
+    vuelve_a_1 = en_fase_2 & (q < 3)
+    nuevo_intervalo = np.where(vuelve_a_1, INTERVALOS_FASE_1[0], nuevo_intervalo)
+    fase = np.where(vuelve_a_1, 1, fase)
+    estado = np.where(vuelve_a_1, APRENDIZAJE, estado)
+    aciertos = np.where(vuelve_a_1, 0, aciertos)
+
+    en_fase_3 = sin_cambio & (fase == 3)
+    nuevo_intervalo = np.where(en_fase_3, intervalo * EF, nuevo_intervalo)
+
+    intervalo = np.where(sin_cambio, nuevo_intervalo, intervalo)
+    estado = np.where(sin_cambio & (estado == NUEVO), APRENDIZAJE, estado)
+
+    mazo.estado[indices] = estado
+    mazo.fase[indices] = fase
+    mazo.intervalo_actual[indices] = intervalo
+    mazo.EF[indices] = EF
+    mazo.contador_aciertos[indices] = aciertos
+    mazo.contador_fallos[indices] = fallos
+    mazo.tiempo_respuesta[indices] = tiempo_respuesta
+    mazo.calificacion_ajustada[indices] = q
+    mazo.tiempos_recientes[indices] = tiempos
+    mazo.num_tiempos[indices] = num_tiempos
+    mazo.ultima_repeticion[indices] = ahora
+    mazo.siguiente_repeticion[indices] = ahora + intervalo
+    return fase_anterior
+
+
+class ResultadoSimulacion:
+    """Métricas diarias de una simulación"""
+
+    def __init__(self, dias):
+        self.repasos = np.zeros(dias, dtype=np.int64)          # respuestas dadas
+        self.tarjetas = np.zeros(dias, dtype=np.int64)         # tarjetas distintas repasadas
+        self.recordadas = np.zeros(dias, dtype=np.int64)       # respuestas con recuerdo
+        self.repasos_largos = np.zeros(dias, dtype=np.int64)   # respuestas en Fase 2 o 3
+        self.recordadas_largos = np.zeros(dias, dtype=np.int64)
+        self.nuevas = np.zeros(dias, dtype=np.int64)
+        self.fases = np.zeros((dias, 4), dtype=np.int64)       # [sin empezar, fase 1, 2, 3] al cerrar el día
+
+    @property
+    def retencion(self):
+        """Proporción de repasos de Fase 2 y 3 en los que se recordó la tarjeta"""
+        total = self.repasos_largos.sum()
+        return self.recordadas_largos.sum() / total if total else float('nan')
+
+
+def simular(num_tarjetas, dias, nuevas_por_dia=10, semilla=None):
+    """
+    Simula a un usuario que cada día introduce 'nuevas_por_dia' tarjetas y repasa
+    todas las vencidas. La sesión empieza a HORA_SESION: lo vencido antes se
+    repasa al empezar y lo que vence durante el día (p. ej. los intervalos de
+    segundos de la Fase 1), en su momento. Lo que vence después de medianoche
+    pasa al día siguiente.
+    """
+    rng = np.random.default_rng(semilla)
+    mazo = Mazo(num_tarjetas)
+    activas = np.zeros(num_tarjetas, dtype=bool)
+    # Cada tarjeta tiene su propia dificultad: escala su estabilidad inicial
+    estabilidad_inicial = ESTABILIDAD_INICIAL * rng.lognormal(0, 0.5, num_tarjetas)
+    estabilidad = estabilidad_inicial.copy()
+    resultado = ResultadoSimulacion(dias)
+    introducidas = 0
+
+    for dia in range(dias):
+        inicio = dia * DIA + HORA_SESION
+        fin = (dia + 1) * DIA
+
+        # Tarjetas nuevas del día
+        nuevas = np.arange(introducidas, min(introducidas + nuevas_por_dia, num_tarjetas))
+        activas[nuevas] = True
+        mazo.siguiente_repeticion[nuevas] = inicio
+        mazo.ultima_repeticion[nuevas] = inicio
+        introducidas += len(nuevas)
+        resultado.nuevas[dia] = len(nuevas)
+
+        repasadas = np.zeros(num_tarjetas, dtype=bool)
+        for _ in range(MAX_RONDAS_POR_DIA):
+            indices = np.flatnonzero(activas & (mazo.siguiente_repeticion < fin))
+            if len(indices) == 0:
+                break
+
+            ahora = np.maximum(mazo.siguiente_repeticion[indices], inicio)
+            transcurrido = ahora - mazo.ultima_repeticion[indices]
+            prob = np.exp(-transcurrido / estabilidad[indices])
+            recuerda = rng.random(len(indices)) < prob
+
+            calificacion = np.where(
+                recuerda,
+                rng.choice([5, 4, 3], size=len(indices), p=PROB_CALIFICACIONES_ACIERTO),
+                rng.integers(0, 3, size=len(indices)),
+            )
+            mediana = np.where(recuerda, MEDIANA_TIEMPO_ACIERTO, MEDIANA_TIEMPO_FALLO)
+            tiempo = mediana * rng.lognormal(0, DISPERSION_TIEMPO, len(indices))
+
+            fase_anterior = repasar(mazo, indices, calificacion, tiempo, ahora)
+
+            # La estabilidad crece más cuanto más olvidada estaba la tarjeta;
+            # tras un fallo se vuelve a aprender, como mínimo hasta la inicial
+            estabilidad[indices] = np.where(
+                recuerda,
+                estabilidad[indices] * (1 + CRECIMIENTO_ESTABILIDAD * (1 - prob)),
+                np.maximum(estabilidad[indices] * FACTOR_OLVIDO, estabilidad_inicial[indices]),
+            )
+
+            largos = fase_anterior >= 2
+            resultado.repasos[dia] += len(indices)
+            resultado.recordadas[dia] += recuerda.sum()
+            resultado.repasos_largos[dia] += largos.sum()
+            resultado.recordadas_largos[dia] += (recuerda & largos).sum()
+            repasadas[indices] = True
+
+        resultado.tarjetas[dia] = repasadas.sum()
+        resultado.fases[dia] = [
+            num_tarjetas - activas.sum(),
+            (activas & (mazo.fase == 1)).sum(),
+            (mazo.fase == 2).sum(),
+            (mazo.fase == 3).sum(),
+        ]
+
+    return mazo, resultado
@@ -1,11 +1,24 @@
-const CACHE_NAME = 'rufingo-v4';
+const CACHE_NAME = 'rufingo-v6';
 const urlsToCache = [
   '/',
   '/static/manifest.json'
 ];
+
+// Repaso sin conexión
+const URL_COLA = '/api/repaso/cola/';
+const URL_RESPUESTA = '/api/respuesta/';
+const URL_RESPUESTAS_LOTE = '/api/respuestas/';
+const URL_STREAM_PENDIENTES = '/api/tarjetas_pendientes/stream/';
+const TAMANO_PREFETCH = 100;      // tarjetas que se guardan para repasar sin conexión
+const TAMANO_REENVIO = 200;       // respuestas por petición al reenviar (el servidor acepta 500)
+const RESULTADOS_DEFINITIVOS = new Set(['aplicada', 'duplicada', 'no_encontrada', 'invalida']);
+const SYNC_TAG = 'rufingo-respuestas';
+const DB_NAME = 'rufingo';
+const DB_VERSION = 1;
+
 // Instalación del Service Worker
 self.addEventListener('install', event => {
- self.skipWaiting(); 
+ self.skipWaiting();
   event.waitUntil(
     caches.open(CACHE_NAME)
       .then(cache => cache.addAll(urlsToCache))
@@ -28,6 +41,30 @@ self.addEventListener('activate', event => {
 });
 // Interceptar peticiones
 self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+
+  if (url.pathname === URL_COLA && event.request.method === 'GET') {
+    event.respondWith(obtenerCola(event.request));
+    return;
+  }
+
+  if (url.pathname === URL_RESPUESTA && event.request.method === 'POST') {
+    event.respondWith(enviarRespuesta(event.request));
+    return;
+  }
+
+  // Solo las peticiones GET se pueden guardar en la caché
+  if (event.request.method !== 'GET') {
+    return;
+  }
+
+  // Los streams SSE no terminan nunca: el clon para la caché se quedaría
+  // acumulando el cuerpo mientras la conexión siga abierta
+  if (url.pathname === URL_STREAM_PENDIENTES ||
+      (event.request.headers.get('Accept') || '').includes('text/event-stream')) {
+    return;
+  }
+
   event.respondWith(
     fetch(event.request)
       .then(response => {
@@ -39,6 +76,233 @@ self.addEventListener('fetch', event => {
   );
 });
 
+// ---------------------------------------------------------------------------
+// IndexedDB: 'cola' guarda las tarjetas vencidas precargadas y 'respuestas'
+// las respuestas dadas sin conexión, pendientes de enviar al servidor
+// ---------------------------------------------------------------------------
+
+function abrirDB() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(DB_NAME, DB_VERSION);
+    request.onupgradeneeded = () => {
+      const db = request.result;
+      if (!db.objectStoreNames.contains('cola')) {
+        db.createObjectStore('cola', { keyPath: 'id' });
+      }
+      if (!db.objectStoreNames.contains('respuestas')) {
+        db.createObjectStore('respuestas', { autoIncrement: true });
+      }
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+// Ejecuta 'operacion(store)' en una transacción y resuelve al completarse
+async function conStore(nombre, modo, operacion) {
+  const db = await abrirDB();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(nombre, modo);
+    let resultado;
+    const request = operacion(tx.objectStore(nombre));
+    if (request) {
+      request.onsuccess = () => { resultado = request.result; };
+    }
+    tx.oncomplete = () => { db.close(); resolve(resultado); };
+    tx.onerror = () => { db.close(); reject(tx.error); };
+    tx.onabort = () => { db.close(); reject(tx.error); };
+  });
+}
+
+function guardarTarjetas(tarjetas) {
+  return conStore('cola', 'readwrite', store => {
+    tarjetas.forEach(tarjeta => store.put(tarjeta));
+  });
+}
+
+function quitarTarjeta(cardId) {
+  return conStore('cola', 'readwrite', store => store.delete(cardId));
+}
+
+function leerTarjetas() {
+  return conStore('cola', 'readonly', store => store.getAll());
+}
+
+function encolarRespuesta(respuesta) {
+  return conStore('respuestas', 'readwrite', store => store.add(respuesta));
+}
+
+async function leerRespuestas() {
+  const [claves, respuestas] = await Promise.all([
+    conStore('respuestas', 'readonly', store => store.getAllKeys()),
+    conStore('respuestas', 'readonly', store => store.getAll()),
+  ]);
+  return respuestas.map((respuesta, i) => ({ clave: claves[i], respuesta }));
+}
+
+function borrarRespuestas(claves) {
+  return conStore('respuestas', 'readwrite', store => {
+    claves.forEach(clave => store.delete(clave));
+  });
+}
+
+// Respuesta JSON de la propia API (no la página de login tras una redirección)
+function esRespuestaJson(response) {
+  return !response.redirected &&
+    (response.headers.get('Content-Type') || '').includes('application/json');
+}
+
+function jsonResponse(data, status = 200) {
+  return new Response(JSON.stringify(data), {
+    status,
+    headers: { 'Content-Type': 'application/json' }
+  });
+}
+
+// ---------------------------------------------------------------------------
+// Cola de repaso: red primero (precargando más tarjetas de las pedidas);
+// sin conexión se sirve desde IndexedDB
+// ---------------------------------------------------------------------------
+
+async function obtenerCola(request) {
+  const url = new URL(request.url);
+  const limite = parseInt(url.searchParams.get('n'), 10) || 20;
+  const excluir = new Set(
+    (url.searchParams.get('excluir') || '').split(',').filter(Boolean).map(Number)
+  );
+
+  // Primero subir lo respondido sin conexión para no recibir esas tarjetas otra vez
+  await sincronizarRespuestas().catch(() => {});
+
+  try {
+    const prefetch = new URL(url);
+    prefetch.searchParams.set('n', Math.max(limite, TAMANO_PREFETCH));
+    const response = await fetch(prefetch, { credentials: 'same-origin' });
+    if (!response.ok) {
+      return response;
+    }
+
+    const data = await response.json();
+    await guardarTarjetas(data.tarjetas || []);
+    return jsonResponse({ ...data, tarjetas: (data.tarjetas || []).slice(0, limite) });
+  } catch (error) {
+    const tarjetas = (await leerTarjetas())
+      .filter(tarjeta => !excluir.has(tarjeta.id))
+      .sort((a, b) => a.siguiente_repeticion.localeCompare(b.siguiente_repeticion))
+      .slice(0, limite);
+    return jsonResponse({ tarjetas, offline: true });
+  }
+}
+
+// ---------------------------------------------------------------------------
+// Respuestas: si no hay conexión se guardan con su answered_at original y se
+// reenvían en lote al recuperarla
+// ---------------------------------------------------------------------------
+
+async function enviarRespuesta(request) {
+  const cuerpo = await request.clone().json();
+  const csrf = request.headers.get('X-CSRFToken');
+
+  try {
+    const response = await fetch(request);
+    // 409: ya estaba registrada; en ambos casos la tarjeta sale de la cola local
+    if ((response.ok || response.status === 409) && esRespuestaJson(response)) {
+      await quitarTarjeta(cuerpo.card_id);
+    }
+    return response;
+  } catch (error) {
+    await encolarRespuesta({
+      card_id: cuerpo.card_id,
+      calificacion_base: cuerpo.calificacion_base,
+      tiempo_respuesta: cuerpo.tiempo_respuesta,
+      answered_at: cuerpo.answered_at || new Date().toISOString(),
+      // Si la petición llegó al servidor pero no la respuesta, el reenvío se detecta como duplicado
+      respuesta_id: cuerpo.respuesta_id || crypto.randomUUID(),
+      csrf
+    });
+    await quitarTarjeta(cuerpo.card_id);
+    registrarSync();
+    return jsonResponse({
+      success: true,
+      encolada: true,
+      mensaje: '📴 Respuesta guardada sin conexión'
+    }, 202);
+  }
+}
+
+let sincronizando = null;
+
+function sincronizarRespuestas() {
+  // Una sola sincronización a la vez
+  if (!sincronizando) {
+    sincronizando = reenviarRespuestas().finally(() => { sincronizando = null; });
+  }
+  return sincronizando;
+}
+
+async function reenviarRespuestas() {
+  const pendientes = await leerRespuestas();
+  for (let inicio = 0; inicio < pendientes.length; inicio += TAMANO_REENVIO) {
+    await reenviarLote(pendientes.slice(inicio, inicio + TAMANO_REENVIO));
+  }
+}
+
+async function reenviarLote(lote) {
+  const response = await fetch(URL_RESPUESTAS_LOTE, {
+    method: 'POST',
+    credentials: 'same-origin',
+    // Con la sesión caducada login_required redirige al login: no seguir la redirección
+    redirect: 'manual',
+    headers: {
+      'Content-Type': 'application/json',
+      'X-CSRFToken': lote[lote.length - 1].respuesta.csrf
+    },
+    body: JSON.stringify({
+      respuestas: lote.map(({ respuesta }) => ({
+        card_id: respuesta.card_id,
+        calificacion_base: respuesta.calificacion_base,
+        tiempo_respuesta: respuesta.tiempo_respuesta,
+        answered_at: respuesta.answered_at,
+        respuesta_id: respuesta.respuesta_id
+      }))
+    })
+  });
+
+  // Cualquier otra cosa que el JSON esperado (redirección, 403, 5xx...): la cola se conserva
+  const data = response.ok && esRespuestaJson(response) ? await response.json() : null;
+  if (!data || !Array.isArray(data.resultados) || data.resultados.length !== lote.length) {
+    throw new Error(`Error reenviando respuestas: ${response.status}`);
+  }
+
+  // Se borran las respuestas con resultado definitivo, una a una: una respuesta
+  // inválida se descarta sin arrastrar a las demás del lote
+  await borrarRespuestas(
+    lote
+      .filter((_, i) => RESULTADOS_DEFINITIVOS.has(data.resultados[i].resultado))
+      .map(({ clave }) => clave)
+  );
+}
+
+function registrarSync() {
+  if (self.registration.sync) {
+    self.registration.sync.register(SYNC_TAG).catch(() => {});
+  }
+}
+
+// Background Sync: el navegador avisa cuando vuelve la conexión
+self.addEventListener('sync', event => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(sincronizarRespuestas());
+  }
+});
+
+// Las páginas avisan con un mensaje al detectar el evento 'online'
+self.addEventListener('message', event => {
+  if (event.data && event.data.tipo === 'sincronizar') {
+    event.waitUntil(sincronizarRespuestas().catch(() => {}));
+  }
+});
+
 // Listener para notificaciones push (para Fase 4)
 self.addEventListener('push', event => {
   let data = {};
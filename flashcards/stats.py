@@ -0,0 +1,324 @@
+from collections import Counter
+from itertools import chain
+from datetime import datetime, time, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .eventos import avisar_cambio
+from .models import Card, Subscription, UserCardStats
+
+
+# Campo de UserCardStats que cuenta cada estado y cada fase
+CAMPO_ESTADO = {
+    'nuevo': 'nuevas',
+    'aprendizaje': 'aprendizaje',
+    'consolidacion': 'consolidacion',
+    'maduro': 'maduras',
+}
+CAMPO_FASE = {1: 'fase_1', 2: 'fase_2', 3: 'fase_3'}
+CAMPOS_CONTADORES = ['total_tarjetas', 'fase_1', 'fase_2', 'fase_3', 'nuevas', 'aprendizaje', 'consolidacion', 'maduras']
+# Horizontes (en días) del pronóstico de repasos que se pueden pedir y cachear
+PRONOSTICO_DIAS = (30, 90)
+# Máximo tiempo en caché del contador de pendientes si no vence ninguna tarjeta antes
+MAXIMO_CACHE_PENDIENTES = 3600
+# Ids de usuario por consulta al filtrar suscripciones (límite de variables de SQLite)
+TANDA_USUARIOS = 500
+
+
+def tarjetas_vencidas(ahora):
+    """Condición de tarjeta pendiente: vencida y no nueva"""
+    return Q(siguiente_repeticion__lte=ahora) & ~Q(estado='nuevo')
+
+
+def conteos_tarjetas():
+    """Expresiones de agregación condicional: total, por fase y por estado"""
+    return {
+        'total_tarjetas': Count('id'),
+        'fase_1': Count('id', filter=Q(fase=1)),
+        'fase_2': Count('id', filter=Q(fase=2)),
+        'fase_3': Count('id', filter=Q(fase=3)),
+        'nuevas': Count('id', filter=Q(estado='nuevo')),
+        'aprendizaje': Count('id', filter=Q(estado='aprendizaje')),
+        'consolidacion': Count('id', filter=Q(estado='consolidacion')),
+        'maduras': Count('id', filter=Q(estado='maduro')),
+    }
+
+
+def pendientes_por_usuario(ahora, campo_usuario='usuario'):
+    """
+    Expresión con el número de tarjetas pendientes del usuario de cada fila
+    ('campo_usuario' de la consulta exterior), agrupada por usuario sobre el
+    índice de la cola de repaso
+    """
+    pendientes = Card.objects.filter(
+        tarjetas_vencidas(ahora),
+        usuario=OuterRef(campo_usuario),
+    ).order_by().values('usuario').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(pendientes), 0)
+
+
+def estadisticas_usuario(usuario):
+    """
+    Obtiene los contadores del dashboard en una sola consulta.
+    Los contadores por fase y estado se leen de UserCardStats (O(1)); solo las
+    tarjetas pendientes se cuentan sobre el índice de la cola de repaso.
+    """
+    consulta = UserCardStats.objects.filter(usuario=usuario).annotate(
+        pendientes=pendientes_por_usuario(timezone.now()),
+    ).values(*CAMPOS_CONTADORES, 'pendientes')
+    stats = consulta.first()
+
+    if stats is None and getattr(usuario, 'pk', None) is not None:
+        # Usuario sin contadores (p. ej. creado antes de la migración): calcularlos
+        recalcular_contadores(usuario)
+        stats = consulta.first()
+
+    if stats is None:
+        # Sin usuario guardado no hay contadores que leer
+        stats = {**dict.fromkeys(CAMPOS_CONTADORES, 0), 'pendientes': 0}
+
+    return stats
+
+
+def suscripciones_con_pendientes(ahora=None, usuarios=None):
+    """
+    Suscripciones push de los usuarios con tarjetas pendientes (de todos o de
+    los ids de 'usuarios'), anotadas con 'pendientes'. Una sola consulta: los
+    pendientes se agregan una vez con GROUP BY usuario sobre el índice de la
+    cola de repaso (la condición se escribe como la del índice parcial para que
+    SQLite lo use) y ese agregado se une a las suscripciones. Devuelve un
+    iterador que lee las filas por bloques; una lista de ids se consulta por
+    tandas de TANDA_USUARIOS.
+    """
+    if ahora is None:
+        ahora = timezone.now()
+    if usuarios is None:
+        return _suscripciones_con_pendientes(ahora)
+
+    ids = sorted(set(usuarios))
+    return chain.from_iterable(
+        _suscripciones_con_pendientes(ahora, ids[inicio:inicio + TANDA_USUARIOS])
+        for inicio in range(0, len(ids), TANDA_USUARIOS)
+    )
+
+
+def _suscripciones_con_pendientes(ahora, usuarios=None):
+    """
+    Consulta de suscripciones_con_pendientes. Solo se agregan las tarjetas de
+    los usuarios con suscripción (o de 'usuarios'): así SQLite busca en el
+    índice por usuario en vez de recorrerlo entero.
+    """
+    params = [connection.ops.adapt_datetimefield_value(ahora), 'nuevo']
+    if usuarios is None:
+        filtro_usuarios = f'AND usuario_id IN (SELECT usuario_id FROM {Subscription._meta.db_table})'
+    else:
+        filtro_usuarios = f'AND usuario_id IN ({", ".join(["%s"] * len(usuarios))})'
+        params.extend(usuarios)
+
+    suscripciones = Subscription.objects.raw(f"""
+        SELECT s.id, s.usuario_id, s.endpoint, s.p256dh, s.auth, u.username, p.pendientes
+        FROM (
+            SELECT usuario_id, COUNT(*) AS pendientes
+            FROM {Card._meta.db_table}
+            WHERE siguiente_repeticion <= %s AND NOT (estado = %s) {filtro_usuarios}
+            GROUP BY usuario_id
+        ) p
+        JOIN {Subscription._meta.db_table} s ON s.usuario_id = p.usuario_id
+        JOIN {User._meta.db_table} u ON u.id = s.usuario_id
+        ORDER BY s.usuario_id, s.id
+    """, params)
+    return (_con_usuario(suscripcion) for suscripcion in suscripciones.iterator())
+
+
+def _con_usuario(suscripcion):
+    """Usuario de la suscripción a partir del username leído en la misma fila (sin otra consulta)"""
+    suscripcion.usuario = User(id=suscripcion.usuario_id, username=suscripcion.username)
+    return suscripcion
+
+
+def deltas_contadores(antes=None, despues=None):
+    """
+    Calcula cuánto cambia cada contador cuando una tarjeta pasa de 'antes' a 'despues'.
+    Ambos son tuplas (estado, fase); None significa que la tarjeta no existía
+    (creación) o deja de existir (eliminación).
+    """
+    deltas = Counter()
+    if antes is not None:
+        estado, fase = antes
+        deltas['total_tarjetas'] -= 1
+        deltas[CAMPO_ESTADO[estado]] -= 1
+        deltas[CAMPO_FASE[fase]] -= 1
+    if despues is not None:
+        estado, fase = despues
+        deltas['total_tarjetas'] += 1
+        deltas[CAMPO_ESTADO[estado]] += 1
+        deltas[CAMPO_FASE[fase]] += 1
+    return deltas
+
+
+def aplicar_deltas(usuario, deltas):
+    """Aplica los deltas con un único UPDATE atómico (F expressions)"""
+    cambios = {campo: F(campo) + valor for campo, valor in deltas.items() if valor}
+    if cambios:
+        UserCardStats.objects.filter(usuario=usuario).update(**cambios)
+
+
+def actualizar_contadores(usuario, antes=None, despues=None):
+    """
+    Mantiene UserCardStats al crear, modificar o eliminar una tarjeta, y
+    descarta las estadísticas cacheadas del usuario
+    """
+    aplicar_deltas(usuario, deltas_contadores(antes, despues))
+    invalidar_cache_usuario(getattr(usuario, 'pk', usuario))
+
+
+def clave_pendientes(usuario_id):
+    """Clave de caché del estado de pendientes del usuario"""
+    return f'pendientes:{usuario_id}'
+
+
+def estado_vigente(estado, ahora):
+    """Un estado cacheado vale hasta que vence la siguiente tarjeta"""
+    return estado is not None and (estado['proxima'] is None or estado['proxima'] > ahora)
+
+
+def claves_cache_usuario(usuario_id):
+    """Claves de caché con datos derivados de las tarjetas del usuario"""
+    return [clave_pendientes(usuario_id)] + [f'pronostico:{usuario_id}:{dias}' for dias in PRONOSTICO_DIAS]
+
+
+def invalidar_cache_usuario(usuario_id):
+    """
+    Borra de la caché los datos del usuario. Se borran ya y otra vez al hacer
+    commit: si otra petición los recalcula antes del commit, habría leído las
+    tarjetas sin el cambio. Tras el commit se avisa a sus streams abiertos.
+    """
+    claves = claves_cache_usuario(usuario_id)
+    cache.delete_many(claves)
+
+    def tras_commit():
+        cache.delete_many(claves)
+        avisar_cambio(usuario_id)
+
+    transaction.on_commit(tras_commit)
+
+
+def invalidar_cache_usuarios(usuario_ids):
+    """invalidar_cache_usuario para cada usuario afectado por una escritura masiva"""
+    for usuario_id in set(usuario_ids):
+        invalidar_cache_usuario(usuario_id)
+
+
+def segundos_hasta_medianoche(ahora):
+    """Segundos hasta el próximo cambio de día local"""
+    local = timezone.localtime(ahora)
+    manana = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(int((manana - local).total_seconds()), 1)
+
+
+def estado_pendientes(usuario_id, ahora=None):
+    """
+    Tarjetas pendientes del usuario y momento en que vence la siguiente
+    (None si no hay), como dict {'pendientes', 'proxima'}. El número solo cambia
+    con el tiempo al llegar 'proxima', así que se cachea hasta entonces (o hasta
+    que cambie una tarjeta del usuario).
+    """
+    if ahora is None:
+        ahora = timezone.now()
+
+    clave = clave_pendientes(usuario_id)
+    estado = cache.get(clave)
+    if estado_vigente(estado, ahora):
+        return estado
+
+    tarjetas = Card.objects.filter(usuario_id=usuario_id).exclude(estado='nuevo')
+    estado = {
+        'pendientes': tarjetas.filter(siguiente_repeticion__lte=ahora).count(),
+        'proxima': (
+            tarjetas.filter(siguiente_repeticion__gt=ahora).order_by('siguiente_repeticion')
+            .values_list('siguiente_repeticion', flat=True).first()
+        ),
+    }
+    vigencia = MAXIMO_CACHE_PENDIENTES
+    if estado['proxima'] is not None:
+        vigencia = min(vigencia, (estado['proxima'] - ahora).total_seconds())
+    cache.set(clave, estado, max(int(vigencia), 1))
+    return estado
+
+
+def pronostico_repasos(usuario_id, dias=30, ahora=None):
+    """
+    Repasos que vencen cada día local de los próximos 'dias' (hoy incluye los
+    atrasados), como lista de (fecha, repasos) con todos los días. Se calcula
+    con un solo GROUP BY por día sobre el índice de la cola de repaso y se
+    cachea hasta medianoche o hasta que cambie una tarjeta del usuario.
+    """
+    if dias not in PRONOSTICO_DIAS:
+        raise ValueError(f'Horizonte de pronóstico no válido: {dias}')
+    if ahora is None:
+        ahora = timezone.now()
+
+    clave = f'pronostico:{usuario_id}:{dias}'
+    pronostico = cache.get(clave)
+    if pronostico is not None:
+        return pronostico
+
+    hoy = timezone.localdate(ahora)
+    fin = timezone.make_aware(datetime.combine(hoy + timedelta(days=dias), time.min))
+    filas = (
+        Card.objects.filter(usuario_id=usuario_id, siguiente_repeticion__lt=fin)
+        .exclude(estado='nuevo')
+        .annotate(dia=TruncDate('siguiente_repeticion'))
+        .order_by()
+        .values('dia')
+        .annotate(repasos=Count('id'))
+    )
+    conteos = Counter()
+    for fila in filas:
+        conteos[max(fila['dia'], hoy)] += fila['repasos']
+
+    pronostico = [(hoy + timedelta(days=i), conteos[hoy + timedelta(days=i)]) for i in range(dias)]
+    cache.set(clave, pronostico, segundos_hasta_medianoche(ahora))
+    return pronostico
+
+
+def recalcular_contadores(usuario=None, guardar=True):
+    """
+    Recalcula los contadores desde la tabla de tarjetas (todos los usuarios o uno).
+    Devuelve cuántos usuarios tenían contadores desactualizados o inexistentes.
+    Con guardar=False solo los cuenta, sin corregirlos.
+    """
+    usuarios = User.objects.all()
+    tarjetas = Card.objects.all()
+    if usuario is not None:
+        usuarios = usuarios.filter(pk=usuario.pk)
+        tarjetas = tarjetas.filter(usuario=usuario)
+
+    vacio = dict.fromkeys(CAMPOS_CONTADORES, 0)
+    conteos = {
+        fila.pop('usuario'): fila
+        for fila in tarjetas.order_by().values('usuario').annotate(**conteos_tarjetas())
+    }
+    existentes = {
+        stats.usuario_id: stats
+        for stats in UserCardStats.objects.filter(usuario__in=usuarios)
+    }
+
+    nuevos, modificados = [], []
+    for usuario_id in usuarios.values_list('id', flat=True):
+        esperado = conteos.get(usuario_id, vacio)
+        stats = existentes.get(usuario_id)
+        if stats is None:
+            nuevos.append(UserCardStats(usuario_id=usuario_id, **esperado))
+        elif any(getattr(stats, campo) != valor for campo, valor in esperado.items()):
+            for campo, valor in esperado.items():
+                setattr(stats, campo, valor)
+            modificados.append(stats)
+
+    if guardar:
+        UserCardStats.objects.bulk_create(nuevos, batch_size=1000)
+        UserCardStats.objects.bulk_update(modificados, CAMPOS_CONTADORES, batch_size=1000)
+    return len(nuevos) + len(modificados)
@@ -1,14 +1,50 @@
-from django.test import TestCase, Client
+import base64
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
-from .models import Card, UserSettings, ReviewLog, Subscription
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from .checks import cache_compartida
+from .models import Card, UserSettings, UserCardStats, ResumenDiario, ReviewLog, Subscription, TrabajoNotificacion
 from .utils import (
     ajustar_calificacion_por_tiempo,
     calcular_nuevo_EF,
     update_card,
     get_next_card
 )
+from .stats import (
+    estadisticas_usuario, estado_pendientes, invalidar_cache_usuario, pronostico_repasos,
+    recalcular_contadores, suscripciones_con_pendientes,
+)
+from .eventos import EscuchaCambios, avisar_cambio
+from .search import buscar_tarjetas, fts_disponible
+from .views import leer_estado_pendientes
+from .scheduler import EstadoTarjeta, programar
+from .simulacion import ESTADOS, Mazo, repasar, simular
+from .trabajos import ejecutar_trabajo, encolar_trabajo, latir, liberar_trabajos_abandonados, reclamar_trabajo
+from .notificaciones import ProgramadorNotificaciones, calcular_proxima_notificacion
+from .push import BACKOFF_MAXIMO, CredencialesVapid, ResumenEnvio, enviar_notificaciones, espera_reintento, mensaje_pendientes
 
 
 class SM2LogicTests(TestCase):
@@ -59,6 +95,25 @@ class SM2LogicTests(TestCase):
         self.assertEqual(self.card.contador_aciertos, 0)
         self.assertEqual(self.card.intervalo_actual, 5.0)
     
+    def test_promocion_fase_1_sin_consultar_historial(self):
+        """Test de promoción a Fase 2 usando los tiempos guardados en la tarjeta"""
+        self.card.estado = 'aprendizaje'
+        self.card.intervalo_actual = 600
+        self.card.contador_aciertos = 2
+        self.card.tiempos_recientes = [3.0, 2.0]
+        self.card.save()
+        
+        with CaptureQueriesContext(connection) as consultas:
+            update_card(self.card, calificacion_base=5, tiempo_respuesta=1)
+        
+        self.assertEqual(self.card.fase, 2)
+        self.assertEqual(self.card.tiempos_recientes, [3.0, 2.0, 1])
+        lecturas_historial = [
+            q['sql'] for q in consultas.captured_queries
+            if 'flashcards_reviewlog' in q['sql'] and not q['sql'].startswith('INSERT')
+        ]
+        self.assertEqual(lecturas_historial, [])
+    
     def test_get_next_card_prioridad(self):
         """Test de prioridad de tarjetas"""
         tarjeta_vencida = Card.objects.create(
@@ -92,6 +147,104 @@ class SM2LogicTests(TestCase):
             self.assertNotEqual(card.estado, 'nuevo')
 
 
+class SchedulerTests(SimpleTestCase):
+    """Núcleo del planificador: funciones puras, sin base de datos"""
+    
+    def test_programar_no_modifica_el_estado(self):
+        """programar devuelve un estado nuevo y deja intacto el original"""
+        estado = EstadoTarjeta(tiempos_recientes=[2.0])
+        nuevo, registro = programar(estado, 5, 2, 0)
+        
+        self.assertEqual(estado.estado, 'nuevo')
+        self.assertEqual(estado.contador_aciertos, 0)
+        self.assertEqual(estado.tiempos_recientes, [2.0])
+        self.assertEqual(nuevo.estado, 'aprendizaje')
+        self.assertEqual(nuevo.contador_aciertos, 1)
+        self.assertEqual(nuevo.tiempos_recientes, [2.0, 2])
+        self.assertEqual(registro.fase_antes, 1)
+        self.assertEqual(registro.fase_despues, 1)
+    
+    def test_reloj_numerico(self):
+        """Con un reloj en segundos, siguiente_repeticion es ahora + intervalo"""
+        nuevo, _ = programar(EstadoTarjeta(), 5, 2, 1000)
+        self.assertEqual(nuevo.siguiente_repeticion, 1000 + nuevo.intervalo_actual)
+    
+    def test_reloj_datetime(self):
+        """Con un datetime se suma el intervalo como timedelta"""
+        ahora = timezone.now()
+        nuevo, registro = programar(EstadoTarjeta(), 5, 2, ahora)
+        self.assertEqual(nuevo.siguiente_repeticion, ahora + timedelta(seconds=nuevo.intervalo_actual))
+        self.assertEqual(registro.fecha, ahora)
+    
+    def test_promocion_a_fase_2(self):
+        """Cuatro aciertos rápidos seguidos promocionan a Fase 2"""
+        estado = EstadoTarjeta()
+        ahora = 0
+        for _ in range(4):
+            estado, registro = programar(estado, 5, 2, ahora)
+            ahora = estado.siguiente_repeticion
+        
+        self.assertEqual(estado.fase, 2)
+        self.assertEqual(estado.estado, 'consolidacion')
+        self.assertEqual(registro.fase_antes, 1)
+        self.assertEqual(registro.fase_despues, 2)
+
+
+class SimulacionTests(SimpleTestCase):
+    """El simulador vectorizado debe seguir exactamente las reglas de scheduler.programar"""
+    
+    def test_equivale_al_planificador(self):
+        rng = np.random.default_rng(0)
+        n = 200
+        mazo = Mazo(n)
+        estados = [EstadoTarjeta() for _ in range(n)]
+        
+        ahora = 0.0
+        for _ in range(300):
+            ahora += 1000
+            indices = np.flatnonzero(rng.random(n) < 0.5)
+            # Mayoría de aciertos rápidos para que las tarjetas recorran las tres fases
+            calificaciones = np.where(rng.random(len(indices)) < 0.8, 5, rng.integers(0, 6, len(indices)))
+            tiempos = np.where(rng.random(len(indices)) < 0.8, 1.0, rng.choice([3.5, 5.0, 12.0], len(indices)))
+            
+            repasar(mazo, indices, calificaciones, tiempos, np.full(len(indices), ahora))
+            for k, i in enumerate(indices):
+                estados[i], _ = programar(estados[i], int(calificaciones[k]), float(tiempos[k]), ahora)
+        
+        for i, estado in enumerate(estados):
+            self.assertEqual(ESTADOS[mazo.estado[i]], estado.estado)
+            self.assertEqual(mazo.fase[i], estado.fase)
+            self.assertAlmostEqual(mazo.intervalo_actual[i], estado.intervalo_actual)
+            self.assertAlmostEqual(mazo.EF[i], estado.EF)
+            self.assertEqual(mazo.contador_aciertos[i], estado.contador_aciertos)
+            self.assertEqual(mazo.contador_fallos[i], estado.contador_fallos)
+            self.assertAlmostEqual(mazo.siguiente_repeticion[i], estado.siguiente_repeticion)
+        # La prueba solo es útil si se llegó a todas las fases
+        self.assertEqual(set(np.unique(mazo.fase)), {1, 2, 3})
+    
+    def test_simular(self):
+        """La simulación introduce las tarjetas nuevas y reporta la carga de cada día"""
+        _, resultado = simular(500, 30, nuevas_por_dia=10, semilla=1)
+        
+        self.assertEqual(resultado.nuevas.sum(), 300)
+        self.assertEqual(resultado.fases[-1].sum(), 500)
+        self.assertEqual(resultado.fases[-1][0], 200)
+        self.assertTrue((resultado.repasos >= resultado.tarjetas).all())
+        self.assertTrue(0 < resultado.retencion <= 1)
+    
+    def test_simulate_scheduler_opciones_no_positivas(self):
+        """--dias, --tarjetas y --nuevas-por-dia deben ser enteros positivos"""
+        for argumento in ('--dias=0', '--tarjetas=-5', '--nuevas-por-dia=0', '--dias=x'):
+            with self.assertRaises(CommandError):
+                call_command('simulate_scheduler', argumento, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('simulate_scheduler', dias=0, stdout=StringIO())
+        
+        salida = StringIO()
+        call_command('simulate_scheduler', '--dias=7', '--tarjetas=50', stdout=salida)
+        self.assertIn('✅', salida.getvalue())
+
+
 class ViewsTests(TestCase):
     
     def setUp(self):
@@ -141,11 +294,252 @@ class ViewsTests(TestCase):
         response = self.client.post(reverse('eliminar_tarjeta', args=[card.id]))
         self.assertFalse(Card.objects.filter(id=card.id).exists())
     
+    def test_procesar_respuesta_doble_envio(self):
+        """Test de que un doble envío (mismo respuesta_id) no registra la respuesta dos veces"""
+        card = Card.objects.create(
+            usuario=self.user,
+            frente='Pregunta',
+            reverso='Respuesta',
+            estado='aprendizaje'
+        )
+        payload = json.dumps({
+            'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 2,
+            'respuesta_id': '6f1c1f3e-2b4a-4c39-9d7e-0a6b1b6f5c10',
+        })
+        
+        primera = self.client.post(reverse('procesar_respuesta'), payload, content_type='application/json')
+        segunda = self.client.post(reverse('procesar_respuesta'), payload, content_type='application/json')
+        
+        self.assertEqual(primera.status_code, 200)
+        self.assertTrue(primera.json()['success'])
+        self.assertEqual(segunda.status_code, 409)
+        self.assertEqual(ReviewLog.objects.filter(card=card).count(), 1)
+        card.refresh_from_db()
+        self.assertEqual(card.contador_aciertos, 1)
+    
+    def test_procesar_respuesta_error_sin_clave(self):
+        """Sin respuesta_id, un IntegrityError no se confunde con un doble envío"""
+        card = Card.objects.create(usuario=self.user, frente='Pregunta', reverso='Respuesta', estado='aprendizaje')
+        ReviewLog.objects.create(card=card, calificacion_base=4, tiempo_respuesta=2,
+                                 calificacion_ajustada=4, fase_antes=1, fase_despues=1)
+        payload = json.dumps({'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 2})
+        
+        with mock.patch('flashcards.views.update_card', side_effect=IntegrityError('otro error')):
+            response = self.client.post(reverse('procesar_respuesta'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['error'], 'otro error')
+    
+    def test_cola_repaso_api(self):
+        """Test del lote de tarjetas vencidas para la sesión de repaso"""
+        pasado = timezone.now() - timezone.timedelta(hours=1)
+        tarjetas = [
+            Card.objects.create(
+                usuario=self.user,
+                frente=f'Pregunta {i}',
+                reverso=f'Respuesta {i}',
+                estado='aprendizaje',
+                siguiente_repeticion=pasado + timezone.timedelta(minutes=i)
+            )
+            for i in range(3)
+        ]
+        Card.objects.create(usuario=self.user, frente='Nueva', reverso='Nueva')
+        
+        response = self.client.get(reverse('cola_repaso_api'), {'n': 5, 'excluir': str(tarjetas[0].id)})
+        
+        ids = [t['id'] for t in response.json()['tarjetas']]
+        self.assertEqual(ids, [tarjetas[1].id, tarjetas[2].id])
+        self.assertEqual(response.json()['tarjetas'][0]['reverso'], 'Respuesta 1')
+    
+    def test_procesar_respuesta_hora_servidor(self):
+        """Test de que una respuesta en vivo usa la hora del servidor aunque el reloj del cliente vaya atrasado"""
+        vencida = timezone.now() - timezone.timedelta(seconds=5)
+        card = Card.objects.create(
+            usuario=self.user,
+            frente='Pregunta',
+            reverso='Respuesta',
+            estado='aprendizaje',
+            siguiente_repeticion=vencida
+        )
+        payload = json.dumps({
+            'card_id': card.id,
+            'calificacion_base': 5,
+            'tiempo_respuesta': 2,
+            'answered_at': (vencida - timezone.timedelta(minutes=10)).isoformat(),
+            'respuesta_id': '0b8d2c55-8f0e-4a55-b3c5-3e0f3c1f2a77',
+        })
+        
+        antes = timezone.now()
+        response = self.client.post(reverse('procesar_respuesta'), payload, content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        log = ReviewLog.objects.get(card=card)
+        self.assertGreaterEqual(log.fecha, antes)
+        self.assertEqual(str(log.respuesta_id), '0b8d2c55-8f0e-4a55-b3c5-3e0f3c1f2a77')
+    
+    def test_procesar_respuestas_lote_answered_at(self):
+        """Test de que una respuesta reenviada se programa desde su answered_at, nunca antes de la última repetición"""
+        respondida = timezone.now() - timezone.timedelta(minutes=10)
+        card = Card.objects.create(
+            usuario=self.user,
+            frente='Pregunta',
+            reverso='Respuesta',
+            estado='aprendizaje',
+            siguiente_repeticion=respondida - timezone.timedelta(minutes=1),
+            ultima_repeticion=respondida - timezone.timedelta(minutes=2),
+        )
+        respuestas = [
+            {'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 2, 'answered_at': respondida.isoformat()},
+            # Reloj atrasado: anterior a la respuesta ya aplicada
+            {'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 2,
+             'answered_at': (respondida - timezone.timedelta(hours=1)).isoformat()},
+        ]
+        
+        response = self.client.post(
+            reverse('procesar_respuestas_lote'),
+            json.dumps({'respuestas': respuestas}),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.json()['aplicadas'], 2)
+        fechas = list(ReviewLog.objects.filter(card=card).values_list('fecha', flat=True))
+        self.assertEqual(fechas, [respondida, respondida])
+        card.refresh_from_db()
+        self.assertEqual(card.ultima_repeticion, respondida)
+    
+    def test_procesar_respuestas_lote(self):
+        """Test del envío de varias respuestas en un solo lote"""
+        inicio = timezone.now() - timezone.timedelta(minutes=30)
+        card_a = Card.objects.create(usuario=self.user, frente='A', reverso='A', estado='aprendizaje', siguiente_repeticion=inicio)
+        card_b = Card.objects.create(usuario=self.user, frente='B', reverso='B', estado='aprendizaje', siguiente_repeticion=inicio)
+        respuestas = [
+            {'card_id': card_a.id, 'calificacion_base': 5, 'tiempo_respuesta': 2, 'answered_at': inicio.isoformat()},
+            {'card_id': card_b.id, 'calificacion_base': 1, 'tiempo_respuesta': 9, 'answered_at': inicio.isoformat()},
+            {'card_id': card_a.id, 'calificacion_base': 5, 'tiempo_respuesta': 2,
+             'answered_at': (inicio + timezone.timedelta(seconds=60)).isoformat(),
+             'respuesta_id': 'c5e0a0e2-7d5b-4f5e-9a51-2f3c9d1e8b01'},
+            # Reenvío de la misma respuesta: mismo respuesta_id
+            {'card_id': card_a.id, 'calificacion_base': 5, 'tiempo_respuesta': 2,
+             'answered_at': (inicio + timezone.timedelta(seconds=60)).isoformat(),
+             'respuesta_id': 'c5e0a0e2-7d5b-4f5e-9a51-2f3c9d1e8b01'},
+            {'card_id': 999999, 'calificacion_base': 5, 'tiempo_respuesta': 2},
+        ]
+        
+        response = self.client.post(
+            reverse('procesar_respuestas_lote'),
+            json.dumps({'respuestas': respuestas}),
+            content_type='application/json'
+        )
+        
+        data = response.json()
+        self.assertEqual(data['aplicadas'], 3)
+        self.assertEqual(
+            [r['resultado'] for r in data['resultados']],
+            ['aplicada', 'aplicada', 'aplicada', 'duplicada', 'no_encontrada']
+        )
+        card_a.refresh_from_db()
+        self.assertEqual(card_a.contador_aciertos, 2)
+        self.assertEqual(card_a.intervalo_actual, 120)
+        self.assertEqual(card_a.siguiente_repeticion, inicio + timezone.timedelta(seconds=180))
+        fechas = list(ReviewLog.objects.filter(card=card_a).order_by('fecha').values_list('fecha', flat=True))
+        self.assertEqual(fechas, [inicio, inicio + timezone.timedelta(seconds=60)])
+    
+    def test_procesar_respuestas_lote_invalido(self):
+        """Test de que una respuesta inválida se rechaza sola, sin impedir que se apliquen las demás del lote"""
+        card = Card.objects.create(usuario=self.user, frente='A', reverso='A', estado='aprendizaje')
+        respuestas = [
+            {'card_id': card.id, 'calificacion_base': 9, 'tiempo_respuesta': 2},
+            {'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 'NaN'},
+            {'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 2, 'respuesta_id': 'no-es-un-uuid'},
+            {'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 2},
+        ]
+        
+        response = self.client.post(
+            reverse('procesar_respuestas_lote'),
+            json.dumps({'respuestas': respuestas}),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [r['resultado'] for r in response.json()['resultados']],
+            ['invalida', 'invalida', 'invalida', 'aplicada']
+        )
+        self.assertEqual(ReviewLog.objects.filter(card=card).count(), 1)
+        card.refresh_from_db()
+        self.assertEqual(card.tiempos_recientes, [2.0])
+        
+        # Un lote vacío o que no es una lista sí se rechaza entero
+        response = self.client.post(
+            reverse('procesar_respuestas_lote'), json.dumps({'respuestas': {}}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_procesar_respuesta_datos_malformados(self):
+        """Test de que un cuerpo que no es un objeto o un tiempo no finito dan 400 sin registrar nada"""
+        card = Card.objects.create(usuario=self.user, frente='A', reverso='A', estado='aprendizaje')
+        cuerpos = [
+            json.dumps([card.id, 5, 2]),
+            json.dumps({'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 'nan'}),
+            json.dumps({'card_id': card.id, 'calificacion_base': 5, 'tiempo_respuesta': 'inf'}),
+            json.dumps({'card_id': card.id, 'calificacion_base': 'cinco', 'tiempo_respuesta': 2}),
+        ]
+        for cuerpo in cuerpos:
+            response = self.client.post(reverse('procesar_respuesta'), cuerpo, content_type='application/json')
+            self.assertEqual(response.status_code, 400, cuerpo)
+        
+        self.assertFalse(ReviewLog.objects.exists())
+        card.refresh_from_db()
+        self.assertEqual(card.tiempos_recientes, [])
+    
     def test_sesion_repaso_sin_tarjetas(self):
         """Test de sesión de repaso sin tarjetas pendientes"""
         response = self.client.get(reverse('sesion_repaso'))
         self.assertContains(response, 'Sin Tarjetas')
     
+    def test_lista_tarjetas_paginada(self):
+        """Test de la paginación por keyset: recorre todas las tarjetas sin repetir, aunque compartan fecha"""
+        from flashcards.views import TARJETAS_POR_PAGINA
+        total = TARJETAS_POR_PAGINA * 2 + 5
+        Card.objects.bulk_create([
+            Card(usuario=self.user, frente=f'Pregunta {i}', reverso=f'Respuesta {i}') for i in range(total)
+        ])
+        # Empates en fecha_creacion: el id decide el orden
+        Card.objects.filter(usuario=self.user).update(fecha_creacion=timezone.now())
+        
+        vistas = []
+        url = reverse('lista_tarjetas')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pagina = response.context['tarjetas']
+            self.assertLessEqual(len(pagina), TARJETAS_POR_PAGINA)
+            vistas.extend(tarjeta.id for tarjeta in pagina)
+            siguiente = response.context['url_siguiente']
+            url = reverse('lista_tarjetas') + siguiente if siguiente else None
+        
+        esperadas = list(Card.objects.filter(usuario=self.user).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(vistas, esperadas)
+    
+    def test_lista_tarjetas_busqueda_y_recorte(self):
+        """Test de la búsqueda en frente o reverso y del recorte de textos largos"""
+        Card.objects.create(usuario=self.user, frente='Capital de Francia', reverso='París')
+        Card.objects.create(usuario=self.user, frente='Río más largo', reverso='Nilo ' + 'x' * 1000)
+        Card.objects.create(usuario=self.user, frente='Otra', reverso='Nada')
+        
+        response = self.client.get(reverse('lista_tarjetas'), {'q': 'nilo'})
+        tarjetas = response.context['tarjetas']
+        self.assertEqual(len(tarjetas), 1)
+        self.assertTrue(tarjetas[0].reverso_corto.endswith('…'))
+        self.assertLess(len(tarjetas[0].reverso_corto), 1000)
+        self.assertNotContains(response, 'x' * 1000)
+        
+        response = self.client.get(reverse('lista_tarjetas'), {'q': 'francia'})
+        self.assertEqual([t.frente_corto for t in response.context['tarjetas']], ['Capital de Francia'])
+        
+        # Un cursor inválido muestra la primera página
+        response = self.client.get(reverse('lista_tarjetas'), {'cursor': 'basura'})
+        self.assertEqual(len(response.context['tarjetas']), 3)
+    
     def test_login_requerido(self):
         """Test de que las vistas requieren login"""
         self.client.logout()
@@ -182,3 +576,978 @@ class UserSettingsTests(TestCase):
         
         self.assertEqual(settings.tarjetas_nuevas_hoy, 0)
         self.assertEqual(settings.ultima_fecha_reset, timezone.now().date())
+
+
+class EstadisticasTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        pasado = timezone.now() - timezone.timedelta(hours=1)
+        futuro = timezone.now() + timezone.timedelta(days=1)
+        Card.objects.create(usuario=self.user, frente='a', reverso='a')
+        Card.objects.create(usuario=self.user, frente='b', reverso='b', estado='aprendizaje', siguiente_repeticion=pasado)
+        Card.objects.create(usuario=self.user, frente='c', reverso='c', estado='consolidacion', fase=2, siguiente_repeticion=pasado)
+        Card.objects.create(usuario=self.user, frente='d', reverso='d', estado='maduro', fase=3, siguiente_repeticion=futuro)
+        recalcular_contadores()
+    
+    def test_estadisticas_en_una_consulta(self):
+        """Test de que los contadores del dashboard salen de una sola consulta"""
+        with self.assertNumQueries(1):
+            stats = estadisticas_usuario(self.user)
+        
+        self.assertEqual(stats['total_tarjetas'], 4)
+        self.assertEqual(stats['fase_1'], 2)
+        self.assertEqual(stats['fase_2'], 1)
+        self.assertEqual(stats['fase_3'], 1)
+        self.assertEqual(stats['nuevas'], 1)
+        self.assertEqual(stats['aprendizaje'], 1)
+        self.assertEqual(stats['consolidacion'], 1)
+        self.assertEqual(stats['maduras'], 1)
+        self.assertEqual(stats['pendientes'], 2)
+    
+    def test_estadisticas_sin_contadores(self):
+        """Sin fila de contadores se calculan una vez; sin usuario se devuelven ceros"""
+        UserCardStats.objects.filter(usuario=self.user).delete()
+        self.assertEqual(estadisticas_usuario(self.user)['total_tarjetas'], 4)
+        self.assertTrue(UserCardStats.objects.filter(usuario=self.user).exists())
+        
+        stats = estadisticas_usuario(None)
+        self.assertEqual(stats['total_tarjetas'], 0)
+        self.assertEqual(stats['pendientes'], 0)
+    
+    def test_contadores_mantenidos_por_las_vistas(self):
+        """Test de que crear, repasar, reiniciar y eliminar mantienen los contadores"""
+        client = Client()
+        client.login(username='testuser', password='12345')
+        
+        client.post(reverse('crear_tarjeta'), {'frente': 'e', 'reverso': 'e'})
+        tarjeta = Card.objects.get(frente='e')
+        tarjeta.fase = 2
+        tarjeta.estado = 'consolidacion'
+        tarjeta.intervalo_actual = 86400
+        tarjeta.save()
+        recalcular_contadores()
+        
+        # Falla en Fase 2: retrocede a Fase 1
+        update_card(tarjeta, calificacion_base=1, tiempo_respuesta=2)
+        client.post(reverse('reiniciar_tarjeta', args=[tarjeta.id]))
+        client.post(reverse('eliminar_tarjeta', args=[Card.objects.get(frente='d').id]))
+        
+        stats = UserCardStats.objects.get(usuario=self.user)
+        self.assertEqual(recalcular_contadores(), 0)
+        self.assertEqual(stats.total_tarjetas, 4)
+        self.assertEqual(stats.fase_1, 3)
+        self.assertEqual(stats.maduras, 0)
+    
+    def test_recalcular_contadores_repara(self):
+        """Test de que check_integrity puede reparar contadores desactualizados"""
+        UserCardStats.objects.filter(usuario=self.user).update(total_tarjetas=99, nuevas=0)
+        
+        self.assertEqual(recalcular_contadores(), 1)
+        stats = UserCardStats.objects.get(usuario=self.user)
+        self.assertEqual(stats.total_tarjetas, 4)
+        self.assertEqual(stats.nuevas, 1)
+
+
+class PronosticoTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.ahora = timezone.now()
+        self.atrasada = Card.objects.create(usuario=self.user, frente='a', reverso='a', estado='aprendizaje',
+                                            siguiente_repeticion=self.ahora - timedelta(days=3))
+        Card.objects.create(usuario=self.user, frente='b', reverso='b', estado='consolidacion', fase=2,
+                            siguiente_repeticion=self.ahora + timedelta(days=2))
+        Card.objects.create(usuario=self.user, frente='c', reverso='c', estado='maduro', fase=3,
+                            siguiente_repeticion=self.ahora + timedelta(days=40))
+        Card.objects.create(usuario=self.user, frente='d', reverso='d')  # Nueva: no cuenta
+    
+    def conteos(self, pronostico):
+        return {fecha: repasos for fecha, repasos in pronostico if repasos}
+    
+    def test_pronostico_cacheado(self):
+        """Una consulta agrupada por día la primera vez; después sale de la caché"""
+        hoy = timezone.localdate(self.ahora)
+        with self.assertNumQueries(1):
+            pronostico = pronostico_repasos(self.user.id, 30)
+        self.assertEqual(len(pronostico), 30)
+        self.assertEqual(pronostico[0][0], hoy)
+        self.assertEqual(self.conteos(pronostico), {
+            hoy: 1,
+            timezone.localdate(self.ahora + timedelta(days=2)): 1,
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(pronostico_repasos(self.user.id, 30), pronostico)
+        self.assertEqual(sum(repasos for _, repasos in pronostico_repasos(self.user.id, 90)), 3)
+    
+    def test_invalidacion_al_repasar(self):
+        """update_card descarta el pronóstico cacheado"""
+        pronostico_repasos(self.user.id, 30)
+        update_card(self.atrasada, calificacion_base=5, tiempo_respuesta=2)
+        
+        hoy = timezone.localdate(self.ahora)
+        proximo = timezone.localdate(self.atrasada.siguiente_repeticion)
+        esperado = Counter([timezone.localdate(self.ahora + timedelta(days=2)), proximo])
+        self.assertEqual(self.conteos(pronostico_repasos(self.user.id, 30)), dict(esperado))
+        self.assertGreaterEqual(proximo, hoy)
+    
+    def test_invalidacion_en_reparaciones_masivas(self):
+        """check_integrity descarta el pronóstico de los usuarios cuyas tarjetas repara"""
+        # Nueva en Fase 2: la reparación la pasa a 'consolidacion' y empieza a contar
+        Card.objects.filter(frente='d').update(fase=2, siguiente_repeticion=self.ahora)
+        hoy = timezone.localdate(self.ahora)
+        self.assertEqual(self.conteos(pronostico_repasos(self.user.id, 30))[hoy], 1)
+        
+        call_command('check_integrity', stdout=StringIO())
+        
+        self.assertEqual(self.conteos(pronostico_repasos(self.user.id, 30))[hoy], 2)
+    
+    def test_api_y_estadisticas(self):
+        """El endpoint valida el horizonte y la página de estadísticas muestra el histograma"""
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('pronostico_api'), {'dias': 90})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['pronostico']), 90)
+        self.assertEqual(response.json()['total'], 3)
+        
+        self.assertEqual(self.client.get(reverse('pronostico_api'), {'dias': 7}).status_code, 400)
+        
+        response = self.client.get(reverse('estadisticas'))
+        self.assertContains(response, 'Próximos Repasos')
+        self.assertEqual(response.context['total_pronostico'], 2)
+
+
+class PendientesApiTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.client.login(username='testuser', password='12345')
+        ahora = timezone.now()
+        self.vencida = Card.objects.create(usuario=self.user, frente='a', reverso='a', estado='aprendizaje',
+                                           siguiente_repeticion=ahora - timedelta(minutes=5))
+        self.proxima = ahora + timedelta(seconds=20)
+        Card.objects.create(usuario=self.user, frente='b', reverso='b', estado='aprendizaje',
+                            siguiente_repeticion=self.proxima)
+    
+    def consultas_tarjetas(self, consultas):
+        return [c['sql'] for c in consultas.captured_queries if 'flashcards_card' in c['sql']]
+    
+    def test_etag_y_max_age(self):
+        """El max-age no pasa del próximo vencimiento y un ETag vigente devuelve 304 sin tocar las tarjetas"""
+        response = self.client.get(reverse('tarjetas_pendientes_api'))
+        self.assertEqual(response.json()['pendientes'], 1)
+        self.assertIn('private', response['Cache-Control'])
+        max_age = int(response['Cache-Control'].split('max-age=')[1].split(',')[0])
+        self.assertLessEqual(max_age, 20)
+        
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('tarjetas_pendientes_api'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.consultas_tarjetas(consultas), [])
+    
+    def test_invalidacion(self):
+        """Repasar, crear o eliminar tarjetas cambia el contador y el ETag"""
+        etag = self.client.get(reverse('tarjetas_pendientes_api'))['ETag']
+        
+        update_card(self.vencida, calificacion_base=5, tiempo_respuesta=2)
+        response = self.client.get(reverse('tarjetas_pendientes_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pendientes'], 0)
+        
+        self.client.post(reverse('crear_tarjeta'), {'frente': 'c', 'reverso': 'c'})
+        self.assertEqual(self.client.get(reverse('tarjetas_pendientes_api')).json()['pendientes'], 1)
+    
+    def test_caduca_al_vencer_la_siguiente(self):
+        """Al llegar el vencimiento de la siguiente tarjeta se vuelve a contar"""
+        self.assertEqual(estado_pendientes(self.user.id)['pendientes'], 1)
+        self.assertEqual(estado_pendientes(self.user.id, self.proxima + timedelta(seconds=1))['pendientes'], 2)
+    
+    def test_etag_por_usuario(self):
+        """Otro usuario con el mismo número de pendientes no recibe el 304 de la cuenta anterior"""
+        etag = self.client.get(reverse('tarjetas_pendientes_api'))['ETag']
+        otro = User.objects.create_user(username='otro', password='12345')
+        Card.objects.create(usuario=otro, frente='x', reverso='x', estado='aprendizaje',
+                            siguiente_repeticion=self.vencida.siguiente_repeticion)
+        Card.objects.create(usuario=otro, frente='y', reverso='y', estado='aprendizaje',
+                            siguiente_repeticion=self.proxima)
+        self.client.login(username='otro', password='12345')
+        
+        response = self.client.get(reverse('tarjetas_pendientes_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pendientes'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_aviso_cache_por_proceso(self):
+        """LocMemCache fuera de DEBUG genera el aviso flashcards.W001; la caché compartida no"""
+        self.assertEqual(cache_compartida(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([aviso.id for aviso in cache_compartida(None)], ['flashcards.W001'])
+
+
+class StreamPendientesTests(TransactionTestCase):
+    # Con TestCase los datos no se confirman y el cálculo en el hilo del pool no los vería
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        Card.objects.create(usuario=self.user, frente='a', reverso='a', estado='aprendizaje',
+                            siguiente_repeticion=timezone.now() - timedelta(minutes=5))
+    
+    async def leer_evento(self, contenido):
+        """Siguiente bloque del stream que no sea un comentario ni el retry"""
+        while True:
+            bloque = await contenido.__anext__()
+            if bloque.startswith(b'event:'):
+                return json.loads(bloque.decode().split('data: ')[1])
+    
+    async def test_envia_pendientes_al_cambiar(self):
+        """El stream envía el contador al abrir y de nuevo cuando se avisa de un cambio"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('tarjetas_pendientes_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        contenido = response.streaming_content
+        try:
+            self.assertEqual((await self.leer_evento(contenido))['pendientes'], 1)
+            
+            await sync_to_async(Card.objects.create)(
+                usuario=self.user, frente='b', reverso='b', estado='aprendizaje',
+                siguiente_repeticion=timezone.now() - timedelta(minutes=1),
+            )
+            # Fuera de atomic on_commit se ejecuta en el acto y avisa al stream
+            await sync_to_async(invalidar_cache_usuario)(self.user.id)
+            self.assertEqual((await self.leer_evento(contenido))['pendientes'], 2)
+        finally:
+            await contenido.aclose()
+    
+    async def test_lectura_del_stream(self):
+        """Con la caché vigente no se calcula nada; si no, se calcula fuera del hilo de la petición"""
+        estado = await sync_to_async(estado_pendientes)(self.user.id)
+        hilos = []
+        
+        def calculo(usuario_id):
+            hilos.append(threading.get_ident())
+            return estado_pendientes(usuario_id)
+        
+        with mock.patch('flashcards.views.estado_pendientes', side_effect=calculo):
+            self.assertEqual(await leer_estado_pendientes(self.user.id), estado)
+            self.assertEqual(hilos, [])
+            
+            await cache.aclear()
+            self.assertEqual(await leer_estado_pendientes(self.user.id), estado)
+        self.assertEqual(len(hilos), 1)
+        self.assertNotEqual(hilos[0], threading.main_thread().ident)
+    
+    def test_wsgi_y_anonimo(self):
+        """Sin ASGI se responde 204 (el cliente vuelve a consultar); sin sesión, 401"""
+        self.assertEqual(self.client.get(reverse('tarjetas_pendientes_stream')).status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('tarjetas_pendientes_stream')).status_code, 204)
+    
+    async def test_aviso_desde_otro_hilo(self):
+        """avisar_cambio despierta a la escucha del usuario desde cualquier hilo, y solo a esa"""
+        with EscuchaCambios(self.user.id) as escucha, EscuchaCambios(self.user.id + 1) as otra:
+            threading.Timer(0.05, avisar_cambio, args=(self.user.id,)).start()
+            self.assertTrue(await escucha.esperar(5))
+            self.assertFalse(await otra.esperar(0.05))
+
+
+class CheckIntegrityTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.negativa = Card.objects.create(usuario=self.user, frente='a', reverso='a', intervalo_actual=-1, EF=1.0)
+        self.inconsistente = Card.objects.create(usuario=self.user, frente='b', reverso='b', estado='maduro', fase=2)
+        self.fase_invalida = Card.objects.create(usuario=self.user, frente='c', reverso='c', estado='maduro', fase=7)
+        self.sana = Card.objects.create(usuario=self.user, frente='d', reverso='d', estado='consolidacion', fase=2)
+        UserSettings.objects.filter(usuario=self.user).delete()
+        
+        # Registro de una tarjeta borrada sin cascada (las FK de SQLite se comprueban al hacer commit)
+        borrada = Card.objects.create(usuario=self.user, frente='e', reverso='e')
+        ReviewLog.objects.create(card=borrada, calificacion_base=4, tiempo_respuesta=2,
+                                 calificacion_ajustada=4, fase_antes=1, fase_despues=1)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM flashcards_card WHERE id = %s', [borrada.id])
+    
+    def estado_tarjetas(self):
+        return list(Card.objects.order_by('id').values_list('estado', 'fase', 'intervalo_actual', 'EF'))
+    
+    def test_dry_run_no_modifica(self):
+        """--dry-run informa de los problemas sin tocar nada"""
+        antes = self.estado_tarjetas()
+        salida = StringIO()
+        call_command('check_integrity', dry_run=True, stdout=salida)
+        
+        self.assertIn('1 tarjeta(s) con intervalos negativos', salida.getvalue())
+        self.assertIn('1 tarjeta(s) con fase inválida', salida.getvalue())
+        self.assertIn('1 tarjeta(s) con estado inválido o inconsistente con su fase', salida.getvalue())
+        self.assertIn('1 registro(s) de revisión de tarjetas inexistentes', salida.getvalue())
+        self.assertIn('⏱️', salida.getvalue())
+        self.assertEqual(self.estado_tarjetas(), antes)
+        self.assertFalse(UserSettings.objects.filter(usuario=self.user).exists())
+        self.assertEqual(ReviewLog.objects.count(), 1)
+        # TestCase comprueba las FK al terminar
+        ReviewLog.objects.all().delete()
+    
+    def test_reparaciones_por_lotes(self):
+        """Cada reparación es una sola consulta y deja los datos consistentes"""
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('check_integrity', stdout=StringIO())
+        self.assertLess(len(consultas), 25)
+        
+        self.negativa.refresh_from_db()
+        self.inconsistente.refresh_from_db()
+        self.fase_invalida.refresh_from_db()
+        self.assertEqual((self.negativa.intervalo_actual, self.negativa.EF), (5.0, 1.3))
+        self.assertEqual((self.inconsistente.estado, self.inconsistente.fase), ('consolidacion', 2))
+        self.assertEqual((self.fase_invalida.estado, self.fase_invalida.fase), ('maduro', 3))
+        self.assertTrue(UserSettings.objects.filter(usuario=self.user).exists())
+        self.assertEqual(ReviewLog.objects.count(), 0)
+        
+        salida = StringIO()
+        call_command('check_integrity', stdout=salida)
+        self.assertIn('Todo está en orden', salida.getvalue())
+
+
+class ArchivarRepasosTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.card = Card.objects.create(usuario=self.user, frente='a', reverso='a')
+        self.antiguo = timezone.localtime(timezone.now() - timedelta(days=100)).replace(hour=12)
+    
+    def registrar(self, fecha, calificacion, tiempo, fase_antes=1, fase_despues=1):
+        return ReviewLog.objects.create(
+            card=self.card, fecha=fecha, calificacion_base=calificacion, tiempo_respuesta=tiempo,
+            calificacion_ajustada=calificacion, fase_antes=fase_antes, fase_despues=fase_despues,
+        )
+    
+    def test_archivar_y_acumular(self):
+        """Los registros antiguos pasan a resúmenes diarios y a un archivo, los recientes se quedan"""
+        self.registrar(self.antiguo, 4, 2.0, fase_antes=1, fase_despues=2)
+        self.registrar(self.antiguo + timedelta(hours=1), 2, 6.0, fase_antes=2, fase_despues=1)
+        self.registrar(self.antiguo + timedelta(days=1), 5, 1.0)
+        reciente = self.registrar(timezone.now(), 3, 3.0)
+        
+        with tempfile.TemporaryDirectory() as directorio:
+            call_command('archivar_repasos', dias=30, lote=2, directorio=directorio, stdout=StringIO())
+            
+            self.assertEqual(list(ReviewLog.objects.values_list('id', flat=True)), [reciente.id])
+            resumen = ResumenDiario.objects.get(card=self.card, dia=self.antiguo.date())
+            self.assertEqual(resumen.repasos, 2)
+            self.assertEqual(resumen.calificacion_media, 3.0)
+            self.assertEqual(resumen.tiempo_medio, 4.0)
+            self.assertEqual((resumen.promociones, resumen.retrocesos), (1, 1))
+            self.assertEqual(ResumenDiario.objects.count(), 2)
+            
+            archivos = list(Path(directorio).glob('repasos_*.jsonl.gz'))
+            self.assertEqual(len(archivos), 1)
+            with gzip.open(archivos[0], 'rt', encoding='utf-8') as archivo:
+                registros = [json.loads(linea) for linea in archivo]
+            self.assertEqual([r['calificacion_base'] for r in registros], [4, 2, 5])
+            
+            # Una segunda ejecución acumula sobre el resumen del mismo día
+            self.registrar(self.antiguo + timedelta(hours=2), 0, 4.0)
+            salida = StringIO()
+            call_command('archivar_repasos', dias=30, dry_run=True, stdout=salida)
+            self.assertIn('Se archivarían 1 registro(s)', salida.getvalue())
+            call_command('archivar_repasos', dias=30, directorio=directorio, stdout=StringIO())
+        
+        resumen.refresh_from_db()
+        self.assertEqual(resumen.repasos, 3)
+        self.assertEqual(resumen.calificacion_media, 2.0)
+
+
+class ConfiguracionSQLiteTests(TestCase):
+    
+    def test_pragmas_de_conexion(self):
+        """Cada conexión abre con los ajustes de concurrencia de SQLITE_PRAGMAS"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Solo SQLite')
+        with connection.cursor() as cursor:
+            valores = {}
+            for pragma in ['synchronous', 'busy_timeout', 'temp_store', 'cache_size']:
+                cursor.execute(f'PRAGMA {pragma}')
+                valores[pragma] = cursor.fetchone()[0]
+        # NORMAL = 1, MEMORY = 2
+        self.assertEqual(valores, {'synchronous': 1, 'busy_timeout': 5000, 'temp_store': 2, 'cache_size': -20000})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class BackupTests(TransactionTestCase):
+    # La API de backup no avanza mientras la conexión tiene una transacción abierta (como en TestCase)
+    
+    def test_backup_comprimido_y_rotacion(self):
+        """El backup se copia por pasos, se verifica, se comprime y rota los antiguos"""
+        usuario = User.objects.create_user(username='respaldo', password='12345')
+        Card.objects.bulk_create([
+            Card(usuario=usuario, frente=f'Pregunta {i}', reverso='x' * 500) for i in range(200)
+        ])
+        
+        with tempfile.TemporaryDirectory() as directorio:
+            directorio = Path(directorio)
+            antiguo = directorio / 'db_backup_20000101_000000.sqlite3'
+            antiguo.write_bytes(b'')
+            
+            salida = StringIO()
+            call_command('backup_db', directorio=directorio, comprimir='gzip', paginas=4, pausa=0,
+                         conservar=1, stdout=salida)
+            
+            self.assertIn('✅ Backup creado exitosamente', salida.getvalue())
+            self.assertIn('Backup antiguo eliminado', salida.getvalue())
+            self.assertFalse(antiguo.exists())
+            backups = list(directorio.iterdir())
+            self.assertEqual(len(backups), 1)
+            self.assertTrue(backups[0].name.endswith('.sqlite3.gz'))
+            
+            copia = directorio / 'copia.sqlite3'
+            with gzip.open(backups[0]) as comprimido:
+                copia.write_bytes(comprimido.read())
+            conexion = sqlite3.connect(copia)
+            try:
+                total = conexion.execute('SELECT COUNT(*) FROM flashcards_card WHERE usuario_id = ?', (usuario.id,))
+                self.assertEqual(total.fetchone()[0], 200)
+            finally:
+                conexion.close()
+    
+    def test_opciones_no_positivas(self):
+        """--conservar 0 o --paginas <= 0 se rechazan sin crear ni borrar backups"""
+        with tempfile.TemporaryDirectory() as directorio:
+            antiguo = Path(directorio) / 'db_backup_20000101_000000.sqlite3'
+            antiguo.write_bytes(b'')
+            for opciones in ({'conservar': 0}, {'paginas': 0}, {'paginas': -1}):
+                salida = StringIO()
+                call_command('backup_db', directorio=directorio, stdout=salida, **opciones)
+                self.assertIn('debe ser un entero positivo', salida.getvalue())
+            self.assertEqual(list(Path(directorio).iterdir()), [antiguo])
+            
+            with self.assertRaises(CommandError):
+                call_command('backup_db', '--conservar=0', directorio=directorio)
+
+
+class BusquedaTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='buscador', password='12345')
+        self.otro = User.objects.create_user(username='otro', password='12345')
+        self.capital = Card.objects.create(usuario=self.user, frente='Capital de Francia', reverso='París')
+        self.rio = Card.objects.create(usuario=self.user, frente='Río más largo', reverso='El Nilo, que pasa por la capital de Egipto')
+        Card.objects.create(usuario=self.otro, frente='Capital de Italia', reverso='Roma')
+    
+    def buscar(self, texto, usuario=None):
+        tarjetas = Card.objects.filter(usuario=usuario or self.user)
+        return list(buscar_tarjetas(tarjetas, texto).order_by('rango', '-id').values_list('id', flat=True))
+    
+    def test_busqueda_fts(self):
+        """El índice encuentra por prefijo y sin acentos, y ordena por relevancia"""
+        self.assertTrue(fts_disponible())
+        self.assertEqual(self.buscar('paris'), [self.capital.id])
+        self.assertEqual(self.buscar('rio'), [self.rio.id])
+        # Coincidencia en el frente antes que en el reverso
+        self.assertEqual(self.buscar('capit'), [self.capital.id, self.rio.id])
+        self.assertEqual(self.buscar('"*'), [])
+        
+        # Un solo MATCH unido por rowid, no una subconsulta con MATCH por cada tarjeta
+        with CaptureQueriesContext(connection) as consultas:
+            self.buscar('capit')
+        self.assertEqual(' '.join(c['sql'] for c in consultas).count('MATCH'), 1)
+    
+    def test_indice_sincronizado(self):
+        """Los triggers mantienen el índice al crear, editar y borrar tarjetas"""
+        self.capital.reverso = 'Lutecia'
+        self.capital.save()
+        self.assertEqual(self.buscar('paris'), [])
+        self.assertEqual(self.buscar('lutecia'), [self.capital.id])
+        
+        Card.objects.filter(id=self.rio.id).delete()
+        self.assertEqual(self.buscar('nilo'), [])
+        
+        Card.objects.bulk_create([Card(usuario=self.user, frente='Montaña más alta', reverso='Everest')])
+        self.assertEqual(len(self.buscar('everest')), 1)
+        
+        salida = StringIO()
+        call_command('reconstruir_busqueda', stdout=salida)
+        self.assertIn('3 tarjeta(s) indexada(s)', salida.getvalue())
+        self.assertEqual(len(self.buscar('everest')), 1)
+    
+    def test_sin_fts_usa_icontains(self):
+        """Sin índice FTS5 se filtra con icontains"""
+        with mock.patch('flashcards.search.fts_disponible', return_value=False):
+            self.assertEqual(self.buscar('Nilo'), [self.rio.id])
+    
+    def test_busqueda_en_lista_y_admin(self):
+        """La lista y el admin usan el mismo buscador; la lista pagina los resultados"""
+        self.client.login(username='buscador', password='12345')
+        Card.objects.bulk_create([
+            Card(usuario=self.user, frente=f'Verbo {i}', reverso='conjugación') for i in range(7)
+        ])
+        with mock.patch('flashcards.views.TARJETAS_POR_PAGINA', 3):
+            vistas = []
+            url = reverse('lista_tarjetas') + '?q=conjugacion'
+            while url:
+                response = self.client.get(url)
+                vistas.extend(tarjeta.id for tarjeta in response.context['tarjetas'])
+                siguiente = response.context['url_siguiente']
+                url = reverse('lista_tarjetas') + siguiente if siguiente else None
+        self.assertEqual(len(vistas), 7)
+        self.assertEqual(len(set(vistas)), 7)
+        
+        admin = User.objects.create_superuser(username='admin', password='12345')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:flashcards_card_changelist'), {'q': 'capital'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class LlenarDatosTests(TestCase):
+    
+    def test_llenar_datos(self):
+        """Los datos de prueba se insertan por lotes con settings, contadores e historial coherentes"""
+        call_command('llenar_datos', usuarios=3, tarjetas=20, repasos=2, seed=1, batch_size=7, stdout=StringIO())
+        
+        usuarios = User.objects.filter(username__startswith='test_user_')
+        self.assertEqual(usuarios.count(), 3)
+        self.assertEqual(UserSettings.objects.filter(usuario__in=usuarios).count(), 3)
+        self.assertEqual(Card.objects.filter(usuario__in=usuarios).count(), 60)
+        self.assertTrue(usuarios.first().check_password('12345'))
+        # Los contadores se recalculan al final, ya que bulk_create no dispara señales
+        self.assertEqual(recalcular_contadores(), 0)
+        self.assertEqual(UserCardStats.objects.get(usuario=usuarios.first()).total_tarjetas, 20)
+        # Solo las tarjetas ya repasadas tienen historial, y nunca posterior a su última repetición
+        for log in ReviewLog.objects.select_related('card'):
+            self.assertNotEqual(log.card.estado, 'nuevo')
+            self.assertLessEqual(log.fecha, log.card.ultima_repeticion)
+        
+        # Volver a ejecutarlo reemplaza los datos anteriores
+        call_command('llenar_datos', usuarios=2, tarjetas=5, repasos=1, seed=2, stdout=StringIO())
+        self.assertEqual(Card.objects.filter(usuario__username__startswith='test_user_').count(), 10)
+
+
+def _clave_b64(datos):
+    return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+
+def generar_claves_suscripcion():
+    """Claves p256dh y auth como las que genera un navegador al suscribirse"""
+    clave = ec.generate_private_key(ec.SECP256R1())
+    p256dh = clave.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return _clave_b64(p256dh), _clave_b64(os.urandom(16))
+
+
+def generar_clave_vapid():
+    """Clave privada VAPID en el formato de generate_vapid_keys.py"""
+    clave = ec.generate_private_key(ec.SECP256R1())
+    return base64.urlsafe_b64encode(clave.private_bytes(
+        serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )).decode()
+
+
+class ServidorPushFalso(ThreadingHTTPServer):
+    """
+    Servicio push local: responde 201, salvo a los endpoints que terminan en
+    '/gone' (410), '/lento' (tarda más que cualquier timeout de las pruebas),
+    '/saturado' (429 con Retry-After la primera vez) o '/caido' (503 las dos
+    primeras veces)
+    """
+    daemon_threads = True
+    
+    def __init__(self, espera=0.0):
+        self.espera = espera
+        self.peticiones = []
+        super().__init__(('127.0.0.1', 0), ManejadorPushFalso)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+    
+    def url(self, ruta):
+        return f'http://127.0.0.1:{self.server_address[1]}{ruta}'
+    
+    def cerrar(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ManejadorPushFalso(BaseHTTPRequestHandler):
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.peticiones.append((self.path, {clave.lower(): valor for clave, valor in self.headers.items()}))
+        if self.path.endswith('/lento'):
+            time.sleep(2)
+        else:
+            time.sleep(self.server.espera)
+        intentos = sum(1 for ruta, _ in self.server.peticiones if ruta == self.path)
+        if self.path.endswith('/gone'):
+            self.send_response(410)
+        elif self.path.endswith('/saturado') and intentos == 1:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+        elif self.path.endswith('/caido') and intentos <= 2:
+            self.send_response(503)
+        else:
+            self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+
+class PushTests(TestCase):
+    
+    def setUp(self):
+        self.servidor = ServidorPushFalso(espera=0.2)
+        self.addCleanup(self.servidor.cerrar)
+        self.vapid = CredencialesVapid(private_key=generar_clave_vapid(), email='test@rufingo.com')
+    
+    def crear_suscripcion(self, usuario, ruta):
+        p256dh, auth = generar_claves_suscripcion()
+        return Subscription.objects.create(usuario=usuario, endpoint=self.servidor.url(ruta), p256dh=p256dh, auth=auth)
+    
+    def test_envio_concurrente(self):
+        """Los envíos se solapan: 20 endpoints que tardan 0,2 s no suman 4 s"""
+        user = User.objects.create_user(username='push', password='12345')
+        envios = [(self.crear_suscripcion(user, f'/push/{i}'), mensaje_pendientes(3)) for i in range(20)]
+        
+        resumen = enviar_notificaciones(envios, self.vapid, concurrencia=20, timeout=5)
+        
+        self.assertEqual(resumen.enviadas, 20)
+        self.assertLess(resumen.duracion, 2)
+        # Todas las peticiones llevan la firma VAPID y el contenido cifrado
+        for _, cabeceras in self.servidor.peticiones:
+            self.assertTrue(cabeceras['authorization'].startswith('vapid '))
+            self.assertEqual(cabeceras['content-encoding'], 'aes128gcm')
+    
+    def test_envio_por_tandas(self):
+        """Un iterador de envíos se consume por tandas y se envía entero"""
+        user = User.objects.create_user(username='push', password='12345')
+        suscripciones = [self.crear_suscripcion(user, f'/push/{i}') for i in range(10)]
+        envios = ((suscripcion, mensaje_pendientes(1)) for suscripcion in suscripciones)
+        
+        with mock.patch('flashcards.push.TANDA_ENVIOS', 4):
+            resumen = enviar_notificaciones(envios, self.vapid, concurrencia=10, timeout=5)
+        
+        self.assertEqual(resumen.enviadas, 10)
+        self.assertEqual([r.suscripcion for r in resumen.resultados], suscripciones)
+        self.assertEqual(enviar_notificaciones(iter(()), self.vapid).resultados, [])
+    
+    def test_timeout_por_endpoint(self):
+        """Un endpoint lento solo falla él, sin retrasar al resto"""
+        user = User.objects.create_user(username='push', password='12345')
+        envios = [
+            (self.crear_suscripcion(user, '/push/lento'), mensaje_pendientes(1)),
+            (self.crear_suscripcion(user, '/push/rapido'), mensaje_pendientes(1)),
+        ]
+        
+        resumen = enviar_notificaciones(envios, self.vapid, concurrencia=2, timeout=0.5)
+        
+        lento, rapido = resumen.resultados
+        self.assertEqual(lento.error, 'timeout')
+        self.assertTrue(rapido.ok)
+        self.assertEqual(resumen.fallidas, 1)
+    
+    def test_comando_send_due_notifications(self):
+        """El comando notifica a quien tiene tarjetas pendientes y borra las suscripciones caducadas"""
+        pasado = timezone.now() - timedelta(hours=1)
+        con_pendientes = User.objects.create_user(username='pendientes', password='12345')
+        al_dia = User.objects.create_user(username='al_dia', password='12345')
+        Card.objects.create(usuario=con_pendientes, frente='a', reverso='a', estado='aprendizaje', siguiente_repeticion=pasado)
+        Card.objects.create(usuario=al_dia, frente='b', reverso='b')
+        self.crear_suscripcion(con_pendientes, '/push/ok')
+        caducada = self.crear_suscripcion(con_pendientes, '/push/gone')
+        self.crear_suscripcion(al_dia, '/push/al-dia')
+        
+        salida = StringIO()
+        with mock.patch.dict(os.environ, {'VAPID_PRIVATE_KEY': generar_clave_vapid()}):
+            call_command('send_due_notifications', concurrencia=4, timeout=5, stdout=salida)
+        
+        self.assertEqual(sorted(ruta for ruta, _ in self.servidor.peticiones), ['/push/gone', '/push/ok'])
+        self.assertFalse(Subscription.objects.filter(pk=caducada.pk).exists())
+        self.assertIn('1 notificación(es) enviada(s)', salida.getvalue())
+    
+    def test_reintentos_y_borrado_en_bloque(self):
+        """429 y 5xx se reintentan; las suscripciones 404/410 se borran con un único DELETE"""
+        pasado = timezone.now() - timedelta(hours=1)
+        user = User.objects.create_user(username='push', password='12345')
+        Card.objects.create(usuario=user, frente='a', reverso='a', estado='aprendizaje', siguiente_repeticion=pasado)
+        for ruta in ['/push/saturado', '/push/caido', '/push/1/gone', '/push/2/gone', '/push/3/gone']:
+            self.crear_suscripcion(user, ruta)
+        
+        salida = StringIO()
+        with mock.patch.dict(os.environ, {'VAPID_PRIVATE_KEY': generar_clave_vapid()}), \
+                mock.patch('flashcards.push.BACKOFF_BASE', 0.01), \
+                CaptureQueriesContext(connection) as consultas:
+            call_command('send_due_notifications', timeout=5, stdout=salida)
+        
+        rutas = [ruta for ruta, _ in self.servidor.peticiones]
+        self.assertEqual(rutas.count('/push/saturado'), 2)
+        self.assertEqual(rutas.count('/push/caido'), 3)
+        self.assertEqual(
+            sorted(Subscription.objects.values_list('endpoint', flat=True)),
+            [self.servidor.url('/push/caido'), self.servidor.url('/push/saturado')],
+        )
+        borrados = [q for q in consultas.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(borrados), 1)
+        self.assertIn('2 notificación(es) enviada(s), 3 fallida(s), 3 reintento(s)', salida.getvalue())
+    
+    def test_espera_reintento(self):
+        """Retry-After manda (en segundos o como fecha); si no hay, backoff exponencial acotado"""
+        self.assertEqual(espera_reintento(1, '7'), 7)
+        self.assertEqual(espera_reintento(1, '100000'), BACKOFF_MAXIMO)
+        fecha = formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(espera_reintento(1, fecha), 30, delta=2)
+        self.assertTrue(0.5 <= espera_reintento(1, base=1) <= 1.5)
+        self.assertTrue(4 <= espera_reintento(4, base=1) <= 12)
+        self.assertEqual(espera_reintento(20, base=1), BACKOFF_MAXIMO)
+    
+    def test_suscripciones_con_pendientes_en_una_consulta(self):
+        """Los pendientes de todos los usuarios suscritos se obtienen en una sola consulta"""
+        pasado = timezone.now() - timedelta(hours=1)
+        for i in range(5):
+            user = User.objects.create_user(username=f'user{i}', password='12345')
+            for j in range(i):
+                Card.objects.create(usuario=user, frente='a', reverso='a', estado='aprendizaje', siguiente_repeticion=pasado)
+            Card.objects.create(usuario=user, frente='n', reverso='n', siguiente_repeticion=pasado)
+            self.crear_suscripcion(user, f'/push/{i}/a')
+            self.crear_suscripcion(user, f'/push/{i}/b')
+        
+        with CaptureQueriesContext(connection) as consultas:
+            pendientes = [(s.usuario.username, s.pendientes) for s in suscripciones_con_pendientes()]
+        
+        # Un solo agregado por usuario unido a las suscripciones, no una subconsulta por fila
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(consultas[0]['sql'].count('COUNT('), 1)
+        self.assertIn('GROUP BY usuario_id', consultas[0]['sql'])
+        # El agregado solo recorre las tarjetas de los usuarios suscritos
+        self.assertIn('usuario_id IN (SELECT usuario_id FROM flashcards_subscription)', consultas[0]['sql'])
+        # user0 no tiene tarjetas vencidas (las nuevas no cuentan)
+        esperado = [(f'user{i}', i) for i in range(1, 5) for _ in range(2)]
+        self.assertEqual(pendientes, esperado)
+        
+        ids = list(User.objects.filter(username__in=['user0', 'user3']).values_list('id', flat=True))
+        self.assertEqual(
+            [(s.usuario.username, s.pendientes) for s in suscripciones_con_pendientes(usuarios=ids)],
+            [('user3', 3), ('user3', 3)]
+        )
+        self.assertEqual(list(suscripciones_con_pendientes(usuarios=[])), [])
+        
+        # Las listas de ids se consultan por tandas, en orden de usuario
+        ids = list(User.objects.filter(username__in=['user4', 'user0', 'user2']).values_list('id', flat=True))
+        with mock.patch('flashcards.stats.TANDA_USUARIOS', 2), CaptureQueriesContext(connection) as consultas:
+            usuarios = [s.usuario.username for s in suscripciones_con_pendientes(usuarios=ids[::-1])]
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(usuarios, ['user2', 'user2', 'user4', 'user4'])
+
+
+@override_settings(CRON_SECRET='secreto')
+class TrabajosNotificacionTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('cron_notificaciones') + '?token=secreto'
+    
+    def test_endpoint_encola_sin_ejecutar(self):
+        """El cron recibe 202 con el id del trabajo; el envío no ocurre en la petición"""
+        with mock.patch('flashcards.trabajos.call_command') as comando:
+            response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, 202)
+        datos = response.json()
+        self.assertTrue(datos['encolado'])
+        self.assertEqual(datos['estado'], 'pendiente')
+        comando.assert_not_called()
+        
+        estado = self.client.get(datos['url_estado'] + '?token=secreto')
+        self.assertEqual(estado.json()['estado'], 'pendiente')
+    
+    def test_token_invalido(self):
+        response = self.client.get(reverse('cron_notificaciones') + '?token=otro')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(TrabajoNotificacion.objects.exists())
+        trabajo = TrabajoNotificacion.objects.create()
+        response = self.client.get(reverse('estado_trabajo_notificaciones', args=[trabajo.id]))
+        self.assertEqual(response.status_code, 403)
+    
+    @override_settings(CRON_SECRET='')
+    def test_sin_secreto_configurado(self):
+        """Sin CRON_SECRET no se acepta ninguna llamada, tampoco sin token"""
+        trabajo = TrabajoNotificacion.objects.create()
+        for url in [reverse('cron_notificaciones'), reverse('cron_notificaciones') + '?token=',
+                    reverse('estado_trabajo_notificaciones', args=[trabajo.id])]:
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+    
+    def test_llamadas_solapadas_no_duplican(self):
+        """Mientras haya un trabajo pendiente o en curso, el cron recibe ese mismo"""
+        primero = self.client.get(self.url).json()
+        segundo = self.client.get(self.url).json()
+        self.assertEqual(primero['trabajo_id'], segundo['trabajo_id'])
+        self.assertFalse(segundo['encolado'])
+        
+        reclamar_trabajo()
+        tercero = self.client.get(self.url).json()
+        self.assertEqual(tercero['trabajo_id'], primero['trabajo_id'])
+        self.assertEqual(tercero['estado'], 'en_curso')
+        self.assertEqual(TrabajoNotificacion.objects.count(), 1)
+        
+        # La restricción también impide un segundo trabajo activo creado por otra vía
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TrabajoNotificacion.objects.create()
+    
+    def test_reclamar_una_sola_vez(self):
+        """Un trabajo solo lo reclama un worker"""
+        trabajo, _ = encolar_trabajo()
+        reclamado = reclamar_trabajo()
+        self.assertEqual(reclamado.id, trabajo.id)
+        self.assertEqual(reclamado.estado, 'en_curso')
+        self.assertEqual(reclamado.intentos, 1)
+        self.assertIsNone(reclamar_trabajo())
+    
+    def test_worker_ejecuta_trabajos(self):
+        """procesar_trabajos ejecuta el comando y guarda su salida; después se puede encolar otro"""
+        trabajo, _ = encolar_trabajo()
+        salida = StringIO()
+        call_command('procesar_trabajos', una_vez=True, stdout=salida)
+        
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertIsNotNone(trabajo.fecha_fin)
+        self.assertIn('Proceso completado', trabajo.resultado)
+        self.assertIn('1 trabajo(s) procesado(s)', salida.getvalue())
+        
+        nuevo, creado = encolar_trabajo()
+        self.assertTrue(creado)
+        self.assertNotEqual(nuevo.id, trabajo.id)
+    
+    def test_error_en_el_comando(self):
+        encolar_trabajo()
+        with mock.patch('flashcards.trabajos.call_command', side_effect=RuntimeError('sin VAPID')):
+            trabajo = ejecutar_trabajo(reclamar_trabajo())
+        self.assertEqual(trabajo.estado, 'error')
+        self.assertIn('sin VAPID', trabajo.resultado)
+    
+    def test_trabajos_abandonados(self):
+        """Un trabajo en curso de un worker caído vuelve a la cola hasta agotar sus intentos"""
+        trabajo, _ = encolar_trabajo()
+        reclamar_trabajo()
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        TrabajoNotificacion.objects.filter(id=trabajo.id).update(fecha_inicio=hace_una_hora, latido=hace_una_hora)
+        
+        self.assertEqual(liberar_trabajos_abandonados(), 1)
+        self.assertEqual(reclamar_trabajo().intentos, 2)
+        
+        TrabajoNotificacion.objects.filter(id=trabajo.id).update(latido=hace_una_hora, intentos=3)
+        self.assertEqual(liberar_trabajos_abandonados(), 0)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'error')
+
+
+    def test_latido(self):
+        """Un trabajo lento que sigue latiendo no se libera; si se libera, su worker deja de ser el dueño"""
+        encolar_trabajo()
+        trabajo = reclamar_trabajo()
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        TrabajoNotificacion.objects.filter(id=trabajo.id).update(fecha_inicio=hace_una_hora)
+        self.assertTrue(latir(trabajo))
+        self.assertEqual(liberar_trabajos_abandonados(), 0)
+        
+        TrabajoNotificacion.objects.filter(id=trabajo.id).update(latido=hace_una_hora)
+        self.assertEqual(liberar_trabajos_abandonados(), 1)
+        segundo = reclamar_trabajo()
+        self.assertFalse(latir(trabajo))
+        
+        # El primer worker termina tarde: no pisa el estado del nuevo intento
+        with mock.patch('flashcards.trabajos.call_command'):
+            ejecutar_trabajo(trabajo)
+        segundo.refresh_from_db()
+        self.assertEqual(segundo.estado, 'en_curso')
+
+
+class NotificacionesProgramadasTests(TestCase):
+    
+    def setUp(self):
+        self.ahora = timezone.now()
+        self.user = User.objects.create_user(username='aviso', password='12345')
+        Subscription.objects.create(usuario=self.user, endpoint='https://push.example.com/aviso', p256dh='x', auth='y')
+    
+    def crear_tarjetas(self, usuario, *horas):
+        for h in horas:
+            Card.objects.create(
+                usuario=usuario, frente='a', reverso='a', estado='aprendizaje',
+                siguiente_repeticion=self.ahora + timedelta(hours=h),
+            )
+    
+    def test_calcular_proxima_notificacion(self):
+        """El aviso toca cuando vence la umbral-ésima tarjeta posterior al último aviso"""
+        self.crear_tarjetas(self.user, -5, 1, 2, 3)
+        Card.objects.create(usuario=self.user, frente='n', reverso='n')  # las nuevas no cuentan
+        settings = self.user.settings
+        
+        settings.umbral_notificacion = 2
+        self.assertEqual(calcular_proxima_notificacion(settings, self.ahora), self.ahora + timedelta(hours=1))
+        
+        settings.ultima_notificacion = self.ahora
+        self.assertEqual(calcular_proxima_notificacion(settings, self.ahora), self.ahora + timedelta(hours=2))
+        
+        # Nunca antes del intervalo mínimo desde el último aviso
+        settings.umbral_notificacion = 1
+        settings.ultima_notificacion = self.ahora + timedelta(minutes=30)
+        self.assertEqual(calcular_proxima_notificacion(settings, self.ahora), self.ahora + timedelta(minutes=90))
+        
+        # Sin tarjetas suficientes se vuelve a mirar pasado el horizonte
+        settings.umbral_notificacion = 10
+        self.assertEqual(calcular_proxima_notificacion(settings, self.ahora), self.ahora + timedelta(days=1))
+    
+    def test_repaso_invalida_la_notificacion(self):
+        """Una respuesta que adelanta un vencimiento marca al usuario para recalcular"""
+        self.crear_tarjetas(self.user, -1)
+        UserSettings.objects.filter(usuario=self.user).update(proxima_notificacion=self.ahora + timedelta(days=2))
+        
+        update_card(Card.objects.get(usuario=self.user), calificacion_base=5, tiempo_respuesta=2)
+        self.assertIsNone(UserSettings.objects.get(usuario=self.user).proxima_notificacion)
+    
+    def test_programador_notifica_solo_a_quien_le_toca(self):
+        otro = User.objects.create_user(username='otro', password='12345')
+        Subscription.objects.create(usuario=otro, endpoint='https://push.example.com/otro', p256dh='x', auth='y')
+        sin_suscripcion = User.objects.create_user(username='sin', password='12345')
+        self.crear_tarjetas(self.user, -2, -1)
+        self.crear_tarjetas(otro, 5)
+        self.crear_tarjetas(sin_suscripcion, -1)
+        
+        programador = ProgramadorNotificaciones()
+        self.assertEqual(programador.recalcular_marcados(self.ahora), 2)
+        self.assertEqual(programador.siguiente(), self.ahora - timedelta(hours=2))
+        
+        with mock.patch('flashcards.notificaciones.enviar_notificaciones', return_value=ResumenEnvio([], 0.0)) as enviar:
+            programador.procesar_vencidas(self.ahora)
+        
+        (envios,), _ = enviar.call_args
+        self.assertEqual([(s.usuario_id, s.pendientes) for s, _ in envios], [(self.user.id, 2)])
+        settings = UserSettings.objects.get(usuario=self.user)
+        self.assertEqual(settings.ultima_notificacion, self.ahora)
+        # Ninguna tarjeta vence después del aviso: se vuelve a mirar pasado el horizonte
+        self.assertEqual(settings.proxima_notificacion, self.ahora + timedelta(days=1))
+        # Lo siguiente en el heap es la tarjeta del otro usuario
+        self.assertEqual(programador.siguiente(), self.ahora + timedelta(hours=5))
+        
+        # Un nuevo arranque del worker recupera lo programado desde la base de datos
+        nuevo = ProgramadorNotificaciones()
+        nuevo.cargar()
+        self.assertEqual(nuevo.programadas, programador.programadas)
+    
+    def test_se_recalcula_al_salir_del_heap(self):
+        """Si las tarjetas se repasaron después de programar el aviso, no se envía y se reprograma"""
+        self.crear_tarjetas(self.user, -1)
+        programador = ProgramadorNotificaciones()
+        programador.recalcular_marcados(self.ahora)
+        Card.objects.filter(usuario=self.user).update(siguiente_repeticion=self.ahora + timedelta(hours=3))
+        
+        with mock.patch('flashcards.notificaciones.enviar_notificaciones') as enviar:
+            self.assertIsNone(programador.procesar_vencidas(self.ahora))
+        
+        enviar.assert_not_called()
+        self.assertEqual(programador.siguiente(), self.ahora + timedelta(hours=3))
+        self.assertEqual(
+            UserSettings.objects.get(usuario=self.user).proxima_notificacion, self.ahora + timedelta(hours=3)
+        )
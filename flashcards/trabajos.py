@@ -0,0 +1,135 @@
+"""
+Cola de trabajos en base de datos para el envío de notificaciones.
+
+El endpoint de cron solo encola (encolar_trabajo) y responde enseguida; el
+comando 'procesar_trabajos' reclama cada trabajo con un UPDATE condicional, de
+modo que aunque haya varios workers o llamadas de cron solapadas, cada trabajo
+se ejecuta una sola vez. Mientras lo ejecuta, el worker renueva su latido: solo
+se devuelve a la cola un trabajo cuyo worker dejó de latir, no uno que va lento.
+"""
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import TrabajoNotificacion
+
+
+TIPO_NOTIFICACIONES = 'notificaciones_pendientes'
+# Comando que ejecuta cada tipo de trabajo
+COMANDOS = {
+    TIPO_NOTIFICACIONES: 'send_due_notifications',
+}
+
+# Un trabajo 'en_curso' sin latido desde hace más que esto se considera abandonado (worker caído)
+EXPIRACION = timedelta(minutes=5)
+# Cada cuánto renueva el worker el latido del trabajo que ejecuta
+LATIDO = timedelta(seconds=30)
+MAX_INTENTOS = 3
+
+
+def encolar_trabajo(tipo=TIPO_NOTIFICACIONES):
+    """
+    Encola un trabajo. Si ya hay uno activo (pendiente o en curso) del mismo
+    tipo lo devuelve en su lugar. Devuelve (trabajo, creado).
+    """
+    activo = TrabajoNotificacion.objects.filter(tipo=tipo, estado__in=TrabajoNotificacion.ACTIVOS).first()
+    if activo is not None:
+        return activo, False
+    try:
+        with transaction.atomic():
+            return TrabajoNotificacion.objects.create(tipo=tipo), True
+    except IntegrityError:
+        # Otra llamada lo encoló a la vez (restricción de un solo trabajo activo)
+        return TrabajoNotificacion.objects.get(tipo=tipo, estado__in=TrabajoNotificacion.ACTIVOS), False
+
+
+def reclamar_trabajo():
+    """
+    Marca como 'en_curso' el trabajo pendiente más antiguo y lo devuelve (None si
+    no hay). El UPDATE solo afecta a filas aún pendientes: si otro worker se
+    adelanta, este prueba con el siguiente.
+    """
+    candidatos = TrabajoNotificacion.objects.filter(estado='pendiente').order_by('fecha_creacion', 'id')
+    for trabajo_id in candidatos.values_list('id', flat=True)[:10]:
+        ahora = timezone.now()
+        reclamado = TrabajoNotificacion.objects.filter(id=trabajo_id, estado='pendiente').update(
+            estado='en_curso',
+            fecha_inicio=ahora,
+            latido=ahora,
+            intentos=F('intentos') + 1,
+        )
+        if reclamado:
+            return TrabajoNotificacion.objects.get(id=trabajo_id)
+    return None
+
+
+def es_dueno(trabajo):
+    """Filtro del trabajo mientras siga en curso en este intento (nadie lo ha vuelto a reclamar)"""
+    return TrabajoNotificacion.objects.filter(id=trabajo.id, estado='en_curso', intentos=trabajo.intentos)
+
+
+def latir(trabajo):
+    """Renueva el latido del trabajo; False si ya no es de este worker (se liberó o terminó)"""
+    return es_dueno(trabajo).update(latido=timezone.now()) > 0
+
+
+@contextmanager
+def latiendo(trabajo, intervalo=LATIDO):
+    """Renueva el latido del trabajo desde un hilo mientras dura el bloque"""
+    parar = threading.Event()
+
+    def latir_periodicamente():
+        try:
+            while not parar.wait(intervalo.total_seconds()):
+                if not latir(trabajo):
+                    break
+        finally:
+            # El hilo abre su propia conexión; cerrarla al terminar
+            connections.close_all()
+
+    hilo = threading.Thread(target=latir_periodicamente, daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        hilo.join()
+
+
+def ejecutar_trabajo(trabajo):
+    """Ejecuta el comando del trabajo y guarda su salida y estado final"""
+    salida = StringIO()
+    try:
+        with latiendo(trabajo):
+            call_command(COMANDOS[trabajo.tipo], stdout=salida)
+        estado, resultado = 'completado', salida.getvalue()
+    except Exception:
+        estado, resultado = 'error', salida.getvalue() + traceback.format_exc()
+
+    es_dueno(trabajo).update(estado=estado, fecha_fin=timezone.now(), resultado=resultado)
+    trabajo.refresh_from_db()
+    return trabajo
+
+
+def liberar_trabajos_abandonados(expiracion=EXPIRACION):
+    """
+    Devuelve a la cola los trabajos 'en_curso' de un worker que murió sin
+    terminarlos (sin latido desde hace 'expiracion'), o los marca como error si
+    ya agotaron sus intentos. Devuelve cuántos trabajos se liberaron.
+    """
+    limite = timezone.now() - expiracion
+    abandonados = TrabajoNotificacion.objects.filter(
+        Q(latido__lt=limite) | Q(latido__isnull=True, fecha_inicio__lt=limite),
+        estado='en_curso',
+    )
+    abandonados.filter(intentos__gte=MAX_INTENTOS).update(
+        estado='error', fecha_fin=timezone.now(), resultado='Abandonado: el worker no terminó el trabajo',
+    )
+    return abandonados.filter(intentos__lt=MAX_INTENTOS).update(estado='pendiente')
@@ -6,6 +6,7 @@ urlpatterns = [
     path('service-worker.js', views.service_worker, name='service_worker'),
 
     path("cron/notificaciones/", views.ejecutar_notificaciones, name="cron_notificaciones"),
+    path("cron/notificaciones/<int:trabajo_id>/", views.estado_trabajo_notificaciones, name="estado_trabajo_notificaciones"),
 
     path('', views.home, name='home'),
     path('tarjetas/', views.lista_tarjetas, name='lista_tarjetas'),
@@ -14,13 +15,17 @@ urlpatterns = [
     path('tarjetas/<int:card_id>/eliminar/', views.eliminar_tarjeta, name='eliminar_tarjeta'),
     path('tarjetas/<int:card_id>/reiniciar/', views.reiniciar_tarjeta, name='reiniciar_tarjeta'),
     path('estadisticas/', views.estadisticas, name='estadisticas'),
+    path('api/pronostico/', views.pronostico_api, name='pronostico_api'),
     
     # Rutas de repaso
     path('repaso/', views.sesion_repaso, name='sesion_repaso'),
     path('api/respuesta/', views.procesar_respuesta, name='procesar_respuesta'),
+    path('api/respuestas/', views.procesar_respuestas_lote, name='procesar_respuestas_lote'),
+    path('api/repaso/cola/', views.cola_repaso_api, name='cola_repaso_api'),
     path('repaso/completado/', views.resultado_repaso, name='resultado_repaso'),
     
     path('api/tarjetas_pendientes/', views.tarjetas_pendientes_api, name='tarjetas_pendientes_api'),
+    path('api/tarjetas_pendientes/stream/', views.tarjetas_pendientes_stream, name='tarjetas_pendientes_stream'),
 
     path('notificaciones/', views.configuracion_notificaciones, name='configuracion_notificaciones'),
     path('api/suscripcion/', views.guardar_suscripcion, name='guardar_suscripcion'),
@@ -1,270 +1,173 @@
-from datetime import timedelta
+from collections import Counter
+from django.db import transaction
 from django.utils import timezone
 from .models import Card, ReviewLog
+from .stats import actualizar_contadores, aplicar_deltas, deltas_contadores, invalidar_cache_usuario
+from .notificaciones import marcar_recalculo
+from .scheduler import (
+    INTERVALOS_FASE_1,
+    INTERVALOS_FASE_2,
+    VENTANA_TIEMPOS,
+    EstadoTarjeta,
+    ajustar_calificacion_por_tiempo,
+    aplicar_transicion_fase,
+    calcular_nuevo_EF,
+    calcular_siguiente_intervalo_fase_1,
+    calcular_siguiente_intervalo_fase_2,
+    calcular_siguiente_intervalo_fase_3,
+    programar,
+    verificar_promocion_fase_1_a_2,
+    verificar_promocion_fase_2_a_3,
+)
 
 
-# Intervalos para cada fase (en segundos)
-INTERVALOS_FASE_1 = [5, 25, 120, 600]  # 5s, 25s, 2min, 10min
-INTERVALOS_FASE_2 = [86400, 259200, 604800, 1209600]  # 1d, 3d, 7d, 14d
+# Columnas que modifica una revisión (el resto de la tarjeta no se reescribe)
+CAMPOS_REPASO = [
+    'estado', 'fase', 'intervalo_actual', 'EF',
+    'ultima_repeticion', 'siguiente_repeticion',
+    'contador_aciertos', 'contador_fallos',
+    'tiempo_respuesta', 'calificacion_ajustada', 'tiempos_recientes',
+]
 
 
-def ajustar_calificacion_por_tiempo(calificacion_base, tiempo_respuesta):
+def guardar_tarjeta(card, antes, campos=None):
     """
-    Ajusta la calificación base según el tiempo de respuesta
-    
-    Calificación base (0-5):
-    5 = Perfecto, respuesta inmediata
-    4 = Correcta con ligera vacilación
-    3 = Correcta con esfuerzo
-    2 = Incorrecta, pero algo recordada
-    1 = Incorrecta, sin recuerdo
-    0 = Olvido total
-    
-    Ajuste por tiempo:
-    0-3s: +0
-    3-6s: -0.5
-    6-10s: -1
-    >10s: -2
-    """
-
-    """
-    De momento no voy a realizar el ajuste de calificacion por tiempo, queda para implementaciones futuras
-    """
-
+    Guarda la tarjeta y ajusta los contadores del usuario en la misma transacción.
+    'antes' es la tupla (estado, fase) que tenía la tarjeta antes del cambio.
+    Si ya hay una transacción abierta se une a ella sin crear un savepoint.
     """
-    if tiempo_respuesta <= 3:
-        ajuste = 0
-    elif tiempo_respuesta <= 6:
-        ajuste = -0.5
-    elif tiempo_respuesta <= 10:
-        ajuste = -1
-    else:
-        ajuste = -2
-    """
-
-    ajuste = 0
-    
-    calificacion_ajustada = max(0, min(5, calificacion_base + ajuste))
-    return calificacion_ajustada
+    with transaction.atomic(savepoint=False):
+        card.save(update_fields=campos)
+        actualizar_contadores(card.usuario_id, antes, (card.estado, card.fase))
+        if card.estado != 'nuevo':
+            # La tarjeta puede adelantar la próxima notificación programada
+            marcar_recalculo(card.usuario_id, card.siguiente_repeticion)
 
 
-def calcular_nuevo_EF(EF_actual, calificacion_ajustada):
+def registrar_repaso(card, antes, log):
     """
-    Calcula el nuevo factor de facilidad según SM-2
-    EF' = EF + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
-    donde q es la calificación (0-5)
+    Persiste una revisión: columnas de programación de la tarjeta, contadores
+    y ReviewLog en una única transacción (un solo commit por respuesta)
     """
-    nuevo_EF = EF_actual + (0.1 - (5 - calificacion_ajustada) * (0.08 + (5 - calificacion_ajustada) * 0.02))
-    # EF mínimo es 1.3
-    return max(1.3, nuevo_EF)
+    with transaction.atomic(savepoint=False):
+        guardar_tarjeta(card, antes, CAMPOS_REPASO)
+        log.save()
 
 
-def calcular_siguiente_intervalo_fase_1(card, es_correcto):
+def aplicar_respuesta(card, calificacion_base, tiempo_respuesta, ahora=None):
     """
-    Calcula el siguiente intervalo para Fase 1 (Aprendizaje Intensivo)
+    Aplica una respuesta a la tarjeta en memoria (sin guardarla) y devuelve el
+    ReviewLog correspondiente, también sin guardar.
+    'ahora' es el momento de la respuesta; por defecto, el instante actual.
+    La lógica de programación vive en scheduler.programar.
     """
-    if not es_correcto:
-        # Si falla, vuelve al primer intervalo
-        return INTERVALOS_FASE_1[0]
+    if ahora is None:
+        ahora = timezone.now()
     
-    # Buscar índice actual
-    try:
-        indice_actual = INTERVALOS_FASE_1.index(int(card.intervalo_actual))
-    except ValueError:
-        indice_actual = 0
+    estado, registro = programar(EstadoTarjeta.desde_tarjeta(card), calificacion_base, tiempo_respuesta, ahora)
+    estado.aplicar_a(card)
     
-    # Avanzar al siguiente intervalo
-    indice_siguiente = min(indice_actual + 1, len(INTERVALOS_FASE_1) - 1)
-    return INTERVALOS_FASE_1[indice_siguiente]
+    return ReviewLog(
+        card=card,
+        fecha=registro.fecha,
+        calificacion_base=registro.calificacion_base,
+        tiempo_respuesta=registro.tiempo_respuesta,
+        calificacion_ajustada=registro.calificacion_ajustada,
+        fase_antes=registro.fase_antes,
+        fase_despues=registro.fase_despues,
+    )
 
 
-def calcular_siguiente_intervalo_fase_2(card, calificacion_ajustada):
+def update_card(card, calificacion_base, tiempo_respuesta, ahora=None, respuesta_id=None):
     """
-    Calcula el siguiente intervalo para Fase 2 (Consolidación)
-    Usa intervalos predefinidos pero considera la calificación
+    Función principal que actualiza una tarjeta después de una revisión.
+    'respuesta_id' es la clave de idempotencia del cliente: si ya existe un
+    ReviewLog con ella, guardar lanza IntegrityError (y no se guarda nada).
     """
-    if calificacion_ajustada < 3:
-        # Si falla, retrocede a Fase 1
-        return None  # Indicador para retroceder
+    antes = (card.estado, card.fase)
+    log = aplicar_respuesta(card, calificacion_base, tiempo_respuesta, ahora)
+    log.respuesta_id = respuesta_id
     
-    # Buscar índice actual en intervalos de Fase 2
-    try:
-        indice_actual = INTERVALOS_FASE_2.index(int(card.intervalo_actual))
-    except ValueError:
-        # Si no está en la lista, empezar desde el principio
-        return INTERVALOS_FASE_2[0]
+    # Guardar la tarjeta y registrar en el historial (una sola transacción)
+    registrar_repaso(card, antes, log)
     
-    # Avanzar al siguiente intervalo
-    if indice_actual < len(INTERVALOS_FASE_2) - 1:
-        return INTERVALOS_FASE_2[indice_actual + 1]
-    else:
-        # Si completó todos los intervalos, usar SM-2 para calcular
-        return card.intervalo_actual * card.EF
-
-
-def calcular_siguiente_intervalo_fase_3(card):
-    """
-    Calcula el siguiente intervalo para Fase 3 (Mantenimiento)
-    Usa el algoritmo SM-2 completo
-    """
-    return card.intervalo_actual * card.EF
-
-
-def verificar_promocion_fase_1_a_2(card):
-    """
-    Verifica si la tarjeta puede promocionar de Fase 1 a Fase 2
-    Condiciones:
-    - 3 aciertos consecutivos
-    - Tiempo promedio < 4 segundos
-    - Completó al menos el intervalo de 10 minutos
-    """
-    if card.contador_aciertos >= 3 and card.intervalo_actual >= 600:
-        # Calcular tiempo promedio de las últimas 3 revisiones
-        ultimas_reviews = card.reviews.order_by('-fecha')[:3]
-        if ultimas_reviews.count() >= 3:
-            tiempo_promedio = sum(r.tiempo_respuesta for r in ultimas_reviews) / 3
-            if tiempo_promedio < 4:
-                return True
-    return False
+    return card
 
 
-def verificar_promocion_fase_2_a_3(card):
+def momento_respuesta(answered_at, ultima_repeticion=None, ahora=None):
     """
-    Verifica si la tarjeta puede promocionar de Fase 2 a Fase 3
-    Condiciones:
-    - Completó 3-5 intervalos sin fallos
-    - Está en el último intervalo de Fase 2 o más
+    Momento de una respuesta reenviada (p. ej. dada sin conexión): su answered_at
+    o ahora. Un reloj adelantado no puede programar desde el futuro ni uno
+    atrasado antes de la última repetición de la tarjeta. Las respuestas en
+    vivo no pasan por aquí: usan la hora del servidor.
     """
-    if card.contador_aciertos >= 3 and card.intervalo_actual >= INTERVALOS_FASE_2[-1]:
-        return True
-    return False
+    if ahora is None:
+        ahora = timezone.now()
+    momento = min(answered_at or ahora, ahora)
+    if ultima_repeticion is not None:
+        momento = max(momento, ultima_repeticion)
+    return momento
 
 
-def aplicar_transicion_fase(card, calificacion_ajustada):
+def update_cards_lote(usuario, respuestas):
     """
-    Aplica las transiciones entre fases según el rendimiento
-    """
-    fase_anterior = card.fase
-    
-    if card.fase == 1:
-        # Verificar promoción a Fase 2
-        if verificar_promocion_fase_1_a_2(card):
-            card.fase = 2
-            card.estado = 'consolidacion'
-            card.intervalo_actual = INTERVALOS_FASE_2[0]  # Empezar con 1 día
-            card.contador_aciertos = 0  # Resetear contador
-            print(f"✅ Tarjeta promocionada a Fase 2")
-    
-    elif card.fase == 2:
-        # Verificar retroceso a Fase 1
-        if calificacion_ajustada < 3 or (calificacion_ajustada < 4 and card.tiempo_respuesta > 10):
-            card.fase = 1
-            card.estado = 'aprendizaje'
-            card.intervalo_actual = INTERVALOS_FASE_1[0]
-            card.contador_aciertos = 0
-            print(f"⬇️ Tarjeta retrocedió a Fase 1")
-        # Verificar promoción a Fase 3
-        elif verificar_promocion_fase_2_a_3(card):
-            card.fase = 3
-            card.estado = 'maduro'
-            card.intervalo_actual = 2592000  # 30 días en segundos
-            card.contador_aciertos = 0
-            print(f"✅ Tarjeta promocionada a Fase 3")
-    
-    elif card.fase == 3:
-        # Verificar retroceso a Fase 2
-        if calificacion_ajustada < 3:
-            card.fase = 2
-            card.estado = 'consolidacion'
-            card.intervalo_actual = INTERVALOS_FASE_2[0]
-            card.contador_aciertos = 0
-            print(f"⬇️ Tarjeta retrocedió a Fase 2")
+    Aplica en orden una lista de respuestas del usuario en una sola transacción.
+    Cada respuesta es un dict con card_id, calificacion_base, tiempo_respuesta,
+    answered_at (datetime o None) y respuesta_id (UUID o None). Las tarjetas se
+    guardan con un bulk_update y los ReviewLog con un bulk_create.
     
-    return fase_anterior
-
-
-def update_card(card, calificacion_base, tiempo_respuesta):
-    """
-    Función principal que actualiza una tarjeta después de una revisión
+    Devuelve una lista con el resultado de cada respuesta:
+    'aplicada', 'duplicada' (su respuesta_id ya estaba registrada, p. ej. una
+    respuesta que se reenvía) o 'no_encontrada'.
     """
-    # 1. Ajustar calificación por tiempo
-    calificacion_ajustada = ajustar_calificacion_por_tiempo(calificacion_base, tiempo_respuesta)
-    
-    # 2. Actualizar EF solo si la calificación es >= 3
-    if calificacion_ajustada >= 3:
-        card.EF = calcular_nuevo_EF(card.EF, calificacion_ajustada)
-    
-    # 3. Actualizar contadores
-    if calificacion_ajustada >= 4:
-        card.contador_aciertos += 1
-        card.contador_fallos = 0  # Resetear fallos
-    else:
-        card.contador_fallos += 1
-        card.contador_aciertos = 0  # Resetear aciertos
-    
-    # 4. Guardar datos de la última respuesta
-    card.tiempo_respuesta = tiempo_respuesta
-    card.calificacion_ajustada = calificacion_ajustada
-    card.ultima_repeticion = timezone.now()
-    
-    # 5. Aplicar transiciones de fase
-    fase_anterior = aplicar_transicion_fase(card, calificacion_ajustada)
-
-    # Si cambió de fase, no recalcular el intervalo en esta misma llamada
-    if card.fase != fase_anterior:
-        card.siguiente_repeticion = timezone.now() + timedelta(seconds=card.intervalo_actual)
-        card.save()
-        ReviewLog.objects.create(
-            card=card,
-            calificacion_base=calificacion_base,
-            tiempo_respuesta=tiempo_respuesta,
-            calificacion_ajustada=calificacion_ajustada,
-            fase_antes=fase_anterior,
-            fase_despues=card.fase,
+    ahora = timezone.now()
+    ids = {respuesta['card_id'] for respuesta in respuestas}
+    claves = {respuesta['respuesta_id'] for respuesta in respuestas if respuesta.get('respuesta_id')}
+    
+    with transaction.atomic():
+        cards = Card.objects.select_for_update().filter(usuario=usuario, id__in=ids).in_bulk()
+        antes = {card_id: (card.estado, card.fase) for card_id, card in cards.items()}
+        registradas = set(
+            ReviewLog.objects.filter(respuesta_id__in=claves).values_list('respuesta_id', flat=True)
         )
-        return card
-    
-    # 6. Calcular siguiente intervalo según la fase
-    nuevo_intervalo = None
-    
-    if card.fase == 1:
-        es_correcto = calificacion_ajustada >= 4
-        nuevo_intervalo = calcular_siguiente_intervalo_fase_1(card, es_correcto)
-    
-    elif card.fase == 2:
-        nuevo_intervalo = calcular_siguiente_intervalo_fase_2(card, calificacion_ajustada)
-        if nuevo_intervalo is None:
-            # Retroceder a Fase 1
-            card.fase = 1
-            card.estado = 'aprendizaje'
-            nuevo_intervalo = INTERVALOS_FASE_1[0]
-            card.contador_aciertos = 0
-    
-    elif card.fase == 3:
-        nuevo_intervalo = calcular_siguiente_intervalo_fase_3(card)
-    
-    # 7. Actualizar intervalo y siguiente repetición
-    card.intervalo_actual = nuevo_intervalo
-    card.siguiente_repeticion = timezone.now() + timedelta(seconds=nuevo_intervalo)
-    
-    # 8. Cambiar estado si es necesario
-    if card.estado == 'nuevo':
-        card.estado = 'aprendizaje'
-    
-    # 9. Guardar la tarjeta
-    card.save()
-    
-    # 10. Registrar en el historial
-    ReviewLog.objects.create(
-        card=card,
-        calificacion_base=calificacion_base,
-        tiempo_respuesta=tiempo_respuesta,
-        calificacion_ajustada=calificacion_ajustada,
-        fase_antes=fase_anterior,
-        fase_despues=card.fase
-    )
-    
-    return card
+        
+        resultados = []
+        logs = []
+        for respuesta in respuestas:
+            card = cards.get(respuesta['card_id'])
+            if card is None:
+                resultados.append('no_encontrada')
+                continue
+            
+            clave = respuesta.get('respuesta_id')
+            if clave in registradas:
+                resultados.append('duplicada')
+                continue
+            
+            momento = momento_respuesta(respuesta.get('answered_at'), card.ultima_repeticion, ahora)
+            log = aplicar_respuesta(card, respuesta['calificacion_base'], respuesta['tiempo_respuesta'], momento)
+            if clave:
+                log.respuesta_id = clave
+                registradas.add(clave)
+            logs.append(log)
+            resultados.append('aplicada')
+        
+        modificadas = {log.card_id for log in logs}
+        Card.objects.bulk_update([cards[card_id] for card_id in modificadas], CAMPOS_REPASO)
+        ReviewLog.objects.bulk_create(logs)
+        
+        deltas = Counter()
+        for card_id in modificadas:
+            card = cards[card_id]
+            deltas.update(deltas_contadores(antes[card_id], (card.estado, card.fase)))
+        aplicar_deltas(usuario, deltas)
+        invalidar_cache_usuario(usuario.id)
+        
+        vencimientos = [cards[card_id].siguiente_repeticion for card_id in modificadas]
+        if vencimientos:
+            marcar_recalculo(usuario.id, min(vencimientos))
+    
+    return resultados
 
 
 def get_next_card(usuario):
@@ -286,3 +189,23 @@ def get_next_card(usuario):
         return tarjeta_vencida
     
     return None
+
+
+def get_cola_repaso(usuario, limite, excluir=()):
+    """
+    Obtiene hasta 'limite' tarjetas vencidas en orden de vencimiento,
+    omitiendo las de 'excluir' (ya en la cola del cliente o respondiéndose)
+    """
+    ahora = timezone.now()
+    
+    tarjetas = Card.objects.filter(
+        usuario=usuario,
+        siguiente_repeticion__lte=ahora
+    ).exclude(estado='nuevo')
+    
+    if excluir:
+        tarjetas = tarjetas.exclude(id__in=excluir)
+    
+    return list(tarjetas.only(
+        'id', 'frente', 'reverso', 'estado', 'fase', 'intervalo_actual', 'siguiente_repeticion'
+    )[:limite])
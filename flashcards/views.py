@@ -1,36 +1,91 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from .models import Card, UserSettings, ReviewLog, Subscription 
-from .utils import get_next_card, update_card
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from .models import Card, UserSettings, ReviewLog, Subscription, TrabajoNotificacion
+from .utils import (
+    get_next_card, get_cola_repaso, update_card, update_cards_lote,
+    guardar_tarjeta,
+)
+from .stats import (
+    PRONOSTICO_DIAS, estadisticas_usuario, actualizar_contadores, estado_pendientes, pronostico_repasos,
+    clave_pendientes, estado_vigente,
+)
+from .search import buscar_tarjetas
+from .trabajos import encolar_trabajo
+from .eventos import EscuchaCambios
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Substr
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from django.views.decorators.http import require_POST
+import base64
+import hmac
 import json
+import math
 import os
+import time
+import uuid
 from django.conf import settings
 from django.contrib.auth import logout
 from django.shortcuts import redirect
 from flashcards.models import Subscription
 from django.http import HttpResponse
 from django.views.decorators.cache import never_cache
-from django.core.management import call_command
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 
-import traceback
+
+def token_cron_valido(request):
+    """El cron se autentica con ?token=CRON_SECRET; sin CRON_SECRET configurado no se acepta ninguno"""
+    secreto = getattr(settings, "CRON_SECRET", None)
+    token = request.GET.get("token")
+    if not secreto or not token:
+        return False
+    return hmac.compare_digest(token.encode(), secreto.encode())
+
+
+def trabajo_json(trabajo):
+    return {
+        "trabajo_id": trabajo.id,
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado,
+        "fecha_creacion": trabajo.fecha_creacion.isoformat(),
+        "fecha_inicio": trabajo.fecha_inicio.isoformat() if trabajo.fecha_inicio else None,
+        "fecha_fin": trabajo.fecha_fin.isoformat() if trabajo.fecha_fin else None,
+        "intentos": trabajo.intentos,
+        "url_estado": reverse("estado_trabajo_notificaciones", args=[trabajo.id]),
+    }
+
+
 @csrf_exempt
 def ejecutar_notificaciones(request):
-    token = request.GET.get("token")
-    if token != getattr(settings, "CRON_SECRET", None):
+    """
+    Encola el envío de notificaciones y responde 202 de inmediato; lo ejecuta
+    el worker 'procesar_trabajos'. Si ya hay un envío pendiente o en curso,
+    devuelve ese en lugar de crear otro.
+    """
+    if not token_cron_valido(request):
         return JsonResponse({"error": "unauthorized"}, status=403)
-    try:
-        call_command("send_due_notifications")
-        return JsonResponse({"ok": True, "message": "Notificacion enviada correctamente"})
-    except Exception as e:
-        print(" Error ejecutando comando:", e)
-        traceback.print_exc()
-        return JsonResponse({"error": str(e)}, status=500)
-        
+
+    trabajo, creado = encolar_trabajo()
+    return JsonResponse({"ok": True, "encolado": creado, **trabajo_json(trabajo)}, status=202)
+
+
+def estado_trabajo_notificaciones(request, trabajo_id):
+    """Estado de un trabajo de notificaciones encolado por el cron"""
+    if not token_cron_valido(request):
+        return JsonResponse({"error": "unauthorized"}, status=403)
+
+    trabajo = get_object_or_404(TrabajoNotificacion, id=trabajo_id)
+    return JsonResponse({**trabajo_json(trabajo), "resultado": trabajo.resultado})
+
 @login_required
 @never_cache
 def home(request):
@@ -38,28 +93,18 @@ def home(request):
     user = request.user
     
     # Obtener estadísticas
-    total_tarjetas = Card.objects.filter(usuario=user).count()
-    tarjetas_aprendizaje = Card.objects.filter(usuario=user, estado='aprendizaje').count()
-    tarjetas_consolidacion = Card.objects.filter(usuario=user, estado='consolidacion').count()
-    tarjetas_maduras = Card.objects.filter(usuario=user, estado='maduro').count()
-    
-    # Tarjetas pendientes (vencidas)
-    ahora = timezone.now()
-    tarjetas_pendientes = Card.objects.filter(
-        usuario=user,
-        siguiente_repeticion__lte=ahora
-    ).exclude(estado='nuevo').count()
+    stats = estadisticas_usuario(user)
 
     # Settings del usuario
     settings = user.settings
     settings.reset_contador_si_necesario()
     
     context = {
-        'total_tarjetas': total_tarjetas,
-        'tarjetas_aprendizaje': tarjetas_aprendizaje,
-        'tarjetas_consolidacion': tarjetas_consolidacion,
-        'tarjetas_maduras': tarjetas_maduras,
-        'tarjetas_pendientes': tarjetas_pendientes,
+        'total_tarjetas': stats['total_tarjetas'],
+        'tarjetas_aprendizaje': stats['aprendizaje'],
+        'tarjetas_consolidacion': stats['consolidacion'],
+        'tarjetas_maduras': stats['maduras'],
+        'tarjetas_pendientes': stats['pendientes'],
         'tarjetas_nuevas_hoy': settings.tarjetas_nuevas_hoy,
         'max_tarjetas_nuevas': settings.max_tarjetas_nuevas_diarias,
     }
@@ -68,10 +113,50 @@ def home(request):
     
     return render(request, 'flashcards/home.html', context)
 
+
+TARJETAS_POR_PAGINA = 50
+LARGO_FRENTE_LISTA = 200
+LARGO_REVERSO_LISTA = 300
+
+
+def recortar(texto, largo):
+    """Recorta el texto a 'largo' caracteres, indicando con '…' si se cortó"""
+    return texto[:largo] + '…' if len(texto) > largo else texto
+
+
+def crear_cursor(clave, card_id):
+    """Cursor opaco con la posición (clave de orden, id) de la última tarjeta de la página"""
+    valor = f'{clave}|{card_id}'
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def leer_cursor(valor, convertir):
+    """
+    (clave, id) del cursor, con la clave pasada por 'convertir', o None si
+    falta o no es válido (primera página)
+    """
+    if not valor:
+        return None
+    try:
+        clave, card_id = base64.urlsafe_b64decode(valor + '=' * (-len(valor) % 4)).decode().split('|')
+        clave = convertir(clave)
+        card_id = int(card_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if clave is None:
+        return None
+    return clave, card_id
+
+
 @login_required
 @never_cache
 def lista_tarjetas(request):
-    """Vista para listar todas las tarjetas con filtros"""
+    """
+    Vista para listar las tarjetas con filtros, paginada por keyset sobre
+    (fecha_creacion, id): cada página cuesta lo mismo aunque el usuario tenga
+    decenas de miles de tarjetas. Con búsqueda, el orden es por relevancia
+    y el keyset sobre (rango, id).
+    """
     user = request.user
     
     # Filtros
@@ -88,19 +173,61 @@ def lista_tarjetas(request):
         tarjetas = tarjetas.filter(fase=int(filtro_fase))
     
     if busqueda:
-        tarjetas = tarjetas.filter(frente__icontains=busqueda) | tarjetas.filter(reverso__icontains=busqueda)
+        tarjetas = buscar_tarjetas(tarjetas, busqueda)
+        orden = ('rango', '-id')
+        cursor = leer_cursor(request.GET.get('cursor', ''), float)
+        if cursor:
+            rango, card_id = cursor
+            tarjetas = tarjetas.filter(Q(rango__gt=rango) | Q(rango=rango, id__lt=card_id))
+    else:
+        orden = ('-fecha_creacion', '-id')
+        cursor = leer_cursor(request.GET.get('cursor', ''), parse_datetime)
+        if cursor:
+            fecha, card_id = cursor
+            tarjetas = tarjetas.filter(Q(fecha_creacion__lt=fecha) | Q(fecha_creacion=fecha, id__lt=card_id))
+    
+    # Solo las columnas que muestra la lista; los textos llegan ya recortados
+    tarjetas = list(
+        tarjetas.order_by(*orden)
+        .only('id', 'estado', 'fase', 'contador_aciertos', 'contador_fallos', 'fecha_creacion')
+        .annotate(
+            frente_corto=Substr('frente', 1, LARGO_FRENTE_LISTA + 1),
+            reverso_corto=Substr('reverso', 1, LARGO_REVERSO_LISTA + 1),
+        )[:TARJETAS_POR_PAGINA + 1]
+    )
     
-    tarjetas = tarjetas.order_by('-fecha_creacion')
+    # Se pide una tarjeta de más para saber si hay página siguiente
+    url_siguiente = None
+    if len(tarjetas) > TARJETAS_POR_PAGINA:
+        tarjetas = tarjetas[:TARJETAS_POR_PAGINA]
+        parametros = request.GET.copy()
+        ultima = tarjetas[-1]
+        clave = repr(ultima.rango) if busqueda else ultima.fecha_creacion.isoformat()
+        parametros['cursor'] = crear_cursor(clave, ultima.id)
+        url_siguiente = '?' + parametros.urlencode()
+    
+    for tarjeta in tarjetas:
+        tarjeta.frente_corto = recortar(tarjeta.frente_corto, LARGO_FRENTE_LISTA)
+        tarjeta.reverso_corto = recortar(tarjeta.reverso_corto, LARGO_REVERSO_LISTA)
+    
+    url_primera = None
+    if cursor:
+        parametros = request.GET.copy()
+        del parametros['cursor']
+        url_primera = '?' + parametros.urlencode()
     
     context = {
         'tarjetas': tarjetas,
         'filtro_estado': filtro_estado,
         'filtro_fase': filtro_fase,
         'busqueda': busqueda,
+        'url_siguiente': url_siguiente,
+        'url_primera': url_primera,
     }
     
     return render(request, 'flashcards/lista_tarjetas.html', context)
 
+
 @login_required
 @never_cache
 def crear_tarjeta(request):
@@ -122,16 +249,18 @@ def crear_tarjeta(request):
             messages.error(request, 'Límite de tarjetas diarias alcanzado')
             return render(request, 'flashcards/crear_tarjeta.html')
             
-        settings.save()
+        with transaction.atomic():
+            settings.save()
 
-        # Crear la tarjeta
-        Card.objects.create(
-            usuario=request.user,
-            frente=frente,
-            reverso=reverso,
-            estado='aprendizaje',
-            siguiente_repeticion=timezone.now()
-        )
+            # Crear la tarjeta
+            tarjeta = Card.objects.create(
+                usuario=request.user,
+                frente=frente,
+                reverso=reverso,
+                estado='aprendizaje',
+                siguiente_repeticion=timezone.now()
+            )
+            actualizar_contadores(usuario, despues=(tarjeta.estado, tarjeta.fase))
         
         messages.success(request, '✅ Tarjeta creada exitosamente.')
         return redirect('crear_tarjeta')
@@ -168,7 +297,9 @@ def eliminar_tarjeta(request, card_id):
     tarjeta = get_object_or_404(Card, id=card_id, usuario=request.user)
     
     if request.method == 'POST':
-        tarjeta.delete()
+        with transaction.atomic():
+            tarjeta.delete()
+            actualizar_contadores(request.user, antes=(tarjeta.estado, tarjeta.fase))
         messages.success(request, '🗑️ Tarjeta eliminada exitosamente.')
         return redirect('lista_tarjetas')
     
@@ -181,6 +312,7 @@ def reiniciar_tarjeta(request, card_id):
     tarjeta = get_object_or_404(Card, id=card_id, usuario=request.user)
     
     if request.method == 'POST':
+        antes = (tarjeta.estado, tarjeta.fase)
         tarjeta.estado = 'aprendizaje'
         tarjeta.fase = 1
         tarjeta.intervalo_actual = 5.0
@@ -188,7 +320,7 @@ def reiniciar_tarjeta(request, card_id):
         tarjeta.contador_aciertos = 0
         tarjeta.contador_fallos = 0
         tarjeta.siguiente_repeticion = timezone.now()
-        tarjeta.save()
+        guardar_tarjeta(tarjeta, antes)
         
         messages.success(request, '🔄 Progreso de la tarjeta reiniciado.')
         return redirect('lista_tarjetas')
@@ -201,41 +333,52 @@ def estadisticas(request):
     """Vista de estadísticas detalladas"""
     user = request.user
     
-    # Estadísticas generales
-    total_tarjetas = Card.objects.filter(usuario=user).count()
+    # Total, por fase, por estado y pendientes en una sola consulta
+    stats = estadisticas_usuario(user)
     
-    # Por fase
-    fase_1 = Card.objects.filter(usuario=user, fase=1).count()
-    fase_2 = Card.objects.filter(usuario=user, fase=2).count()
-    fase_3 = Card.objects.filter(usuario=user, fase=3).count()
-    
-    # Por estado
-    nuevas = Card.objects.filter(usuario=user, estado='nuevo').count()
-    aprendizaje = Card.objects.filter(usuario=user, estado='aprendizaje').count()
-    consolidacion = Card.objects.filter(usuario=user, estado='consolidacion').count()
-    maduras = Card.objects.filter(usuario=user, estado='maduro').count()
-    
-    # Tarjetas pendientes hoy
-    ahora = timezone.now()
-    pendientes_hoy = Card.objects.filter(
-        usuario=user,
-        siguiente_repeticion__lte=ahora
-    ).exclude(estado='nuevo').count()
+    # Histograma de repasos de los próximos días (cacheado)
+    dias_pronostico = 90 if request.GET.get('pronostico') == '90' else 30
+    pronostico = pronostico_repasos(user.id, dias_pronostico)
+    maximo = max((repasos for _, repasos in pronostico), default=0) or 1
     
     context = {
-        'total_tarjetas': total_tarjetas,
-        'fase_1': fase_1,
-        'fase_2': fase_2,
-        'fase_3': fase_3,
-        'nuevas': nuevas,
-        'aprendizaje': aprendizaje,
-        'consolidacion': consolidacion,
-        'maduras': maduras,
-        'pendientes_hoy': pendientes_hoy,
+        'total_tarjetas': stats['total_tarjetas'],
+        'fase_1': stats['fase_1'],
+        'fase_2': stats['fase_2'],
+        'fase_3': stats['fase_3'],
+        'nuevas': stats['nuevas'],
+        'aprendizaje': stats['aprendizaje'],
+        'consolidacion': stats['consolidacion'],
+        'maduras': stats['maduras'],
+        'pendientes_hoy': stats['pendientes'],
+        'dias_pronostico': dias_pronostico,
+        'pronostico': [
+            {'fecha': fecha, 'repasos': repasos, 'altura': round(repasos * 100 / maximo)}
+            for fecha, repasos in pronostico
+        ],
+        'total_pronostico': sum(repasos for _, repasos in pronostico),
     }
     
     return render(request, 'flashcards/estadisticas.html', context)
 
+
+@login_required
+def pronostico_api(request):
+    """Repasos que vencen cada día de los próximos 30 o 90 días (?dias=)"""
+    try:
+        dias = int(request.GET.get('dias', 30))
+    except ValueError:
+        dias = None
+    if dias not in PRONOSTICO_DIAS:
+        return JsonResponse({'error': f'dias debe ser uno de {list(PRONOSTICO_DIAS)}'}, status=400)
+    
+    pronostico = pronostico_repasos(request.user.id, dias)
+    return JsonResponse({
+        'dias': dias,
+        'total': sum(repasos for _, repasos in pronostico),
+        'pronostico': [{'fecha': fecha.isoformat(), 'repasos': repasos} for fecha, repasos in pronostico],
+    })
+
 @login_required
 def sesion_repaso(request):
     """Vista principal de la sesión de repaso"""
@@ -250,32 +393,102 @@ def sesion_repaso(request):
     
     context = {
         'card': card,
+        'tarjeta_inicial': tarjeta_json(card),
     }
     
     return render(request, 'flashcards/sesion_repaso.html', context)
 
+def tarjeta_json(card):
+    """Datos de una tarjeta que necesita la sesión de repaso en el cliente"""
+    return {
+        'id': card.id,
+        'frente': card.frente,
+        'reverso': card.reverso,
+        'estado': card.estado,
+        'estado_display': card.get_estado_display(),
+        'fase': card.fase,
+        'intervalo_actual': card.intervalo_actual,
+        'siguiente_repeticion': card.siguiente_repeticion.isoformat(),
+    }
+
+@login_required
+@never_cache
+def cola_repaso_api(request):
+    """Devuelve un lote con las próximas tarjetas vencidas para la cola del cliente"""
+    try:
+        limite = max(1, min(int(request.GET.get('n', 20)), 100))
+        excluir = [int(card_id) for card_id in request.GET.get('excluir', '').split(',') if card_id]
+    except ValueError:
+        return JsonResponse({'error': 'Datos inválidos'}, status=400)
+    
+    tarjetas = get_cola_repaso(request.user, limite, excluir)
+    return JsonResponse({'tarjetas': [tarjeta_json(card) for card in tarjetas]})
+
+def tiempo_valido(tiempo_respuesta):
+    """Un tiempo de respuesta finito y no negativo (float() acepta 'nan' e 'inf')"""
+    return math.isfinite(tiempo_respuesta) and tiempo_respuesta >= 0
+
+def leer_respuesta_id(valor):
+    """Convierte la clave de idempotencia (UUID) enviada por el cliente; lanza ValueError si no es válida"""
+    if not valor:
+        return None
+    return uuid.UUID(str(valor))
+
+def leer_fecha_respuesta(valor):
+    """Convierte el answered_at ISO 8601 enviado por el cliente; lanza ValueError si no es válido"""
+    if not valor:
+        return None
+    fecha = parse_datetime(valor)
+    if fecha is None:
+        raise ValueError('Fecha de respuesta inválida')
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
 @login_required
 @require_POST
 def procesar_respuesta(request):
     """Procesa la respuesta del usuario a una tarjeta"""
     try:
         data = json.loads(request.body)
-        card_id = data.get('card_id')
-        calificacion_base = int(data.get('calificacion_base'))
-        tiempo_respuesta = float(data.get('tiempo_respuesta'))
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Datos inválidos'}, status=400)
+        try:
+            card_id = data.get('card_id')
+            calificacion_base = int(data.get('calificacion_base'))
+            tiempo_respuesta = float(data.get('tiempo_respuesta'))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'Datos inválidos'}, status=400)
         
         # Validar datos
-        if not card_id or calificacion_base < 0 or calificacion_base > 5:
+        if not card_id or calificacion_base < 0 or calificacion_base > 5 or not tiempo_valido(tiempo_respuesta):
+            return JsonResponse({'error': 'Datos inválidos'}, status=400)
+        try:
+            respuesta_id = leer_respuesta_id(data.get('respuesta_id'))
+        except ValueError:
             return JsonResponse({'error': 'Datos inválidos'}, status=400)
         
-        # Obtener tarjeta
-        card = get_object_or_404(Card, id=card_id, usuario=request.user)
-        
-        # Actualizar tarjeta
-        update_card(card, calificacion_base, tiempo_respuesta)
-        
-        # Obtener siguiente tarjeta
-        siguiente_card = get_next_card(request.user)
+        # Respuesta en vivo: se programa con la hora del servidor (el answered_at del
+        # cliente solo cuenta al reenviar respuestas dadas sin conexión, por lote)
+        try:
+            with transaction.atomic():
+                # Obtener tarjeta (bloqueada hasta el commit en motores que lo soportan)
+                card = get_object_or_404(Card.objects.select_for_update(), id=card_id, usuario=request.user)
+                
+                # Actualizar tarjeta; un respuesta_id ya registrado (doble envío) falla al guardar
+                update_card(card, calificacion_base, tiempo_respuesta, respuesta_id=respuesta_id)
+                
+                # Obtener siguiente tarjeta dentro de la misma transacción
+                siguiente_card = get_next_card(request.user)
+        except IntegrityError:
+            # Sin clave no hay doble envío posible: el error es otro y no se oculta
+            if respuesta_id is None or not ReviewLog.objects.filter(respuesta_id=respuesta_id).exists():
+                raise
+            siguiente_card = get_next_card(request.user)
+            return JsonResponse({
+                'error': 'La respuesta ya fue registrada',
+                'siguiente_tarjeta': siguiente_card.id if siguiente_card else None,
+            }, status=409)
         
         response_data = {
             'success': True,
@@ -288,21 +501,188 @@ def procesar_respuesta(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+# Máximo de respuestas aceptadas en un mismo lote
+MAX_RESPUESTAS_LOTE = 500
+
+def leer_respuesta_lote(entrada):
+    """Valida una respuesta del lote; lanza ValueError o TypeError si no es válida"""
+    if not isinstance(entrada, dict):
+        raise ValueError('Respuesta inválida')
+    
+    card_id = int(entrada.get('card_id'))
+    calificacion_base = int(entrada.get('calificacion_base'))
+    tiempo_respuesta = float(entrada.get('tiempo_respuesta'))
+    if calificacion_base < 0 or calificacion_base > 5 or not tiempo_valido(tiempo_respuesta):
+        raise ValueError('Respuesta inválida')
+    
+    return {
+        'card_id': card_id,
+        'calificacion_base': calificacion_base,
+        'tiempo_respuesta': tiempo_respuesta,
+        'answered_at': leer_fecha_respuesta(entrada.get('answered_at')),
+        'respuesta_id': leer_respuesta_id(entrada.get('respuesta_id')),
+    }
+
+@login_required
+@require_POST
+def procesar_respuestas_lote(request):
+    """
+    Procesa en orden y en una sola transacción un lote de respuestas reenviadas.
+    Cada respuesta se valida por separado: las inválidas se devuelven como
+    'invalida' sin impedir que se apliquen las demás. 'resultados' va en el
+    mismo orden que 'respuestas'.
+    """
+    try:
+        data = json.loads(request.body)
+        entradas = data.get('respuestas') if isinstance(data, dict) else None
+        
+        # Validar datos
+        if not isinstance(entradas, list) or not entradas or len(entradas) > MAX_RESPUESTAS_LOTE:
+            return JsonResponse({'error': 'Datos inválidos'}, status=400)
+        validas = []
+        for entrada in entradas:
+            try:
+                validas.append(leer_respuesta_lote(entrada))
+            except (TypeError, ValueError):
+                validas.append(None)
+        
+        aplicadas = iter(update_cards_lote(request.user, [r for r in validas if r is not None]))
+        resultados = ['invalida' if r is None else next(aplicadas) for r in validas]
+        siguiente_card = get_next_card(request.user)
+        
+        return JsonResponse({
+            'success': True,
+            'aplicadas': resultados.count('aplicada'),
+            'resultados': [
+                {'card_id': respuesta['card_id'] if respuesta else None, 'resultado': resultado}
+                for respuesta, resultado in zip(validas, resultados)
+            ],
+            'siguiente_tarjeta': siguiente_card.id if siguiente_card else None,
+        })
+        
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 @login_required
 def resultado_repaso(request):
     """Vista de resultados después de completar el repaso"""
     return render(request, 'flashcards/resultado_repaso.html')
 
+# Máximo max-age del contador de pendientes: acota cuánto tarda una pestaña en
+# ver respuestas dadas desde otra (el navegador no se entera de la invalidación)
+MAX_AGE_PENDIENTES = 60
+
+
 def tarjetas_pendientes_api(request):
+    """
+    Número de tarjetas pendientes, cacheado por usuario. Responde con ETag y un
+    max-age que no pasa del vencimiento de la siguiente tarjeta: las pestañas
+    inactivas que sondean reciben la respuesta de la caché del navegador o un 304.
+    """
     if not request.user.is_authenticated:
         return JsonResponse({'pendientes': 0})
 
-    pendientes = Card.objects.filter(
-        usuario=request.user,
-        siguiente_repeticion__lte=timezone.now()
-    ).exclude(estado='nuevo').count()
+    ahora = timezone.now()
+    estado = estado_pendientes(request.user.id, ahora)
+    proxima = estado['proxima']
+    # Con el usuario: tras cambiar de cuenta en el navegador, el ETag de la anterior no vale
+    etag = f'"{request.user.id}-{estado["pendientes"]}-{int(proxima.timestamp()) if proxima else 0}"'
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({
+            'pendientes': estado['pendientes'],
+            'proxima': proxima.isoformat() if proxima else None,
+        })
+
+    max_age = MAX_AGE_PENDIENTES
+    if proxima is not None:
+        max_age = min(max_age, int((proxima - ahora).total_seconds()))
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=max(max_age, 0))
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+# Segundos sin cambios tras los que el stream envía un comentario para mantener la conexión
+KEEPALIVE_STREAM = 25
+# Duración máxima de un stream: EventSource se reconecta solo
+DURACION_STREAM = 600
+
+
+async def tarjetas_pendientes_stream(request):
+    """
+    Server-Sent Events con el número de tarjetas pendientes. Envía un evento al
+    abrir, cuando cambian las tarjetas del usuario (aviso tras el commit) y
+    cuando vence la siguiente tarjeta: entre medias la corrutina duerme.
+    Solo con ASGI; con WSGI cada stream ocuparía un worker, así que se responde
+    204 y la página vuelve a consultar tarjetas_pendientes_api periódicamente.
+    """
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    # La sesión se leyó en el hilo de la petición: sin cerrar, su conexión
+    # quedaría abierta mientras dure el stream
+    await sync_to_async(cerrar_conexion)()
+
+    response = StreamingHttpResponse(
+        eventos_pendientes(usuario.id), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Sin buffer en nginx
+    return response
+
+
+def cerrar_conexion():
+    """Cierra la conexión del hilo que la ejecuta (connection es por hilo)"""
+    connection.close()
+
+
+def calcular_estado_pendientes(usuario_id):
+    """estado_pendientes para el stream, cerrando después la conexión del hilo"""
+    try:
+        return estado_pendientes(usuario_id)
+    finally:
+        connection.close()
+
+
+async def leer_estado_pendientes(usuario_id):
+    """
+    Estado de pendientes para el stream. Si la caché sigue vigente se lee sin
+    tocar la base de datos; si no, se calcula en un hilo del pool y no en el
+    de la petición, para no dejar una conexión abierta por cada stream.
+    """
+    estado = await cache.aget(clave_pendientes(usuario_id))
+    if estado_vigente(estado, timezone.now()):
+        return estado
+    return await sync_to_async(calcular_estado_pendientes, thread_sensitive=False)(usuario_id)
+
+
+async def eventos_pendientes(usuario_id):
+    """Generador del stream: lee el estado (normalmente de la caché) solo al despertar"""
+    fin = time.monotonic() + DURACION_STREAM
+    ultimo = None
+    yield 'retry: 5000\n\n'
+    with EscuchaCambios(usuario_id) as escucha:
+        while time.monotonic() < fin:
+            estado = await leer_estado_pendientes(usuario_id)
+            if estado != ultimo:
+                ultimo = estado
+                datos = json.dumps({
+                    'pendientes': estado['pendientes'],
+                    'proxima': estado['proxima'].isoformat() if estado['proxima'] else None,
+                })
+                yield f'event: pendientes\ndata: {datos}\n\n'
+            else:
+                yield ': keepalive\n\n'
+
+            espera = min(KEEPALIVE_STREAM, fin - time.monotonic())
+            if estado['proxima'] is not None:
+                espera = min(espera, (estado['proxima'] - timezone.now()).total_seconds())
+            await escucha.esperar(max(espera, 0.05))
 
-    return JsonResponse({'pendientes': pendientes})
 
 @login_required
 @require_POST
@@ -329,6 +709,9 @@ def guardar_suscripcion(request):
             subscription.auth = auth
             subscription.save()
         
+        # El worker de notificaciones vuelve a programar al usuario
+        UserSettings.objects.filter(usuario=request.user).update(proxima_notificacion=None)
+        
         return JsonResponse({
             'success': True,
             'mensaje': '✅ Notificaciones activadas correctamente'